@@ -1,6 +1,7 @@
 import datetime
 import json
 import re
+from contextlib import contextmanager
 from unittest import skipIf
 from urllib.request import url2pathname
 
@@ -11,10 +12,13 @@ from rest_framework import test
 from base.constants import LANGUAGES, PERMISSIONS
 from django.contrib.staticfiles.handlers import StaticFilesHandler
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
+from django.db import connection
 from django.test import tag
 from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from langify.celery import app
+from misc.metrics import get_query_budget
 from panta.models import Vote
 from path.factories import UserFactory
 from path.models import Reputation
@@ -143,6 +147,22 @@ class APITests(test.APITestCase):
         # return 'http://testserver{}'.format(relative_url)
         return relative_url
 
+    @contextmanager
+    def assertQueryBudget(self, view, method='GET'):
+        """
+        Asserts that the queries don't exceed the budget of the view.
+        """
+        budget = get_query_budget(view, method)
+        self.assertIsNotNone(budget, f'No query budget for {method} {view}.')
+        with CaptureQueriesContext(connection) as context:
+            yield
+        self.assertLessEqual(
+            len(context),
+            budget,
+            f'{method} {view} exceeded its query budget:\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries),
+        )
+
     @classmethod
     def date(cls, date):
         if isinstance(date, datetime.datetime):
@@ -111,6 +111,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'misc.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -122,6 +123,28 @@ MIDDLEWARE = [
     'simple_history.middleware.HistoryRequestMiddleware',
 ]
 
+# Request metrics (misc.middleware.RequestMetricsMiddleware)
+
+# Requests taking longer are sampled with their SQL
+SLOW_REQUEST_SECONDS = 1
+
+# Number of sampled requests to keep
+REQUEST_SAMPLES = 100
+
+# Maximum number of queries per view name (optionally prefixed by the
+# method). Requests exceeding them are sampled, and tests can assert them with
+# base.tests.APITests.assertQueryBudget().
+QUERY_BUDGETS = {
+    'POST translatedwork-switched-segments': 12,
+    'PATCH translatedsegment-detail': 20,
+    'POST translatedsegment-restore': 25,
+    'POST translatedsegment-vote': 16,
+    'GET timeline-list': 8,
+}
+
+# Bearer token for scraping /metrics/ (disabled if empty)
+METRICS_TOKEN = config.get('secrets', 'METRICS_TOKEN', fallback='')
+
 ROOT_URLCONF = 'langify.urls'
 
 TEMPLATES = [
@@ -183,9 +206,12 @@ CACHALOT_UNCACHABLE_TABLES = (
     'django_session',
     'health_check_db_testmodel',
     'panta_historicaltranslatedsegment',
+    # Cached per work (see panta.caching)
+    'panta_importantheading',
     'panta_segmentdraft',
     'panta_translatedsegment',
     'panta_vote',
+    'panta_workstatistics',
 )
 
 REDIS_HOST = config.get('redis', 'HOST', fallback='redis')
@@ -195,17 +221,22 @@ REDIS_CACHE_PORT = config.get('redis', 'CACHE_PORT', fallback=6379)
 REDIS_PASSWORD = config.get('redis', 'PASSWORD', fallback='')
 
 if REDIS_CACHE_PORT:
+    # The cachalot alias is separated for the request metrics
     CACHES = {
-        'default': {
-            'BACKEND': 'django_redis.cache.RedisCache',
+        alias: {
+            'BACKEND': 'misc.cache.MetricsRedisCache',
             'LOCATION': f'redis://{REDIS_HOST}:{REDIS_CACHE_PORT}/1',
             'OPTIONS': {
                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
                 'PASSWORD': REDIS_PASSWORD,
+                'METRICS_NAME': alias,
             },
         }
+        for alias in ('default', 'cachalot')
     }
 
+    CACHALOT_CACHE = 'cachalot'
+
 
 # Celery
 
@@ -291,6 +322,16 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 SESSION_CACHE_ALIAS = 'default'
 
+# Adventist Passport (bearer tokens)
+
+OIDC_USERINFO_URL = 'https://www.adventistpassport.org/userinfo'
+
+# Seconds to cache the user info of a valid token (at most until it expires)
+OIDC_TOKEN_CACHE_TIMEOUT = 5 * 60
+
+# Seconds to cache that a token is invalid
+OIDC_INVALID_TOKEN_CACHE_TIMEOUT = 60
+
 
 # Allauth
 
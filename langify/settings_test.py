@@ -10,6 +10,9 @@ PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 # change all the time
 INSTALLED_APPS.remove('cachalot')
 
+# Request metrics are saved in Redis (see misc.tests.RequestMetricsTests)
+MIDDLEWARE.remove('misc.middleware.RequestMetricsMiddleware')
+
 CACHES = {
     'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
 }
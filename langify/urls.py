@@ -43,7 +43,11 @@ from misc.views import ConfirmEmailRedirect, home_view
 from panta.api import views as panta_views
 from path.api import views as path_views
 from style_guide.api import views as style_guide_views
-from white_estate.views import EqualSentencesView
+from white_estate.views import (
+    ConcordanceView,
+    EqualSentencesView,
+    WorkSimilarityView,
+)
 
 router = ExtendedDefaultRouter()
 # Private
@@ -157,6 +161,16 @@ api_urlpatterns = [
         name='work_filters',
     ),
     path('api/', include(router.urls)),
+    path(
+        'api/search/originals/',
+        panta_views.OriginalSegmentSearchView.as_view(),
+        name='original_segment_search',
+    ),
+    path(
+        'api/search/translations/',
+        panta_views.TranslatedSegmentSearchView.as_view(),
+        name='translated_segment_search',
+    ),
     path(
         'api/segments/<str:language>/<str:reference>/',
         panta_views.TranslatedSegmentByReferenceView.as_view(),
@@ -173,6 +187,11 @@ api_urlpatterns = [
         path_views.ExportPersonalDataView.as_view(),
         name='export_personal_data',
     ),
+    path(
+        'api/user/export-data/<str:token>/',
+        path_views.DownloadPersonalDataView.as_view(),
+        name='download_personal_data',
+    ),
     path(
         'api/users/<str:username>/',
         path_views.CommunityUserProfileView.as_view(),
@@ -211,6 +230,16 @@ api_urlpatterns = [
     path(
         'api/languages/', panta_views.LanguageView.as_view(), name='languages'
     ),
+    path(
+        'api/works/similarities/',
+        WorkSimilarityView.as_view(),
+        name='work_similarities',
+    ),
+    path(
+        'api/concordance/<str:language>/',
+        ConcordanceView.as_view(),
+        name='concordance',
+    ),
     path(
         'api/newsletters/languages/',
         LanguageNewsletterView.as_view(),
@@ -1,5 +1,10 @@
+import base64
+import hashlib
+import json
+import time
+
 import requests
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 from rest_framework.authentication import (
     BaseAuthentication,
     SessionAuthentication as DefaultSessionAuthentication,
@@ -7,6 +12,8 @@ from rest_framework.authentication import (
 )
 from rest_framework.exceptions import AuthenticationFailed
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
 from django.utils import dateformat, timezone
 from django.utils.encoding import smart_text
@@ -64,8 +71,33 @@ def update_oidc_user_from_claims(oidc_user, claims):
         oidc_user.user.save()
 
 
+def get_token_expiry(token):
+    """
+    Returns the expiry (timestamp) of a JWT or None for other tokens.
+
+    The signature isn't verified. Use the value to limit caching only.
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
 class BearerTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates with access tokens of Adventist Passport.
+
+    The user info of a token is cached (invalid tokens shortly) under the hash
+    of the token. Only one lookup per token is sent to the provider at a time,
+    concurrent requests wait for its result.
+    """
+
     www_authenticate_realm = 'api'
+    # Seconds to wait for a concurrent lookup of the same token
+    lock_timeout = 10
+    poll_interval = 0.05
 
     def authenticate(self, request):
         auth = get_authorization_header(request).split()
@@ -82,24 +114,82 @@ class BearerTokenAuthentication(BaseAuthentication):
             )
 
         bearer_token = smart_text(auth[1])
+        claims = self.get_claims(bearer_token)
+        if not claims:
+            raise AuthenticationFailed('Bearer token seems invalid or expired.')
+        return self.get_user(claims), bearer_token
+
+    def get_cache_key(self, token):
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        return f'bearer_token_{digest}'
+
+    def get_claims(self, token):
+        """
+        Returns the user info of the token ({} if invalid).
+        """
+        key = self.get_cache_key(token)
+        lock_key = f'{key}_lock'
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            claims = cache.get(key)
+            if claims is not None:
+                return claims
+            if cache.add(lock_key, True, self.lock_timeout):
+                break
+            if time.monotonic() > deadline:
+                # The other lookup takes too long, try it yourself
+                break
+            time.sleep(self.poll_interval)
 
         try:
-            userinfo_response = requests.get(
-                'https://www.adventistpassport.org/userinfo',
-                headers={'Authorization': 'Bearer {0}'.format(bearer_token)},
+            claims = self.fetch_claims(token)
+            if claims:
+                timeout = settings.OIDC_TOKEN_CACHE_TIMEOUT
+                expiry = get_token_expiry(token) or claims.get('exp')
+                if expiry:
+                    timeout = min(timeout, int(expiry - time.time()))
+            else:
+                timeout = settings.OIDC_INVALID_TOKEN_CACHE_TIMEOUT
+            if timeout > 0:
+                cache.set(key, claims, timeout)
+        finally:
+            cache.delete(lock_key)
+        return claims
+
+    def fetch_claims(self, token):
+        """
+        Requests the user info from the provider ({} if the token is invalid).
+        """
+        message = 'Bearer token could not be verified. Please try again later.'
+        try:
+            response = requests.get(
+                settings.OIDC_USERINFO_URL,
+                headers={'Authorization': 'Bearer {0}'.format(token)},
+                timeout=10,
             )
-            userinfo_response.raise_for_status()
+        except RequestException:
+            # Don't cache unreachable providers
+            raise AuthenticationFailed(message)
+        try:
+            response.raise_for_status()
         except HTTPError:
-            raise AuthenticationFailed('Bearer token seems invalid or expired.')
-        userinfo_response_data = userinfo_response.json()
-
+            if response.status_code < 500:
+                return {}
+            # Don't cache errors of the provider
+            raise AuthenticationFailed(message)
+        return response.json()
+
+    def get_user(self, claims):
+        """
+        Returns the user of the claims, creates or updates it if necessary.
+        """
         try:
             oidc_user = OIDCUser.objects.select_related('user').get(
-                sub=userinfo_response_data.get('sub')
+                sub=claims.get('sub')
             )
         except OIDCUser.DoesNotExist:
-            oidc_user = create_oidc_user_from_claims(userinfo_response_data)
+            oidc_user = create_oidc_user_from_claims(claims)
         else:
-            update_oidc_user_from_claims(oidc_user, userinfo_response_data)
-
-        return oidc_user.user, bearer_token
+            if oidc_user.userinfo != claims:
+                update_oidc_user_from_claims(oidc_user, claims)
+        return oidc_user.user
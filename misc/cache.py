@@ -0,0 +1,34 @@
+from django_redis.cache import RedisCache
+
+from .metrics import record_cache_lookup
+
+_missing = object()
+
+
+class MetricsRedisCache(RedisCache):
+    """
+    Redis cache recording hits and misses for the request metrics.
+
+    The name in the metrics is the `METRICS_NAME` option (default: default).
+    """
+
+    def __init__(self, server, params):
+        options = params.get('OPTIONS', {})
+        self.metrics_name = options.get('METRICS_NAME', 'default')
+        super().__init__(server, params)
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, _missing, version=version, client=client)
+        if value is _missing:
+            record_cache_lookup(self.metrics_name, 0, 1)
+            return default
+        record_cache_lookup(self.metrics_name, 1, 0)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, client=client)
+        record_cache_lookup(
+            self.metrics_name, len(values), len(keys) - len(values)
+        )
+        return values
@@ -0,0 +1,155 @@
+"""
+Per view metrics of requests (queries, SQL and Python time, cache lookups).
+
+The metrics of all processes are summed up in the persistent Redis database
+and exported in the Prometheus text format. Slow requests and requests
+exceeding their query budget are sampled with their SQL.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from django.conf import settings
+from django.utils import timezone
+from langify.celery import app
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'request_metrics'
+SAMPLES_KEY = 'request_samples'
+# Statements kept per request for samples
+MAX_STATEMENTS = 100
+
+_local = threading.local()
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = app.broker_connection().default_channel.client
+    return _redis
+
+
+class RequestMetrics:
+    """
+    Records the queries of a request (as execute wrapper) and cache lookups.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = []
+        # Hits and misses per cache alias
+        self.cache = defaultdict(lambda: [0, 0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            if len(self.statements) < MAX_STATEMENTS:
+                self.statements.append((sql, round(duration, 6)))
+
+    def __enter__(self):
+        _local.metrics = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.metrics = None
+
+
+def record_cache_lookup(alias, hits, misses):
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is not None:
+        metrics.cache[alias][0] += hits
+        metrics.cache[alias][1] += misses
+
+
+def get_query_budget(view, method):
+    budgets = settings.QUERY_BUDGETS
+    return budgets.get(f'{method} {view}', budgets.get(view))
+
+
+def save(view, method, metrics, duration):
+    """
+    Adds the metrics of a request to the totals and samples it if necessary.
+    """
+    label = f'{method} {view}'
+    budget = get_query_budget(view, method)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(METRICS_KEY, f'{label}|requests', 1)
+        pipe.hincrby(METRICS_KEY, f'{label}|queries', metrics.queries)
+        pipe.hincrbyfloat(METRICS_KEY, f'{label}|sql', metrics.sql_time)
+        pipe.hincrbyfloat(
+            METRICS_KEY, f'{label}|python', duration - metrics.sql_time
+        )
+        for alias, (hits, misses) in metrics.cache.items():
+            pipe.hincrby(METRICS_KEY, f'{label}|cache_hits|{alias}', hits)
+            pipe.hincrby(METRICS_KEY, f'{label}|cache_misses|{alias}', misses)
+        if duration >= settings.SLOW_REQUEST_SECONDS or (
+            budget is not None and metrics.queries > budget
+        ):
+            sample = {
+                'view': view,
+                'method': method,
+                'date': timezone.now().isoformat(),
+                'duration': round(duration, 6),
+                'queries': metrics.queries,
+                'budget': budget,
+                'statements': metrics.statements,
+            }
+            pipe.lpush(SAMPLES_KEY, json.dumps(sample))
+            pipe.ltrim(SAMPLES_KEY, 0, settings.REQUEST_SAMPLES - 1)
+        pipe.execute()
+    except RedisError:
+        logger.warning('Could not save request metrics.', exc_info=True)
+
+
+def get_samples():
+    """
+    Returns the sampled requests, the newest first.
+    """
+    return [json.loads(s) for s in get_redis().lrange(SAMPLES_KEY, 0, -1)]
+
+
+def reset():
+    get_redis().delete(METRICS_KEY, SAMPLES_KEY)
+
+
+def export() -> str:
+    """
+    Returns the metrics in the Prometheus text format.
+    """
+    metrics = {
+        'requests': ('counter', 'Number of requests'),
+        'queries': ('counter', 'Number of SQL queries'),
+        'sql': ('counter', 'Time spent on SQL queries in seconds'),
+        'python': ('counter', 'Time spent outside of SQL queries in seconds'),
+        'cache_hits': ('counter', 'Cache keys found'),
+        'cache_misses': ('counter', 'Cache keys not found'),
+    }
+    samples = defaultdict(list)
+    for field, value in sorted(get_redis().hgetall(METRICS_KEY).items()):
+        label, name, *alias = field.decode().split('|')
+        method, view = label.split(' ', 1)
+        labels = f'method="{method}",view="{view}"'
+        if alias:
+            labels += f',cache="{alias[0]}"'
+        samples[name].append(f'{{{labels}}} {float(value):g}')
+    lines = []
+    for name, (metric_type, description) in metrics.items():
+        suffix = '_seconds_total' if name in ('sql', 'python') else '_total'
+        full_name = f'langify_request_{name}{suffix}'
+        lines.append(f'# HELP {full_name} {description}.')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        lines.extend(f'{full_name}{sample}' for sample in samples[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,26 @@
+import time
+
+from django.db import connection
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Records queries, SQL and Python time and cache lookups per view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with metrics.RequestMetrics() as recorder:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        duration = time.perf_counter() - start
+        # Requests without view (e.g. 404)
+        match = request.resolver_match
+        if match:
+            metrics.save(match.view_name, request.method, recorder, duration)
+        return response
@@ -1,17 +1,35 @@
+import base64
+import json
 import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import skipIf
 from unittest.mock import MagicMock, patch
 
+import requests
+from rest_framework.exceptions import AuthenticationFailed
+
 from django.conf import settings
 from django.contrib.auth.models import Permission
-from django.test import SimpleTestCase, TestCase, tag  # noqa: F401
+from django.core.cache import cache
+from django.test import (  # noqa: F401
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    modify_settings,
+    override_settings,
+    tag,
+)
 from django.urls import reverse
 from django.utils import timezone
 from langify.routers import in_test_mode, set_test_mode
 from panta.factories import TranslatedSegmentFactory
 from path.factories import UserFactory
+from path.models import OIDCUser
 
-from . import factories, tasks
+from . import factories, metrics, tasks
+from .authentication import BearerTokenAuthentication
 from .models import DeveloperComment, Page
 from .utils import add_task_for_comments_deletion
 
@@ -299,3 +317,180 @@ class RouterTests(TestCase):
         self.assertTrue(Page.objects.using('e2e_tests').count(), 1)
         # Tidy up
         Page.objects.using('e2e_tests').delete()
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """
+    Answers user info requests with the claims stored in the server.
+    """
+
+    def do_GET(self):
+        token = self.headers['Authorization'].split()[1]
+        self.server.requests.append(token)
+        claims = self.server.claims.get(token)
+        if claims is None:
+            self.send_response(401)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(claims).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class BearerTokenAuthenticationTests(TestCase):
+    claims = {
+        'sub': '123',
+        'email': 'passport@example.com',
+        'preferred_username': 'passport',
+        'given_name': 'Given',
+        'family_name': 'Family',
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        cls.server.claims = {}
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.provider_settings = override_settings(
+            OIDC_USERINFO_URL='http://127.0.0.1:{}/userinfo'.format(
+                cls.server.server_port
+            )
+        )
+        cls.provider_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.provider_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.claims = {'valid': self.claims}
+        self.server.requests.clear()
+
+    def authenticate(self, token):
+        request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {token}'
+        )
+        return BearerTokenAuthentication().authenticate(request)
+
+    def test_valid_token(self):
+        user, token = self.authenticate('valid')
+        self.assertEqual(token, 'valid')
+        self.assertEqual(user.email, 'passport@example.com')
+        self.assertEqual(user.first_name, 'Given')
+        # Cached and nothing to write
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate('valid')[0], user)
+        self.assertEqual(self.server.requests, ['valid'])
+
+    def test_changed_claims_are_saved(self):
+        self.authenticate('valid')
+        claims = dict(self.claims, email='new@example.com')
+        self.server.claims['other'] = claims
+        self.authenticate('other')
+        self.assertEqual(OIDCUser.objects.get().userinfo, claims)
+
+    def test_invalid_token(self):
+        for i in range(2):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate('invalid')
+        self.assertEqual(self.server.requests, ['invalid'])
+
+    @patch(
+        'misc.authentication.requests.get',
+        side_effect=requests.exceptions.Timeout(),
+    )
+    def test_unreachable_provider(self, get):
+        for i in range(2):
+            with self.assertRaisesMessage(
+                AuthenticationFailed, 'Please try again later.'
+            ):
+                self.authenticate('valid')
+        # Not cached
+        self.assertEqual(get.call_count, 2)
+
+    def test_expired_token_is_not_cached(self):
+        payload = json.dumps({'exp': int(time.time()) - 1}).encode()
+        token = 'header.{}.signature'.format(
+            base64.urlsafe_b64encode(payload).decode().rstrip('=')
+        )
+        self.server.claims[token] = self.claims
+        self.authenticate(token)
+        self.authenticate(token)
+        self.assertEqual(self.server.requests, [token, token])
+
+    def test_concurrent_lookup_is_awaited(self):
+        auth = BearerTokenAuthentication()
+        key = auth.get_cache_key('valid')
+        cache.add(f'{key}_lock', True)
+        timer = threading.Timer(0.1, cache.set, (key, {'sub': 'other'}))
+        timer.start()
+        self.assertEqual(auth.get_claims('valid'), {'sub': 'other'})
+        self.assertEqual(self.server.requests, [])
+
+
+@modify_settings(
+    MIDDLEWARE={'prepend': 'misc.middleware.RequestMetricsMiddleware'}
+)
+@override_settings(
+    METRICS_TOKEN='secret',
+    SLOW_REQUEST_SECONDS=60,
+    QUERY_BUDGETS={'GET lastactivities-list': 0},
+)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_metrics(self):
+        self.client.force_login(UserFactory())
+        self.client.get(reverse('lastactivities-list'))
+        res = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(res.status_code, 200)
+        content = res.content.decode()
+        self.assertIn(
+            'langify_request_requests_total'
+            '{method="GET",view="lastactivities-list"} 1\n',
+            content,
+        )
+        self.assertRegex(
+            content,
+            r'langify_request_queries_total'
+            r'\{method="GET",view="lastactivities-list"\} [1-9]',
+        )
+        self.assertIn('# TYPE langify_request_sql_seconds_total', content)
+
+        # The request exceeded its query budget
+        samples = metrics.get_samples()
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0]['view'], 'lastactivities-list')
+        self.assertEqual(samples[0]['budget'], 0)
+        self.assertEqual(len(samples[0]['statements']), samples[0]['queries'])
+
+    def test_token_required(self):
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, 401)
+        with override_settings(METRICS_TOKEN=''):
+            res = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer '
+            )
+        self.assertEqual(res.status_code, 404)
+
+    def test_cache_lookups(self):
+        with metrics.RequestMetrics() as recorder:
+            metrics.record_cache_lookup('cachalot', 2, 1)
+            metrics.record_cache_lookup('cachalot', 0, 1)
+        # Not during a request
+        metrics.record_cache_lookup('default', 1, 0)
+        self.assertEqual(dict(recorder.cache), {'cachalot': [2, 2]})
@@ -6,6 +6,10 @@ from . import views
 
 urlpatterns = [
     path('page/stats/', views.StatisticsView.as_view(), name='statistics'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path(
+        'metrics/samples/', views.request_samples_view, name='request_samples'
+    ),
     path(
         'page/<slug:slug>/<int:index>/',
         views.PageContactView.as_view(),
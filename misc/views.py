@@ -9,15 +9,24 @@ from plotly import tools
 from rest_framework.exceptions import MethodNotAllowed
 
 from base.constants import SYSTEM_USERS
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.crypto import constant_time_compare
 from django.views.generic import RedirectView, TemplateView
 from django.views.generic.detail import DetailView
 from frontend_urls import EMAIL_CONFIRMATION
 from panta.models import HistoricalTranslatedSegment
 from path.models import User
 
+from . import metrics
 from .models import Page
 
 
@@ -28,6 +37,30 @@ def home_view(request, *args):
     raise MethodNotAllowed(request.method)
 
 
+def metrics_view(request):
+    """
+    Request metrics in the Prometheus text format.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not constant_time_compare(
+        authorization, f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.export(), content_type='text/plain; version=0.0.4'
+    )
+
+
+@staff_member_required
+def request_samples_view(request):
+    """
+    Slow requests and requests exceeding their query budget with their SQL.
+    """
+    return JsonResponse(metrics.get_samples(), safe=False)
+
+
 class ConfirmEmailRedirect(RedirectView):
     query_string = True
     url = '//localhost:8080/{}%(key)s'.format(
@@ -0,0 +1,161 @@
+"""
+Precomputed catalogue of translated works per language.
+
+A catalogue contains the representations of the works of a language (or of
+all languages), their orders for every ordering of the list endpoint, the
+Growing Together dummies and the values of the filters endpoint (also as
+gzipped JSON). It is cached until any work, tag or statistics row changes
+(see panta.caching). Afterwards, the first request (or update_db_cache)
+rebuilds it while other requests get the previous catalogue.
+"""
+import gzip
+
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+
+from django.db.models import Count, Max, Min, Q
+from panta import caching, models
+
+from . import serializers
+from .filters import TranslatedWorkFilter
+
+
+def serialize_works(pks) -> dict:
+    """
+    Returns the representations of the works by PK.
+    """
+    queryset = models.TranslatedWork.objects.for_response().filter(pk__in=pks)
+    # The URLs are relative
+    context = {'request': None}
+    data = serializers.TranslatedWorkSerializer(
+        queryset, many=True, context=context
+    ).data
+    return {work['id']: work for work in data}
+
+
+def get_works(works) -> list:
+    """
+    Returns the representations of the works from the work cache.
+    """
+    data = caching.get_works([w.pk for w in works], serialize_works)
+    return [data[w.pk] for w in works]
+
+
+def get_dummy_works(language) -> list:
+    """
+    Returns the Growing Together originals as translated works.
+    """
+    works = (
+        models.OriginalWork.objects.filter(tags__name='Growing Together Series')
+        .select_related('author')
+        .prefetch_related('tags')
+        .annotate(segments_count=Count('segments'))
+    )
+    for work in works:
+        work.statistics = {
+            'pretranslated_count': 0,
+            'translated_count': 0,
+            'reviewed_count': 0,
+            'authorized_count': 0,
+            'segments': work.segments_count,
+            'contributors': 0,
+        }
+        work.required_approvals = {'translator': 0, 'reviewer': 0, 'trustee': 0}
+        work.protected = True
+        work.language = language
+        work.original = work
+        work.combined_tags = work.tags.all()
+        work._table_of_contents = ()
+    return list(works)
+
+
+def get_filters(language) -> dict:
+    """
+    Returns the available filter values of the works (of the language).
+    """
+    works = models.TranslatedWork.objects.all()
+    tags = models.Tag.objects.all().order_by('name')
+    if language:
+        works = works.filter(language=language)
+        tags = tags.distinct().filter(
+            Q(translatedworks__language=language)
+            | Q(originalworks__translations__language=language)
+        )
+
+    types = models.TranslatedWork.types
+    count_lookups = {
+        t[0]: Count('pk', filter=Q(type=t[0]), distinct=True) for t in types
+    }
+    aggregations = works.aggregate(
+        min=Min('original__published'),
+        max=Max('original__published'),
+        **count_lookups,
+    )
+    type_dicts = [
+        {'slug': t[0], 'name': t[1], 'count': aggregations[t[0]]} for t in types
+    ]
+    serializer = serializers.TranslatedWorkFiltersSerializer(
+        {'types': type_dicts, 'tags': tags, 'years': aggregations}
+    )
+    return serializer.data
+
+
+def get_orders(language) -> dict:
+    """
+    Returns the PKs of the works per value of the ordering filter.
+
+    The empty value is the order by PK.
+    """
+    queryset = models.TranslatedWork.objects.all()
+    params = {'language': language} if language else {}
+    orders = {
+        '': list(
+            TranslatedWorkFilter(params, queryset=queryset)
+            .qs.order_by('pk')
+            .values_list('pk', flat=True)
+        )
+    }
+    for field, name in TranslatedWorkFilter.ordering_mapping:
+        for value in (name, f'-{name}'):
+            filterset = TranslatedWorkFilter(
+                dict(params, ordering=value), queryset=queryset
+            )
+            pks = filterset.qs.values_list('pk', flat=True)
+            # The priority annotation can duplicate works
+            orders[value] = list(dict.fromkeys(pks))
+    return orders
+
+
+def build_catalogue(language) -> dict:
+    orders = get_orders(language)
+    works = [models.TranslatedWork(pk=pk) for pk in orders['']]
+    dummies = []
+    if language:
+        dummies = serializers.TranslatedWorkSerializer(
+            get_dummy_works(language), many=True, context={'request': None}
+        ).data
+    filters = get_filters(language)
+    filters_json = CamelCaseJSONRenderer().render(filters)
+    return {
+        'works': dict(zip(orders[''], get_works(works))),
+        'orders': orders,
+        'dummies': dummies,
+        'filters': filters,
+        'filters_gzip': gzip.compress(filters_json),
+    }
+
+
+def get_catalogue(language) -> dict:
+    return caching.get_catalogue(language, build_catalogue)
+
+
+def update_catalogues() -> int:
+    """
+    Builds the catalogues of all languages with works if not cached.
+    """
+    languages = models.TranslatedWork.objects.values_list(
+        'language', flat=True
+    ).distinct()
+    languages = [None, *languages.order_by('language')]
+    for language in languages:
+        get_catalogue(language)
+    return len(languages)
@@ -1,13 +1,64 @@
+import re
 from datetime import timedelta
 
 from django_filters import rest_framework as filters
 from drf_yasg import openapi
 
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
-from django.db.models import Case, IntegerField, Q, When
+from base.constants import get_languages
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
 from django.forms import DateTimeField
 from django.utils import timezone
 from panta import models
+from panta.constants import SEARCH_CONFIGS
+from panta.queries import Headline, StripTags, WordSimilarity
+
+
+class FunctionSearchQuery(SearchQuery):
+    """
+    SearchQuery using another function than plainto_tsquery.
+    """
+
+    function = 'to_tsquery'
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        return sql.replace('plainto_tsquery', self.function, 1), params
+
+
+class PrefixSearchQuery(FunctionSearchQuery):
+    """
+    Matches the lexemes starting with every term of the value.
+
+    Lexemes aren't stemmed ('simple' configuration). The terms are parsed by
+    the database like the search vectors (e.g. words with combining marks)
+    and quoted as tsquery lexemes.
+    """
+
+    function = 'to_tsquery'
+    terms = (
+        r"(SELECT string_agg('''' || replace(replace(lexeme, '\', '\\'), "
+        r"'''', '''''') || ''':*', ' & ') "
+        r"FROM unnest(to_tsvector('simple', %s)))"
+    )
+
+    def __init__(self, value, **kwargs):
+        super().__init__(value, config='simple', **kwargs)
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        # The value is the last parameter
+        head, tail = sql.rsplit('%s', 1)
+        return f'{head}{self.terms}{tail}', params
+
+
+class PhraseSearchQuery(FunctionSearchQuery):
+    """
+    Matches the words of the value in the same order.
+    """
+
+    function = 'phraseto_tsquery'
 
 
 class MultipleTagChoiceFilter(filters.ModelMultipleChoiceFilter):
@@ -149,9 +200,9 @@ class TranslatedWorkFilter(filters.FilterSet):
             'search',
             openapi.IN_QUERY,
             description=(
-                'Searches the abbreviation and the title of the translation '
-                'and of the original. Results are sorted by rank. Terms are '
-                'treated as separate keywords.'
+                'Searches the abbreviation, the title of the translation and '
+                'of the original, the author and the tags. Results are sorted '
+                'by rank. Every term has to match the beginning of a word.'
             ),
             type=openapi.TYPE_STRING,
         ),
@@ -165,16 +216,16 @@ class TranslatedWorkFilter(filters.FilterSet):
             return queryset.exclude(**lookup)
 
     def get_search_filter(self, queryset, name, value):
-        vector = (
-            SearchVector('abbreviation', weight='A')
-            + SearchVector('title', weight='B')
-            + SearchVector('original__title', weight='C')
-        )
-        query = SearchQuery(value)
+        if not re.search(r'[^\W_]', value):
+            return queryset.none()
+        query = PrefixSearchQuery(value)
+        # Complete words match in other forms of the language, too
+        config = SEARCH_CONFIGS.get(self.data.get('language'), 'english')
+        query |= SearchQuery(value, config=config)
         queryset = (
-            queryset.annotate(rank=SearchRank(vector, query))
-            .filter(rank__gte=0.1)
-            .order_by('-rank')
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'pk')
         )
         return queryset
 
@@ -218,9 +269,9 @@ class DaysDurationFilter(filters.DateTimeFilter):
 
 
 class LastSegmentsFilterSet(filters.FilterSet):
-    days = DaysDurationFilter(
-        field_name='past__history_date', lookup_expr='gte'
-    )
+    # Annotated date of the historical record (a filter of past__history_date
+    # would join the records again)
+    days = DaysDurationFilter(field_name='activity_date', lookup_expr='gte')
 
 
 class LastVotesFilterSet(filters.FilterSet):
@@ -231,6 +282,18 @@ class LastCommentsFilterSet(filters.FilterSet):
     days = DaysDurationFilter(field_name='last_modified', lookup_expr='gte')
 
 
+before_param = openapi.Parameter(
+    'before',
+    openapi.IN_QUERY,
+    description=(
+        'Return only activities older than this date, e.g. the oldest one '
+        'of the previous page per type.'
+    ),
+    type=openapi.TYPE_STRING,
+    format=openapi.FORMAT_DATETIME,
+)
+
+
 days_param = openapi.Parameter(
     'days',
     openapi.IN_QUERY,
@@ -241,3 +304,112 @@ days_param = openapi.Parameter(
     type=openapi.TYPE_INTEGER,
     default=30,
 )
+
+
+class OriginalSegmentSearchFilter(filters.FilterSet):
+    """
+    Full-text or fuzzy search of the contents of segments.
+
+    The language determines the stemming of the words.
+    """
+
+    modes = (
+        ('words', 'All words (in any form)'),
+        ('phrase', 'The words in this order'),
+        ('fuzzy', 'A similar phrase (also with typos)'),
+    )
+    # Minimal trigram word similarity of fuzzy matches
+    similarity = 0.6
+    default_language = 'en'
+    headline_options = (
+        'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, '
+        'MaxFragments=2'
+    )
+
+    text = filters.CharFilter(
+        label='Text', method='get_text_filter', required=True
+    )
+    mode = filters.ChoiceFilter(choices=modes, method='get_mode_filter')
+    language = filters.ChoiceFilter(
+        field_name='work__language', choices=get_languages(lazy=True)
+    )
+    work = filters.NumberFilter(field_name='work_id')
+
+    def get_mode_filter(self, queryset, name, value):
+        # Used by the text filter
+        return queryset
+
+    def get_mode(self) -> str:
+        return self.form.cleaned_data.get('mode') or 'words'
+
+    def get_config(self) -> str:
+        language = self.form.cleaned_data.get('language')
+        return SEARCH_CONFIGS.get(language or self.default_language, 'simple')
+
+    def get_query(self, value) -> SearchQuery:
+        if self.get_mode() == 'fuzzy':
+            # For the highlights only
+            return SearchQuery(value, config='simple')
+        if self.get_mode() == 'phrase':
+            return PhraseSearchQuery(value, config=self.get_config())
+        return SearchQuery(value, config=self.get_config())
+
+    def get_text_filter(self, queryset, name, value):
+        if self.get_mode() == 'fuzzy':
+            # The threshold of the operator is a setting, local to the
+            # transaction of the view to not leak into other requests
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.word_similarity_threshold', "
+                    '%s, true)',
+                    [str(self.similarity)],
+                )
+            return queryset.annotate(text=StripTags('content')).filter(
+                text__trigram_word_similar=value
+            )
+        return queryset.filter(search_vector=self.get_query(value))
+
+    def add_snippets(self, segments):
+        """
+        Sets the highlighted snippets (and similarities) of the segments.
+        """
+        value = self.form.cleaned_data['text']
+        config = 'simple' if self.get_mode() == 'fuzzy' else self.get_config()
+        if self.get_mode() == 'fuzzy':
+            similarity = WordSimilarity(value, StripTags('content'))
+        else:
+            similarity = Value(None, output_field=FloatField())
+        rows = (
+            self._meta.model.objects.filter(pk__in=[s.pk for s in segments])
+            .annotate(
+                snippet=Headline(
+                    config,
+                    StripTags('content'),
+                    self.get_query(value),
+                    self.headline_options,
+                ),
+                similarity=similarity,
+            )
+            .values_list('pk', 'snippet', 'similarity')
+        )
+        rows = {pk: (snippet, similarity) for pk, snippet, similarity in rows}
+        for segment in segments:
+            segment.snippet, segment.similarity = rows[segment.pk]
+
+    class Meta:
+        model = models.OriginalSegment
+        fields = ('text', 'mode', 'language', 'work')
+
+
+class TranslatedSegmentSearchFilter(OriginalSegmentSearchFilter):
+    language = filters.ChoiceFilter(
+        field_name='work__language',
+        choices=get_languages(lazy=True),
+        required=True,
+    )
+    progress = filters.MultipleChoiceFilter(choices=models.PROGRESS_STATES)
+    chapter = filters.NumberFilter(field_name='chapter_id')
+
+    class Meta:
+        model = models.TranslatedSegment
+        fields = ('text', 'mode', 'language', 'work', 'progress', 'chapter')
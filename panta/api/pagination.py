@@ -2,8 +2,14 @@ from collections import OrderedDict
 
 from drf_yasg import openapi
 from rest_framework import pagination
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -42,6 +48,142 @@ class PositionPagination(pagination.LimitOffsetPagination):
         return Response(OrderedDict([('results', data)]))
 
 
+class SegmentPagination(PositionPagination):
+    """
+    Keyset pagination of segments by position with limited pages.
+
+    Requests with `after` get at most `max_size` segments following this
+    position and a link to the next page. Streams (see
+    get_streaming_response) contain at most `max_stream_size` segments.
+    Other requests get the range of positions of PositionPagination.
+    """
+
+    after_query_param = 'after'
+    after_query_description = _(
+        'Return the segments following this position (0 for the first ones) '
+        'with a link to the next page.'
+    )
+    size_query_param = 'size'
+    size_query_description = _(
+        'Number of segments to return per page (with `after`) or stream '
+        '(all up to a limit by default).'
+    )
+    default_size = 50
+    max_size = 200
+    # Segments per query and response of a stream
+    stream_batch_size = 100
+    max_stream_size = 2000
+
+    def get_after(self, request):
+        try:
+            after = int(request.query_params[self.after_query_param])
+        except KeyError:
+            return None
+        except ValueError:
+            after = -1
+        if after < 0:
+            raise ValidationError(
+                {
+                    self.after_query_param: [
+                        _('Ensure this value is greater than or equal to 0.')
+                    ]
+                }
+            )
+        return after
+
+    def get_size(self, request, default, maximum):
+        try:
+            size = int(request.query_params[self.size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return min(max(size, 1), maximum)
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = remove_query_param(url, self.limit_query_param)
+        return replace_query_param(url, self.after_query_param, self.next)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.after = self.get_after(request)
+        if self.after is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        size = self.get_size(request, self.default_size, self.max_size)
+        segments = list(
+            queryset.filter(position__gt=self.after).order_by('position')[
+                : size + 1
+            ]
+        )
+        self.next = (
+            segments[size - 1].position if len(segments) > size else None
+        )
+        return segments[:size]
+
+    def get_paginated_response(self, data):
+        if self.after is None:
+            return super().get_paginated_response(data)
+        next_link = None if self.next is None else self.get_next_link()
+        return Response(OrderedDict([('next', next_link), ('results', data)]))
+
+    def get_streaming_response(self, queryset, request, serialize, renderer):
+        """
+        Streams the serialized segments following `after` in batches.
+
+        Every line is a segment. If there are more segments than the
+        size of the stream, the last line is an object with the URL of the
+        next stream as `next`.
+        """
+        self.request = request
+        after = self.get_after(request) or 0
+        size = self.get_size(
+            request, self.max_stream_size, self.max_stream_size
+        )
+        queryset = queryset.order_by('position')
+
+        def lines():
+            position = after
+            remaining = size
+            while remaining:
+                batch_size = min(remaining, self.stream_batch_size)
+                batch = list(
+                    queryset.filter(position__gt=position)[: batch_size + 1]
+                )
+                for data in serialize(batch[:batch_size]):
+                    yield renderer.render(data)
+                if len(batch) <= batch_size:
+                    return
+                position = batch[batch_size - 1].position
+                remaining -= batch_size
+            self.next = position
+            yield renderer.render({'next': self.get_next_link()})
+
+        return StreamingHttpResponse(lines(), content_type=renderer.media_type)
+
+    def get_schema_fields(self, view):
+        return super().get_schema_fields(view) + [
+            coreapi.Field(
+                name=self.after_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(
+                    title='After',
+                    description=force_text(self.after_query_description),
+                ),
+            ),
+            coreapi.Field(
+                name=self.size_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(
+                    title='Size',
+                    description=force_text(self.size_query_description),
+                ),
+            ),
+        ]
+
+
 class CursorCountPagination(pagination.CursorPagination):
     """
     Cursor pagination which counts the queryset.
@@ -85,6 +227,77 @@ class HistoryPagination(CursorCountPagination):
         return query_list
 
 
+class TimelinePagination(pagination.CursorPagination):
+    """
+    Keyset pagination of TranslatedSegment.get_timeline_entries.
+    """
+
+    page_size = 50
+
+    def get_position(self, request):
+        """
+        Returns the (date, type, ID) of the last entry of the previous page.
+        """
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            date, entry_type, pk = cursor.position.split('|')
+            position = (parse_datetime(date), entry_type, int(pk))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def paginate_entries(self, entries):
+        """
+        Returns the (type, ID, date) entries of the page.
+
+        Expects one entry more than the page size if there is a next page.
+        """
+        self.has_next = len(entries) > self.page_size
+        entries = entries[: self.page_size]
+        if self.has_next:
+            entry_type, pk, date = entries[-1]
+            position = f'{date.isoformat()}|{entry_type}|{pk}'
+            self.next_link = self.encode_cursor(
+                pagination.Cursor(offset=0, reverse=False, position=position)
+            )
+        else:
+            self.next_link = None
+        return entries
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([('next', self.next_link), ('results', data)])
+        )
+
+
+class SegmentSearchPagination(pagination.CursorPagination):
+    """
+    Keyset pagination of search results by ID.
+    """
+
+    ordering = 'pk'
+    page_size = 50
+
+
+class ActivityPagination(pagination.CursorPagination):
+    """
+    Keyset pagination of the activities of a user by the queryset ordering.
+    """
+
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(queryset.query.order_by)
+
+
 class LimitPagination(pagination.LimitOffsetPagination):
     """
     Used only for limiting requests
@@ -0,0 +1,16 @@
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+
+
+class NDJSONRenderer(CamelCaseJSONRenderer):
+    """
+    Newline-delimited JSON: one camel-cased object per line.
+
+    Views stream lists line by line, other data (e.g. errors) is one line.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Compact JSON (without indentation) never contains line breaks
+        return super().render(data, None, renderer_context) + b'\n'
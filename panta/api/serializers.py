@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from datetime import datetime
+from operator import attrgetter
 
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
@@ -13,12 +15,14 @@ from base.serializers import (
     UserFieldSerializer,
 )
 from django.conf import settings
-from django.db.models import Q
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager, Q
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from panta import constants, models
 from panta.constants import BLANK, IN_REVIEW, TRUSTEE_DONE
 from panta.utils import sanitize_content
+from white_estate.models import TranslationMemoryEntry
 
 SEGMENT_CHANGED_ERROR_MESSAGE = _(
     'Somebody worked on this text in the meantime. '
@@ -369,6 +373,17 @@ class TranslatedSegmentSwitchedSerializer(serializers.Serializer):
     )
 
 
+class WorkExportSerializer(serializers.Serializer):
+    originals = serializers.BooleanField(
+        default=False, help_text='Adds the originals side by side.'
+    )
+    progress = serializers.ChoiceField(
+        choices=models.PROGRESS_STATES,
+        default=BLANK,
+        help_text='Only segments with this state or a higher one.',
+    )
+
+
 class AuthorSerializer(RelativeHyperlinkedSerializer):
     name = serializers.ReadOnlyField()
 
@@ -383,6 +398,37 @@ class LicenceSerializer(RelativeHyperlinkedSerializer):
         fields = '__all__'
 
 
+class OriginalSegmentSearchSerializer(serializers.ModelSerializer):
+    snippet = serializers.CharField(
+        read_only=True,
+        help_text='Content without HTML tags, matches in `<mark>` tags.',
+    )
+    similarity = serializers.FloatField(
+        read_only=True, help_text='Of fuzzy matches (0 - 1).'
+    )
+
+    class Meta:
+        model = models.OriginalSegment
+        fields = (
+            'id',
+            'work',
+            'position',
+            'reference',
+            'snippet',
+            'similarity',
+        )
+
+
+class TranslatedSegmentSearchSerializer(OriginalSegmentSearchSerializer):
+    class Meta:
+        model = models.TranslatedSegment
+        fields = OriginalSegmentSearchSerializer.Meta.fields + (
+            'original',
+            'chapter',
+            'progress',
+        )
+
+
 class ReferenceSerializer(RelativeHyperlinkedSerializer):
     class Meta:
         model = models.Reference
@@ -547,6 +593,139 @@ class BaseTranslationSegmentSerializer(serializers.ModelSerializer):
         fields = ('translator', 'info', 'content')
 
 
+class TranslationMemorySerializer(serializers.ModelSerializer):
+    reference = serializers.CharField(source='original.reference')
+    similarity = serializers.FloatField(
+        help_text='Trigram similarity of the original texts (0 - 1).'
+    )
+
+    class Meta:
+        model = TranslationMemoryEntry
+        fields = ('reference', 'source', 'content', 'similarity')
+
+
+class TranslatedSegmentListSerializer(serializers.ListSerializer):
+    """
+    Builds the representations of many segments as plain dicts.
+
+    The output equals the one of the child serializer without running the
+    field machinery per segment. Users and base translators are represented
+    once per response. Children with other fields fall back to DRF.
+    """
+
+    def to_representation(self, data):
+        builders = self.get_builders()
+        names = [field.field_name for field in self.child._readable_fields]
+        if not set(names) <= set(builders):
+            return super().to_representation(data)
+        if isinstance(data, Manager):
+            data = data.all()
+        # DRF skips the chapter of segments without one if it isn't nullable
+        chapter = self.child.fields.get('chapter')
+        skip_chapter = chapter is not None and not chapter.allow_null
+        self.users = {}
+        self.base_translators = {}
+        representations = []
+        for segment in data:
+            ret = OrderedDict((name, builders[name](segment)) for name in names)
+            if skip_chapter and segment.chapter_id is None:
+                del ret['chapter']
+            if ret.get('statistics') is None:
+                ret.pop('statistics', None)
+            representations.append(ret)
+        return representations
+
+    def get_builders(self) -> dict:
+        date = serializers.DateTimeField().to_representation
+        return {
+            'id': attrgetter('pk'),
+            'position': attrgetter('position'),
+            'page': attrgetter('page'),
+            'tag': attrgetter('tag'),
+            'classes': lambda s: list(s.classes),
+            'content': attrgetter('content'),
+            'reference': attrgetter('original.reference'),
+            'chapter': lambda s: s.chapter.number if s.chapter_id else None,
+            'chapter_position': attrgetter('chapter_position'),
+            'work_abbreviation': lambda s: s.original.reference.split()[0],
+            'work': attrgetter('work_id'),
+            'original': attrgetter('original.content'),
+            'ai': self.get_ai,
+            'progress': attrgetter('progress'),
+            'translator_can_edit': lambda s: s.can_edit('translator'),
+            'reviewer_can_edit': lambda s: s.can_edit('reviewer'),
+            'reviewer_can_vote': lambda s: s.can_vote('reviewer'),
+            'trustee_can_vote': lambda s: s.can_vote('trustee'),
+            'locked_by': lambda s: self.get_user(s, 'locked_by'),
+            'created': lambda s: date(s.created),
+            'last_modified': lambda s: date(s.last_modified),
+            'statistics': lambda s: self.get_statistics(s, date),
+        }
+
+    def get_user(self, obj, field):
+        """
+        Returns the representation of the user in the field of the object.
+        """
+        pk = getattr(obj, f'{field}_id')
+        if pk is None:
+            return None
+        # The annotated edits may differ between the fields
+        key = (field, pk)
+        if key not in self.users:
+            serializer = UserFieldSerializer(context=self.context)
+            user = getattr(obj, field)
+            self.users[key] = serializer.to_representation(user)
+        return self.users[key]
+
+    def get_ai(self, segment):
+        instances = tuple(
+            bt
+            for bt in segment.original.basetranslations.all()
+            if bt.translation.language == segment.work.language
+        )
+        if not instances:
+            return None
+        assert len(instances) == 1, 'All other AIs should be filtered out.'
+        base_translation = instances[0]
+        pk = base_translation.translation_id
+        if pk not in self.base_translators:
+            serializer = BaseTranslationSegmentSerializer()
+            self.base_translators[pk] = {
+                'translator': base_translation.translation.translator.name,
+                'info': serializer.get_info(base_translation),
+            }
+        return {
+            **self.base_translators[pk],
+            'content': base_translation.content,
+        }
+
+    def get_statistics(self, segment, date):
+        if not segment.has_statistics:
+            return None
+        try:
+            record = segment.last_historical_record
+        except ObjectDoesNotExist:
+            record = None
+        if record is None:
+            last_edited = last_edited_by = None
+        else:
+            last_edited = date(record.history_date)
+            last_edited_by = self.get_user(record, 'history_user')
+        return OrderedDict(
+            (
+                ('comments', segment.comments),
+                ('last_commented', date(segment.last_comment_date)),
+                ('records', segment.historical_records),
+                ('last_edited', last_edited),
+                ('last_edited_by', last_edited_by),
+                # Dicts of the vote and the one of the user
+                ('translators', OrderedDict(segment.translators)),
+                ('reviewers', OrderedDict(segment.reviewers)),
+                ('trustees', OrderedDict(segment.trustees)),
+            )
+        )
+
+
 class RetrieveTranslatedSegmentSerializer(serializers.ModelSerializer):
     original = serializers.CharField(source='original.content')
     reference = serializers.CharField(source='original.reference')
@@ -644,6 +823,7 @@ class RetrieveTranslatedSegmentSerializer(serializers.ModelSerializer):
             'last_modified',
             'statistics',
         )
+        list_serializer_class = TranslatedSegmentListSerializer
 
         read_only_fields = (
             'tag',
@@ -1,6 +1,5 @@
-from copy import deepcopy
-
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import (
     filters,
@@ -12,49 +11,60 @@ from rest_framework import (
 )
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
-from rest_framework.permissions import AllowAny, DjangoObjectPermissions
+from rest_framework.permissions import (
+    AllowAny,
+    DjangoObjectPermissions,
+    IsAuthenticated,
+)
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework_extensions.mixins import NestedViewSetMixin
+from sendfile import sendfile
 
-from base.constants import get_languages
+from base.constants import LANGUAGES_DICT, get_languages
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import (
-    Count,
-    Max,
-    Min,
-    OuterRef,
-    Prefetch,
-    Q,
-    Subquery,
-    prefetch_related_objects,
-)
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from django.views.decorators.cache import cache_control
-from panta import constants, models
+from panta import constants, models, tasks
+from panta.export import WorkExport
 from panta.management import Segments
+from panta.queries import get_edits_subquery
 from panta.utils import assign_progress
+from white_estate.utils import TranslationMemory
 
-from . import permissions, serializers
+from . import catalogue, permissions, serializers
 from .filters import (
     LastCommentsFilterSet,
     LastSegmentsFilterSet,
     LastVotesFilterSet,
+    OriginalSegmentSearchFilter,
+    TranslatedSegmentSearchFilter,
     TranslatedWorkFilter,
+    before_param,
     days_param,
 )
 from .pagination import (
+    ActivityPagination,
     CursorCountPagination,
     HistoryPagination,
     LimitPagination,
-    PositionPagination,
+    SegmentPagination,
+    SegmentSearchPagination,
+    TimelinePagination,
     limit_param,
 )
+from .renderers import NDJSONRenderer
 
 User = get_user_model()
 
@@ -133,6 +143,10 @@ class OriginalWorkViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     ordering = ('title',)
 
 
+# Query parameters of requests served from the work catalogue
+CATALOGUE_PARAMS = {'language', 'ordering', 'limit', 'offset'}
+
+
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(security=[]))
 class TranslatedWorkViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     """
@@ -204,54 +218,127 @@ class TranslatedWorkViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     filterset_class = TranslatedWorkFilter
     permission_classes = (permissions.WorkPermissions,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # The representations come from the work cache
+            queryset = (
+                queryset.select_related(None)
+                .prefetch_related(None)
+                .only('pk', 'abbreviation', 'trustee')
+            )
+        return queryset
+
+    def list_from_catalogue(self, request):
+        """
+        Responses from the catalogue for the common requests.
+
+        These are the requests filtered by language and sorted by one field
+        at most. Returns None for others.
+        """
+        params = request.query_params
+        if set(params) - CATALOGUE_PARAMS or any(
+            len(params.getlist(p)) > 1 for p in params
+        ):
+            return None
+        language = params.get('language')
+        if language is not None and language not in LANGUAGES_DICT:
+            return None
+        data = catalogue.get_catalogue(language)
+        pks = data['orders'].get(params.get('ordering', ''))
+        if pks is None:
+            return None
+        page = self.paginate_queryset([data['works'][pk] for pk in pks])
+        abbreviations = {work['abbreviation'] for work in page}
+        page.extend(
+            work
+            for work in data['dummies']
+            if work['abbreviation'] not in abbreviations
+        )
+        return self.get_paginated_response(page)
+
     @cache_control(max_age=600, public=True)
     @swagger_auto_schema(
         security=[], manual_parameters=TranslatedWorkFilter.openapi_parameters
     )
     def list(self, request, *args, **kwargs):
-        # Adds missing Growing Together works
-        # This method should be removed as soon as not needed anymore
-        queryset = self.filter_queryset(self.get_queryset())
+        response = self.list_from_catalogue(request)
+        if response is not None:
+            return response
 
+        queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
+        data = catalogue.get_works(page)
+        # Adds missing Growing Together works
+        # This should be removed as soon as not needed anymore
         # NOTE: This does not respect other filters
         language_filter = 'language' in request.query_params
         protected = request.query_params.get('protected', True)
         if protected in (0, '0', 'false', 'False'):
             protected = False
         if language_filter and protected:
-            works = (
-                models.OriginalWork.objects.filter(
-                    tags__name='Growing Together Series'
+            abbreviations = [o.abbreviation for o in page]
+            dummies = [
+                work
+                for work in catalogue.get_dummy_works(
+                    request.query_params['language']
                 )
-                .select_related('author')
-                .prefetch_related('tags')
-                .annotate(segments_count=Count('segments'))
+                if work.abbreviation not in abbreviations
+            ]
+            data.extend(self.get_serializer(dummies, many=True).data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        work = self.get_object()
+        return Response(catalogue.get_works([work])[0])
+
+    @swagger_auto_schema(
+        query_serializer=serializers.WorkExportSerializer,
+        responses={
+            200: '*The file*',
+            202: '*The export is being created, try again later*',
+            400: '*Validation errors*',
+        },
+    )
+    @action(
+        detail=True,
+        url_path='export/(?P<file_format>epub|html|json)',
+        permission_classes=(IsAuthenticated,),
+    )
+    def export(self, request, file_format, pk=None):
+        """
+        Export
+
+        Downloads the work as EPUB, HTML or JSON.
+
+        Exports are created in the background and kept until the work
+        changes. Responses with a *202 Accepted* while the export is created.
+        Private works can't be exported.
+        """
+        work = self.get_object()
+        if work.private:
+            raise NotFound()
+        serializer = serializers.WorkExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        export = WorkExport(work, file_format, **serializer.validated_data)
+        if export.exists():
+            return sendfile(
+                request,
+                export.path,
+                attachment=True,
+                attachment_filename=export.filename,
+                mimetype=export.media_type,
             )
-            abbreviations = [o.abbreviation for o in page]
-            for work in works:
-                if work.abbreviation not in abbreviations:
-                    work.statistics = {
-                        'pretranslated_count': 0,
-                        'translated_count': 0,
-                        'reviewed_count': 0,
-                        'authorized_count': 0,
-                        'segments': work.segments_count,
-                        'contributors': 0,
-                    }
-                    work.required_approvals = {
-                        'translator': 0,
-                        'reviewer': 0,
-                        'trustee': 0,
-                    }
-                    work.protected = True
-                    work.language = request.query_params['language']
-                    work.original = work
-                    work.combined_tags = work.tags.all()
-                    work._table_of_contents = ()
-                    page.append(work)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        # Only one job per export
+        if cache.add(f'work_export_{export.path}', True, 600):
+            tasks.export_translated_work.apply_async(
+                (work.pk, file_format), serializer.validated_data
+            )
+        return Response(
+            {'detail': _('The export is being created. Try again later.')},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Retry-After': '10'},
+        )
 
     @swagger_auto_schema(
         responses={
@@ -360,32 +447,17 @@ class TranslatedWorkFiltersView(generics.RetrieveAPIView):
         `language=tr`).
         """
         language = request.query_params.get('language')
-        works = models.TranslatedWork.objects.all()
-        tags = models.Tag.objects.all().order_by('name')
-        if language:
-            works = works.filter(language=language)
-            tags = tags.distinct().filter(
-                Q(translatedworks__language=language)
-                | Q(originalworks__translations__language=language)
+        if language and language not in LANGUAGES_DICT:
+            return Response(catalogue.get_filters(language))
+        data = catalogue.get_catalogue(language)
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(
+                data['filters_gzip'], content_type='application/json'
             )
-
-        types = models.TranslatedWork.types
-        count_lookups = {
-            t[0]: Count('pk', filter=Q(type=t[0]), distinct=True) for t in types
-        }
-        aggregations = works.aggregate(
-            min=Min('original__published'),
-            max=Max('original__published'),
-            **count_lookups,
-        )
-        type_dicts = [
-            {'slug': t[0], 'name': t[1], 'count': aggregations[t[0]]}
-            for t in types
-        ]
-        serializer = self.get_serializer(
-            {'types': type_dicts, 'tags': tags, 'years': aggregations}
-        )
-        return Response(serializer.data)
+            response['Content-Encoding'] = 'gzip'
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return Response(data['filters'])
 
 
 class OriginalSegmentViewSet(
@@ -405,7 +477,7 @@ class OriginalSegmentViewSet(
     lookup_value_regex = r'\d+'
     serializer_class = serializers.OriginalSegmentSerializer
     permission_classes = (permissions.OriginalSegmentPermissions,)
-    pagination_class = PositionPagination
+    pagination_class = SegmentPagination
 
 
 @method_decorator(
@@ -441,7 +513,11 @@ class TranslatedSegmentViewSet(
     list:
     List segments
 
-    Lists segments of a work.
+    Lists segments of a work. With `after`, the segments following this
+    position are returned in pages with a `next` link. With
+    `Accept: application/x-ndjson` (or `format=ndjson`), they are streamed
+    one per line; the last line contains the `next` link if the stream
+    didn't reach the end.
 
     retrieve:
     Retrieve segment
@@ -494,7 +570,8 @@ class TranslatedSegmentViewSet(
         'reference': ('exact', 'startswith'),
     }
     permission_classes = (permissions.TranslatedSegmentPermissions,)
-    pagination_class = PositionPagination
+    pagination_class = SegmentPagination
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer)
 
     def get_queryset(self, *, annotations=False):
         qs = super().get_queryset()
@@ -534,7 +611,7 @@ class TranslatedSegmentViewSet(
             )
             .select_related('history_user')
             .only('id', 'history_date', 'history_user')
-            .annotate(edits=Count('history_user__historicaltranslatedsegments'))
+            .annotate(edits=get_edits_subquery('history_user_id'))
         )
         last_records = {o.id: o for o in last_records}
 
@@ -551,15 +628,26 @@ class TranslatedSegmentViewSet(
             return serializers.UpdateTranslatedSegmentSerializer
         return super().get_serializer_class()
 
+    def serialize_segments(self, segments):
+        serializer = self.get_serializer(
+            self.add_last_historical_segment(segments), many=True
+        )
+        return serializer.data
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            return self.paginator.get_streaming_response(
+                queryset,
+                request,
+                self.serialize_segments,
+                request.accepted_renderer,
+            )
+
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(
-                self.add_last_historical_segment(page), many=True
-            )
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(self.serialize_segments(page))
 
         serializer = self.get_serializer(
             self.add_last_historical_segment(queryset), many=True
@@ -583,6 +671,33 @@ class TranslatedSegmentViewSet(
                 _('Operation failed. The segment is currently locked.')
             )
 
+    @swagger_auto_schema(
+        responses={200: serializers.TranslationMemorySerializer(many=True)}
+    )
+    @action(
+        detail=True,
+        serializer_class=serializers.TranslationMemorySerializer,
+        pagination_class=None,
+    )
+    def suggestions(self, request, parent_lookup_work=None, position=None):
+        """
+        Translation memory
+
+        Lists approved translations of segments with the same or a similar
+        original (best first). Complements `ai`.
+        """
+        segment = get_object_or_404(
+            models.TranslatedSegment.objects.select_related('work', 'original'),
+            work_id=parent_lookup_work,
+            position=position,
+        )
+        self.check_object_permissions(request, segment)
+        entries = TranslationMemory(segment.work.language).lookup(
+            segment.original
+        )
+        serializer = self.get_serializer(entries, many=True)
+        return Response(serializer.data)
+
     @swagger_auto_schema(
         responses={
             200: serializers.RestoreSerializer(is_response=True),
@@ -888,6 +1003,66 @@ class TranslatedSegmentByReferenceView(generics.ListAPIView):
         return queryset
 
 
+class SegmentSearchMixin:
+    """
+    Search of segments with highlighted snippets of the page.
+
+    Private works aren't searched.
+    """
+
+    filter_backends = (DjangoFilterBackend,)
+    pagination_class = SegmentSearchPagination
+
+    def get_queryset(self):
+        fields = self.serializer_class.Meta.fields
+        fields = [f for f in fields if f not in ('snippet', 'similarity')]
+        return self.queryset.filter(work__private=False).only(*fields)
+
+    def list(self, request, *args, **kwargs):
+        # The similarity threshold of fuzzy searches is set for a transaction
+        with transaction.atomic():
+            return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        backend = self.filter_backends[0]()
+        self.filterset = backend.get_filterset(self.request, queryset, self)
+        if not self.filterset.is_valid():
+            raise translate_validation(self.filterset.errors)
+        return self.filterset.qs
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        self.filterset.add_snippets(page)
+        return page
+
+
+class OriginalSegmentSearchView(SegmentSearchMixin, generics.ListAPIView):
+    """
+    Search original segments
+
+    Searches the contents of the original segments (without HTML tags).
+    """
+
+    queryset = models.OriginalSegment.objects.all()
+    serializer_class = serializers.OriginalSegmentSearchSerializer
+    permission_classes = (permissions.OriginalSegmentPermissions,)
+    filterset_class = OriginalSegmentSearchFilter
+
+
+class TranslatedSegmentSearchView(SegmentSearchMixin, generics.ListAPIView):
+    """
+    Search translated segments
+
+    Searches the contents of the translated segments of a language (without
+    HTML tags).
+    """
+
+    queryset = models.TranslatedSegment.objects.all()
+    serializer_class = serializers.TranslatedSegmentSearchSerializer
+    permission_classes = (permissions.TranslatedSegmentPermissions,)
+    filterset_class = TranslatedSegmentSearchFilter
+
+
 class TimelineView(
     NestedViewSetMixin, mixins.ListModelMixin, viewsets.GenericViewSet
 ):
@@ -895,18 +1070,20 @@ class TimelineView(
     Timeline
 
     Lists the objects of the timeline of a given segment chronologically.
+
+    A cursor paginated list beginning with the newest objects.
     """
 
     # TODO Check permissions!
 
     # todo: Maybe exclude objects which are older than 5 years or so
     # or which were made before the last two releases
-    pagination_class = None
+    pagination_class = TimelinePagination
 
     @swagger_auto_schema(
         responses={
             200: (
-                '*An array of '
+                '*An object with a `next` link and `results`, an array of '
                 '[historical records]'
                 '(#operation/translations_segments_history_list), '
                 '[votes](#operation/translations_segments_vote) and '
@@ -915,69 +1092,37 @@ class TimelineView(
         }
     )
     def list(self, request, *args, **kwargs):
+        history = models.TranslatedSegment.history.filter(id=OuterRef('pk'))
         segment = get_object_or_404(
-            models.TranslatedSegment, **self.get_parents_query_dict()
-        )
-        # Comments
-        objects = list(
-            models.SegmentComment.objects.filter(
-                Q(to_delete__isnull=True) | Q(user=request.user),
-                **self.get_parents_query_dict(),
-            )
-            .annotate(edits=Count('user__historicaltranslatedsegments'))
-            .select_related('vote', 'user')
-        )
-        for obj in objects:
-            obj.user.edits = obj.edits
-        # Historical records
-        history = segment.get_history_for_serializer()
-        # todo: When we add pagination to this endpoint, I could check that
-        # _most_recent is set to True on the first page only (but I think it's
-        # not mandatory, i.e. it doesn't cause an error in back- nor frontend).
-        # See panta.api.pagination.HistoryPagination.paginate_queryset
-        if history:
-            history[0]._most_recent = True
-            objects.extend(history)
-            # Prepare objects for another 'prefetch_related'
-            history = deepcopy(history)
-            for r in history:
-                r._prefetched_objects_cache = {}
-        # Votes
-        votes = list(
-            segment.votes.annotate(
-                edits=Count('user__historicaltranslatedsegments')
-            ).select_related('user')
+            models.TranslatedSegment.objects.annotate(
+                last_record_id=Subquery(
+                    history.order_by('-history_date', '-history_id').values(
+                        'history_id'
+                    )[:1]
+                )
+            ),
+            **self.get_parents_query_dict(),
         )
-        vote_pks = []
-        for vote in votes:
-            vote_pks.append(vote.pk)
-            vote.user.edits = vote.edits
-        objects.extend(votes)
-        # Prevent votes from getting duplicated in timeline
-        vote_qs = (
-            models.Vote.objects.exclude(pk__in=vote_pks)
-            .select_related('user')
-            .annotate(edits=Count('user__historicaltranslatedsegments'))
+        position = self.paginator.get_position(request)
+        entries = segment.get_timeline_entries(
+            before=position, limit=self.paginator.page_size + 1
         )
-        prefetch_related_objects(history, Prefetch('votes', queryset=vote_qs))
-        for record in history:
-            objects.extend(record.votes.all())
-        # Sort
-        objects.sort(key=lambda o: o.created, reverse=True)
+        entries = self.paginator.paginate_entries(entries)
         # Serialize
         serialized_objects = []
-        for obj in objects:
-            # Comments
-            if hasattr(obj, 'to_delete'):
+        objects = segment.get_timeline_objects(entries, request.user)
+        for entry_type, obj in objects:
+            if entry_type == 'comment':
                 serializer = serializers.SegmentCommentSerializer(obj)
-            # Historical records
-            elif hasattr(obj, 'history_user'):
+            elif entry_type == 'record':
+                # The newest historical record can be on any page
+                if obj.pk == segment.last_record_id:
+                    obj._most_recent = True
                 serializer = serializers.TranslatedSegmentHistorySerializer(obj)
-            # Votes
             else:
                 serializer = serializers.VoteSerializer(obj, is_response=True)
             serialized_objects.append(serializer.data)
-        return Response(serialized_objects)
+        return self.paginator.get_paginated_response(serialized_objects)
 
     def get_queryset(self):
         """
@@ -1217,11 +1362,14 @@ class LastActivitiesViewSet(viewsets.GenericViewSet):
 
     serializer_class = serializers.VotesCommentsSegmentsSerializer
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = ActivityPagination
 
     def get_segments(self, user):
-        queryset = models.TranslatedSegment.objects.filter(
-            past__history_user=user
-        ).select_related('chapter', 'work', 'original')
+        queryset = (
+            models.TranslatedSegment.objects.filter(past__history_user=user)
+            .annotate(activity_date=F('past__history_date'))
+            .select_related('chapter', 'work', 'original')
+        )
         return queryset
 
     def get_votes(self, user):
@@ -1242,43 +1390,51 @@ class LastActivitiesViewSet(viewsets.GenericViewSet):
         )
         return queryset
 
+    def get_before(self, request):
+        value = request.query_params.get('before')
+        if value is None:
+            return None
+        try:
+            date = parse_datetime(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValidationError({'before': [_('Enter a valid date/time.')]})
+        return date
+
     @swagger_auto_schema(
-        manual_parameters=[limit_param],
+        manual_parameters=[limit_param, before_param],
         responses={200: serializers.VotesCommentsSegmentsSerializer},
     )
     def list(self, request, *args, **kwargs):
         """
         Last activities
 
-        Lists last activities of the user.
+        Lists last activities of the user: the last edit and vote per chapter
+        and the last comments.
         """
         limit = LimitPagination().get_limit(request)
-
+        before = self.get_before(request)
+
+        # The last edit and vote per chapter are maintained by triggers
+        activities = Q(activities__user=request.user)
+        comments = self.get_comments(request.user)
+        if before:
+            activities &= Q(activities__date__lt=before)
+            comments = comments.filter(last_modified__lt=before)
         segments = (
-            self.get_segments(request.user)
-            .filter(
-                past__history_id__in=Subquery(
-                    models.TranslatedSegment.history.distinct('chapter_id')
-                    .filter(history_user=request.user)
-                    .order_by('chapter_id', '-history_date')
-                    .values('history_id')
-                )
+            models.TranslatedSegment.objects.filter(
+                activities, activities__type=models.LastActivity.RECORD
             )
-            .order_by('-past__history_date')[:limit]
+            .select_related('chapter', 'work', 'original')
+            .order_by('-activities__date')[:limit]
         )
         votes = (
             self.get_votes(request.user)
-            .filter(
-                id__in=Subquery(
-                    models.Vote.objects.distinct('segment__chapter_id')
-                    .filter(user=request.user)
-                    .order_by('segment__chapter_id', '-date')
-                    .values('pk')
-                )
-            )
-            .order_by('-date')[:limit]
+            .filter(activities, activities__type=models.LastActivity.VOTE)
+            .order_by('-activities__date')[:limit]
         )
-        comments = self.get_comments(request.user)[:limit]
+        comments = comments[:limit]
 
         serializer = self.get_serializer(
             {'votes': votes, 'comments': comments, 'segments': segments}
@@ -1304,10 +1460,11 @@ class LastActivitiesViewSet(viewsets.GenericViewSet):
 
         self.filterset_class = LastSegmentsFilterSet
         segments = self.filter_queryset(
-            self.get_segments(request.user).order_by('-past__history_date')
+            self.get_segments(request.user).order_by('-activity_date')
         )
-        serializer = self.get_serializer(segments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(segments)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         manual_parameters=[days_param],
@@ -1330,8 +1487,9 @@ class LastActivitiesViewSet(viewsets.GenericViewSet):
         votes = self.filter_queryset(
             self.get_votes(request.user).order_by('-date')
         )
-        serializer = serializers.VoteSegmentSerializer(votes, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(votes)
+        serializer = serializers.VoteSegmentSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         manual_parameters=[days_param],
@@ -1352,5 +1510,6 @@ class LastActivitiesViewSet(viewsets.GenericViewSet):
 
         self.filterset_class = LastCommentsFilterSet
         comments = self.filter_queryset(self.get_comments(request.user))
-        serializer = serializers.CommentSegmentSerializer(comments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(comments)
+        serializer = serializers.CommentSegmentSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,425 @@
+"""
+Reproducible benchmarks of the hot paths on a synthetic corpus.
+
+The works are created by the factories, the bulk of the data (historical
+records and votes) is loaded with COPY. The scenarios run through the test
+client (like the frontend) or call the commands and imports directly. The
+report contains the latency percentiles, queries and throughput per scenario
+as JSON to compare runs across commits.
+"""
+import datetime
+import json
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+from io import StringIO
+
+import factory
+
+from base.constants import PERMISSIONS
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import AutoField, Value
+from django.db.models.functions import Concat
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from misc.metrics import RequestMetrics
+from panta import factories, models
+from panta.constants import IN_TRANSLATION, LANGUAGE_RATIOS
+from path.factories import UserFactory
+from path.models import Reputation
+from white_estate.tasks import ThirdPartyImport, copy_rows
+
+# Default iterations per scenario
+SCENARIOS = {
+    'chapter_load': 50,
+    'patch_burst': 50,
+    'vote_storm': 50,
+    'unlock_sweep': 5,
+    'update_db_cache': 5,
+    'work_creation': 3,
+    'import': 3,
+}
+
+
+def to_copy_value(value):
+    """
+    Converts a database value to the text format of COPY.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        items = (
+            str(v).replace('\\', '\\\\').replace('"', '\\"') for v in value
+        )
+        return '{%s}' % ','.join(f'"{v}"' for v in items)
+    return str(value)
+
+
+def copy_objects(cursor, model, objects) -> int:
+    """
+    Inserts unsaved model instances with COPY (without their IDs).
+    """
+    fields = [
+        f for f in model._meta.concrete_fields if not isinstance(f, AutoField)
+    ]
+
+    def get_rows():
+        for obj in objects:
+            yield tuple(
+                to_copy_value(
+                    f.get_db_prep_save(f.pre_save(obj, True), connection)
+                )
+                for f in fields
+            )
+
+    return copy_rows(
+        cursor, model._meta.db_table, [f.column for f in fields], get_rows()
+    )
+
+
+def percentile(values, percent):
+    """
+    Returns the percentile of the values (nearest-rank method).
+    """
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def get_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=settings.BASE_DIR,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Corpus:
+    """
+    Synthetic translated works with history, votes and users.
+
+    Every work has its own original. Each translated segment gets `history`
+    historical records and `votes` translator votes of random users. The
+    same seed creates the same corpus.
+    """
+
+    def __init__(
+        self,
+        works=2,
+        segments=1000,
+        history=3,
+        votes=2,
+        users=20,
+        language='de',
+        seed=0,
+    ):
+        self.options = {
+            'works': works,
+            'segments': segments,
+            'history': history,
+            'votes': votes,
+            'users': users,
+            'language': language,
+            'seed': seed,
+        }
+        self.language = language
+        self.seed = seed
+        self.users = []
+        self.works = []
+        self.counts = {}
+
+    def create(self) -> dict:
+        """
+        Creates the corpus and returns the counts of the created objects.
+        """
+        options = self.options
+        # The factories use the random module and Faker
+        random.seed(self.seed)
+        factory.random.reseed_random(self.seed)
+        rand = random.Random(self.seed)
+
+        # Unusable passwords because hashing is slow
+        self.users = UserFactory.create_batch(options['users'], password=None)
+        for _ in range(options['works']):
+            original = factories.OriginalWorkFactory(
+                segments=options['segments']
+            )
+            self.works.append(
+                factories.TranslatedWorkFactory(
+                    original=original,
+                    language=self.language,
+                    trustee=original.trustee,
+                )
+            )
+
+        work_ids = [w.pk for w in self.works]
+        original_ids = [w.original_id for w in self.works]
+        segment_table = models.TranslatedSegment._meta.db_table
+        original_table = models.OriginalSegment._meta.db_table
+        history_model = models.TranslatedSegment.history.model
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            # Keys for imports
+            cursor.execute(
+                f"UPDATE {original_table} SET key = work_id || '.' || position "
+                'WHERE work_id = ANY(%s)',
+                [original_ids],
+            )
+            if options['history']:
+                cursor.execute(
+                    f'UPDATE {segment_table} segment '
+                    'SET content = original.content, progress = %s '
+                    f'FROM {original_table} original '
+                    'WHERE original.id = segment.original_id '
+                    'AND segment.work_id = ANY(%s)',
+                    [IN_TRANSLATION, work_ids],
+                )
+            segments = list(
+                models.TranslatedSegment.objects.filter(
+                    work_id__in=work_ids
+                ).only('pk', 'work_id', 'chapter_id', 'content')
+            )
+
+            def get_records():
+                for segment in segments:
+                    for relative_id in range(1, options['history'] + 1):
+                        age = options['history'] - relative_id
+                        yield segment.add_to_history(
+                            history_type='+' if relative_id == 1 else '~',
+                            history_date=now
+                            - datetime.timedelta(hours=age, minutes=1),
+                            history_user=rand.choice(self.users),
+                            relative_id=relative_id,
+                            save=False,
+                        )
+
+            def get_votes():
+                voters = min(options['votes'], len(self.users))
+                for segment in segments:
+                    for user in rand.sample(self.users, voters):
+                        yield models.Vote(
+                            segment_id=segment.pk,
+                            user=user,
+                            role='translator',
+                            value=1,
+                            date=now,
+                        )
+
+            records = copy_objects(cursor, history_model, get_records())
+            votes = 0
+            if options['history']:
+                votes = copy_objects(cursor, models.Vote, get_votes())
+
+        models.ImportantHeading.update()
+        models.WorkStatistics.update()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.counts = {
+            'users': len(self.users),
+            'works': len(self.works),
+            'segments': len(segments),
+            'historical_records': records,
+            'votes': votes,
+        }
+        return self.counts
+
+
+class Benchmark:
+    """
+    Runs the scenarios on a corpus and reports the measurements.
+
+    Every iteration is timed and its queries, SQL time and cache lookups are
+    recorded like for the request metrics. Preparations of an iteration (e.g.
+    locking segments for the unlock sweep) are not measured.
+    """
+
+    def __init__(self, corpus, iterations=None):
+        self.corpus = corpus
+        self.iterations = iterations
+        self.user = UserFactory(password=None)
+        Reputation.objects.update_or_create(
+            user=self.user,
+            language=corpus.language,
+            defaults={'score': PERMISSIONS['review_translation']},
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        work = corpus.works[0]
+        self.segments = list(work.segments.order_by('position'))
+        # Segments of another work (if any) so that votes aren't blocked by
+        # the locks of the PATCH burst
+        self.vote_segments = list(
+            corpus.works[-1].segments.order_by('-position')
+        )
+        self.languages = [
+            language
+            for language in sorted(LANGUAGE_RATIOS)
+            if language != corpus.language
+        ]
+
+    def measure(self, function, iterations, prepare=None) -> dict:
+        durations, queries, sql_times = [], [], []
+        cache_hits = cache_misses = 0
+        start = time.perf_counter()
+        for i in range(iterations):
+            args = prepare(i) if prepare else ()
+            began = time.perf_counter()
+            with RequestMetrics() as recorder:
+                with connection.execute_wrapper(recorder):
+                    function(i, *args)
+            durations.append(time.perf_counter() - began)
+            queries.append(recorder.queries)
+            sql_times.append(recorder.sql_time)
+            for hits, misses in recorder.cache.values():
+                cache_hits += hits
+                cache_misses += misses
+        total = time.perf_counter() - start
+        return {
+            'iterations': iterations,
+            'p50': round(percentile(durations, 50), 6),
+            'p95': round(percentile(durations, 95), 6),
+            'mean': round(sum(durations) / iterations, 6),
+            'max': round(max(durations), 6),
+            'queries': round(sum(queries) / iterations, 2),
+            'max_queries': max(queries),
+            'sql': round(sum(sql_times) / iterations, 6),
+            'cache_hits': cache_hits,
+            'cache_misses': cache_misses,
+            # Iterations per second including their preparation
+            'throughput': round(iterations / total, 3),
+        }
+
+    def check(self, response, status=200):
+        if response.status_code != status:
+            raise RuntimeError(
+                f'{response.request["REQUEST_METHOD"]} '
+                f'{response.request["PATH_INFO"]} returned '
+                f'{response.status_code}: {response.content[:500]}'
+            )
+
+    def get_segment_url(self, segment, suffix=''):
+        url = reverse(
+            'translatedsegment-detail', args=(segment.work_id, segment.position)
+        )
+        return url + suffix
+
+    # Scenarios
+
+    def chapter_load(self, i):
+        segment = self.segments[i * 100 % len(self.segments)]
+        url = reverse('translatedsegment-list', args=(segment.work_id,))
+        response = self.client.get(
+            url, {'position': segment.position, 'limit': 100}
+        )
+        self.check(response)
+
+    def patch_burst(self, i):
+        segment = self.segments[i % len(self.segments)]
+        segment.refresh_from_db(fields=['last_modified'])
+        data = {
+            'content': f'{segment.content} {i}',
+            'lastModified': segment.last_modified.isoformat(),
+        }
+        response = self.client.patch(
+            self.get_segment_url(segment),
+            json.dumps(data),
+            content_type='application/json',
+        )
+        self.check(response)
+
+    def vote_storm(self, i):
+        segment = self.vote_segments[i % len(self.vote_segments)]
+        segment.refresh_from_db(fields=['last_modified'])
+        data = {
+            'role': 'translator',
+            'setTo': 1,
+            'segment': segment.pk,
+            'timestamp': segment.last_modified.isoformat(),
+        }
+        response = self.client.post(
+            self.get_segment_url(segment, 'vote/'), data
+        )
+        self.check(response, status=201)
+
+    def prepare_unlock_sweep(self, i):
+        # Segments left locked by translators
+        segments = models.TranslatedSegment.objects.filter(
+            work_id__in=[w.pk for w in self.corpus.works], content__gt=''
+        ).order_by('work_id', 'position')
+        pks = segments.values_list('pk', flat=True)[i * 100 : (i + 1) * 100]
+        models.TranslatedSegment.objects.filter(pk__in=list(pks)).update(
+            locked_by=self.user,
+            content=Concat('content', Value(' ')),
+            last_modified=timezone.now() - datetime.timedelta(minutes=5),
+        )
+        return ()
+
+    def unlock_sweep(self, i):
+        call_command('unlock_segments', stdout=StringIO())
+
+    def prepare_update_db_cache(self, i):
+        models.TranslatedSegment.objects.filter(
+            pk__in=[s.pk for s in self.segments[:100]]
+        ).update(last_modified=timezone.now())
+        return ()
+
+    def update_db_cache(self, i):
+        call_command('update_db_cache', stdout=StringIO())
+
+    def work_creation(self, i):
+        factories.TranslatedWorkFactory(
+            original=self.corpus.works[0].original,
+            language=self.languages[i % len(self.languages)],
+        )
+
+    def prepare_import(self, i):
+        # A new empty translation to import into
+        language = self.languages[-1 - i % len(self.languages)]
+        original = self.corpus.works[0].original
+        factories.TranslatedWorkFactory(original=original, language=language)
+        rows = [
+            {'para_id': key, 'publisher': 'benchmark', 'translation': content}
+            for key, content in original.segments.values_list('key', 'content')
+        ]
+        f = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        with f:
+            json.dump(rows, f)
+        return (language, f.name)
+
+    def import_(self, i, language, path):
+        try:
+            ThirdPartyImport(language, {'benchmark': 1}).run(path)
+        finally:
+            os.remove(path)
+
+    def run(self, scenarios=None) -> dict:
+        """
+        Runs the scenarios (all by default) and returns the report.
+        """
+        results = {}
+        for name in scenarios or SCENARIOS:
+            function = getattr(self, 'import_' if name == 'import' else name)
+            prepare = getattr(self, f'prepare_{name}', None)
+            iterations = self.iterations or SCENARIOS[name]
+            results[name] = self.measure(function, iterations, prepare)
+        return {
+            'commit': get_commit(),
+            'date': timezone.now().isoformat(),
+            'corpus': dict(self.corpus.options, **self.corpus.counts),
+            'scenarios': results,
+        }
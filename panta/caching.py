@@ -0,0 +1,139 @@
+"""
+Versioned cache of the representations of translated works.
+
+Every work has a version in the cache which is part of the keys of its
+cached data (detail, table of contents and statistics). Invalidating a work
+sets a new version and the entries of the old one expire. Thus, only works
+whose data changed lose their cache (unlike the table-wide invalidation of
+cachalot).
+
+The catalogues of works per language (see panta.api.catalogue) have one
+version for all languages which changes with any work. One process rebuilds
+an outdated catalogue while the others serve the previous one.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+TIMEOUT = 60 * 60 * 24
+CATALOGUE_VERSION_KEY = 'work_catalogue_version'
+# Of a rebuild of a catalogue
+LOCK_TIMEOUT = 60 * 10
+
+
+def get_version_key(work_id) -> str:
+    return f'translated_work_version_{work_id}'
+
+
+def get_data_key(work_id, version) -> str:
+    return f'translated_work_{work_id}_{version}'
+
+
+def new_version() -> int:
+    # Based on the time so that a version never repeats even if evicted
+    return int(time.time() * 1_000_000)
+
+
+def get_versions(work_ids) -> dict:
+    """
+    Returns the versions of the works and creates missing ones.
+    """
+    keys = {get_version_key(pk): pk for pk in work_ids}
+    versions = {keys[k]: v for k, v in cache.get_many(keys).items()}
+    missing = {k: new_version() for k, pk in keys.items() if pk not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update((keys[k], v) for k, v in missing.items())
+    return versions
+
+
+def set_versions(work_ids):
+    cache.set_many(
+        {get_version_key(pk): new_version() for pk in work_ids}, None
+    )
+
+
+def invalidate_works(work_ids):
+    """
+    Invalidates the cached data of the works and the catalogues.
+
+    The versions change again after the commit of the current transaction
+    because requests meanwhile would cache the data before the commit.
+    """
+    work_ids = list(work_ids)
+    if work_ids:
+        set_versions(work_ids)
+        transaction.on_commit(lambda: set_versions(work_ids))
+        invalidate_catalogues()
+
+
+def get_works(work_ids, build) -> dict:
+    """
+    Returns the cached data of the works by PK.
+
+    `build` returns the data by PK for a list of PKs which aren't cached.
+    The versions are read before building so that data of a work changing
+    meanwhile is stored with the outdated version.
+    """
+    versions = get_versions(work_ids)
+    keys = {pk: get_data_key(pk, v) for pk, v in versions.items()}
+    cached = cache.get_many(keys.values())
+    data = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in work_ids if pk not in data]
+    if missing:
+        built = build(missing)
+        cache.set_many({keys[pk]: d for pk, d in built.items()}, TIMEOUT)
+        data.update(built)
+    return data
+
+
+def set_catalogue_version():
+    cache.set(CATALOGUE_VERSION_KEY, new_version(), None)
+
+
+def invalidate_catalogues():
+    """
+    Invalidates the catalogues now and after the commit (see above).
+    """
+    set_catalogue_version()
+    transaction.on_commit(set_catalogue_version)
+
+
+def get_catalogue_key(language, version) -> str:
+    return f'work_catalogue_{language or "all"}_{version}'
+
+
+def get_catalogue(language, build):
+    """
+    Returns the cached catalogue of the language (None for all languages).
+
+    `build` creates the catalogue if it isn't cached. Only the process
+    acquiring the lock builds it, the others return the latest catalogue
+    (if there is one).
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        version = new_version()
+        cache.set(CATALOGUE_VERSION_KEY, version, None)
+    key = get_catalogue_key(language, version)
+    catalogue = cache.get(key)
+    if catalogue is not None:
+        return catalogue
+    latest_key = f'work_catalogue_{language or "all"}_latest'
+    lock_key = f'{key}_lock'
+    locked = cache.add(lock_key, True, LOCK_TIMEOUT)
+    if not locked:
+        latest = cache.get(latest_key)
+        if latest is not None:
+            catalogue = cache.get(get_catalogue_key(language, latest))
+            if catalogue is not None:
+                return catalogue
+    # Without previous catalogue, every process has to build it
+    try:
+        catalogue = build(language)
+        cache.set_many({key: catalogue, latest_key: version}, TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return catalogue
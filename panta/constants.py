@@ -264,3 +264,22 @@ LANGUAGE_RATIOS = {
     'zh': 0.25,
     'vi': 1.0,
 }
+
+# Text search configurations of PostgreSQL per language (others use 'simple')
+SEARCH_CONFIGS = {
+    'da': 'danish',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'fi': 'finnish',
+    'fr': 'french',
+    'hu': 'hungarian',
+    'it': 'italian',
+    'nb': 'norwegian',
+    'nl': 'dutch',
+    'pt': 'portuguese',
+    'ro': 'romanian',
+    'ru': 'russian',
+    'sv': 'swedish',
+    'tr': 'turkish',
+}
@@ -0,0 +1,373 @@
+"""
+Exports of translated works as EPUB, HTML and JSON.
+
+The segments are read with a server-side cursor in the order of their
+positions and written to the file while reading so that the memory doesn't
+grow with the size of the work. The files are stored below SENDFILE_ROOT and
+their names contain the options and the last activity of the work. Thus, an
+export is rendered once per state of the work and a changed work gets a new
+file (files of older states are removed).
+"""
+import glob
+import json
+import os
+import tempfile
+import zipfile
+
+import lxml.etree
+import lxml.html
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.functional import cached_property
+from django.utils import timezone
+from django.utils.html import escape
+from panta import models
+from panta.constants import BLANK, IMPORTANT_HEADINGS
+
+FORMATS = ('epub', 'html', 'json')
+MEDIA_TYPES = {
+    'epub': 'application/epub+zip',
+    'html': 'text/html',
+    'json': 'application/json',
+}
+DIRECTORY = 'exports'
+VOID_TAGS = ('hr',)
+
+HTML_HEAD = '''<!DOCTYPE html>
+<html lang="{language}">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+.row {{ display: flex; }}
+.row > * {{ flex: 1; margin-left: 1em; margin-right: 1em; }}
+.indent {{ text-indent: 1.5em; }}
+</style>
+</head>
+<body>
+'''
+
+HTML_FOOT = '''</body>
+</html>
+'''
+
+EPUB_CONTAINER = '''<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0"
+    xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="EPUB/content.opf"
+        media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+'''
+
+EPUB_PACKAGE = '''<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0"
+    unique-identifier="id" xml:lang="{language}">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="id">{identifier}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:creator>{author}</dc:creator>
+    <dc:language>{language}</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml"
+        properties="nav"/>
+    <item id="text" href="text.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine>
+    <itemref idref="text"/>
+  </spine>
+</package>
+'''
+
+XHTML_HEAD = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:epub="http://www.idpf.org/2007/ops"
+    lang="{language}" xml:lang="{language}">
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+</head>
+<body>
+'''
+
+
+def get_attributes(classes, language=None) -> str:
+    attributes = ''
+    if classes:
+        attributes += ' class="{}"'.format(escape(' '.join(classes)))
+    if language:
+        attributes += f' lang="{language}"'
+    return attributes
+
+
+def render_html(tag, classes, content, language=None) -> str:
+    """
+    Returns the segment as HTML element.
+    """
+    attributes = get_attributes(classes, language)
+    if tag in VOID_TAGS:
+        return f'<{tag}{attributes}>'
+    return f'<{tag}{attributes}>{content}</{tag}>'
+
+
+def get_element(tag, classes, content, language=None):
+    """
+    Returns the segment as lxml element (the content is HTML).
+    """
+    if tag in VOID_TAGS:
+        content = ''
+    element = lxml.html.fragment_fromstring(content, create_parent=tag)
+    if classes:
+        element.set('class', ' '.join(classes))
+    if language:
+        element.set('lang', language)
+    return element
+
+
+def render_xhtml(element) -> str:
+    return lxml.etree.tostring(element, encoding='unicode')
+
+
+class WorkExport:
+    """
+    Export of a translated work in a format.
+
+    `originals` adds the original segments side by side (not for JSON where
+    they are a field) and `progress` excludes segments with a lower state.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, work, format='html', originals=False, progress=BLANK):
+        if format not in FORMATS:
+            raise ValueError(f'Unknown format "{format}".')
+        self.work = work
+        self.format = format
+        self.originals = originals
+        self.progress = progress
+
+    def get_last_activity(self):
+        """
+        Returns the date of the latest change of the work or its segments.
+
+        Events cover records, votes and comments, the modification dates
+        changes without records (e.g. of the progress or the originals).
+        """
+        work = self.work
+        dates = [
+            work.last_modified,
+            models.SegmentEvent.objects.filter(work_id=work.pk).aggregate(
+                date=Max('date')
+            )['date'],
+            work.segments.aggregate(date=Max('last_modified'))['date'],
+        ]
+        if self.originals:
+            dates.append(
+                models.OriginalSegment.objects.filter(
+                    work_id=work.original_id
+                ).aggregate(date=Max('last_modified'))['date']
+            )
+        return max(d for d in dates if d is not None)
+
+    @cached_property
+    def last_activity(self):
+        return self.get_last_activity()
+
+    @property
+    def prefix(self) -> str:
+        return f'{self.format}-{int(self.originals)}-{self.progress}'
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(
+            settings.SENDFILE_ROOT, DIRECTORY, str(self.work.pk)
+        )
+
+    @property
+    def path(self) -> str:
+        version = int(self.last_activity.timestamp() * 1_000_000)
+        filename = f'{self.prefix}-{version}.{self.format}'
+        return os.path.join(self.directory, filename)
+
+    @property
+    def filename(self) -> str:
+        """
+        Name of the file for downloads.
+        """
+        work = self.work
+        return f'{work.abbreviation}_{work.language}.{self.format}'
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get_segments(self):
+        fields = ['position', 'tag', 'classes', 'content', 'reference']
+        if self.originals:
+            fields.append('original__content')
+        queryset = (
+            models.TranslatedSegment.objects.filter(
+                work_id=self.work.pk, progress__gte=self.progress
+            )
+            .order_by('position')
+            .values_list(*fields, named=True)
+        )
+        return queryset.iterator(chunk_size=self.chunk_size)
+
+    def create(self) -> str:
+        """
+        Renders the export if it doesn't exist and returns its path.
+        """
+        path = self.path
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        # Another process mustn't serve an incomplete file
+        descriptor, temporary = tempfile.mkstemp(
+            suffix='.tmp', dir=self.directory
+        )
+        try:
+            if self.format == 'epub':
+                with open(descriptor, 'wb') as f:
+                    self.write_epub(f)
+            else:
+                with open(descriptor, 'w', encoding='utf-8') as f:
+                    getattr(self, f'write_{self.format}')(f)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.remove_outdated()
+        return path
+
+    def remove_outdated(self):
+        pattern = os.path.join(self.directory, f'{self.prefix}-*')
+        for path in glob.iglob(pattern):
+            if path != self.path and not path.endswith('.tmp'):
+                os.remove(path)
+
+    def get_metadata(self) -> dict:
+        work = self.work
+        original = work.original
+        return {
+            'title': work.title,
+            'subtitle': work.subtitle,
+            'abbreviation': work.abbreviation,
+            'language': work.language,
+            'author': original.author.name,
+            'original': {
+                'title': original.title,
+                'language': original.language,
+            },
+            'lastActivity': self.last_activity.isoformat(),
+        }
+
+    def write_json(self, f):
+        metadata = json.dumps(self.get_metadata(), ensure_ascii=False)
+        f.write(f'{{"work":{metadata},"segments":[\n')
+        separator = ''
+        for segment in self.get_segments():
+            data = {
+                'position': segment.position,
+                'tag': segment.tag,
+                'classes': segment.classes,
+                'content': segment.content,
+                'reference': segment.reference,
+            }
+            if self.originals:
+                data['original'] = segment.original__content
+            f.write(separator + json.dumps(data, ensure_ascii=False))
+            separator = ',\n'
+        f.write('\n]}\n')
+
+    def write_html(self, f):
+        work = self.work
+        f.write(
+            HTML_HEAD.format(language=work.language, title=escape(work.title))
+        )
+        for s in self.get_segments():
+            element = render_html(s.tag, s.classes, s.content)
+            if self.originals:
+                original = render_html(
+                    s.tag,
+                    s.classes,
+                    s.original__content or '',
+                    work.original.language,
+                )
+                element = f'<div class="row">{original}{element}</div>'
+            f.write(element + '\n')
+        f.write(HTML_FOOT)
+
+    def write_epub(self, f):
+        work = self.work
+        language = work.language
+        title = escape(work.title)
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+            # The media type must be the first and uncompressed file
+            archive.writestr(
+                'mimetype',
+                MEDIA_TYPES['epub'],
+                compress_type=zipfile.ZIP_STORED,
+            )
+            archive.writestr('META-INF/container.xml', EPUB_CONTAINER)
+            headings = []
+            with archive.open('EPUB/text.xhtml', 'w') as text:
+                head = XHTML_HEAD.format(language=language, title=title)
+                text.write(head.encode())
+                for s in self.get_segments():
+                    element = get_element(s.tag, s.classes, s.content)
+                    if s.tag in IMPORTANT_HEADINGS:
+                        element.set('id', f'p{s.position}')
+                        heading = escape(element.text_content())
+                        headings.append((s.position, heading))
+                    element = render_xhtml(element)
+                    if self.originals:
+                        original = get_element(
+                            s.tag,
+                            s.classes,
+                            s.original__content or '',
+                            work.original.language,
+                        )
+                        element = (
+                            f'<div class="row">{render_xhtml(original)}'
+                            f'{element}</div>'
+                        )
+                    text.write(f'{element}\n'.encode())
+                text.write(HTML_FOOT.encode())
+            archive.writestr('EPUB/nav.xhtml', self.get_navigation(headings))
+            modified = self.last_activity.astimezone(timezone.utc).strftime(
+                '%Y-%m-%dT%H:%M:%SZ'
+            )
+            package = EPUB_PACKAGE.format(
+                identifier=f'{work.abbreviation}-{language}-{work.pk}',
+                title=title,
+                author=escape(work.original.author.name),
+                language=language,
+                modified=modified,
+            )
+            archive.writestr('EPUB/content.opf', package)
+
+    def get_navigation(self, headings) -> str:
+        work = self.work
+        items = ''.join(
+            f'<li><a href="text.xhtml#p{position}">{heading}</a></li>\n'
+            for position, heading in headings
+        )
+        if not items:
+            items = f'<li><a href="text.xhtml">{escape(work.title)}</a></li>\n'
+        head = XHTML_HEAD.format(
+            language=work.language, title=escape(work.title)
+        )
+        return (
+            f'{head}<nav epub:type="toc">\n<ol>\n{items}</ol>\n</nav>\n'
+            f'{HTML_FOOT}'
+        )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from panta.partitions import HistoryPartitioning
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves monthly partitions of the history of translated segments to '
+        'gzipped files or restores them from these.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', help='Archive the months ending before this date'
+        )
+        parser.add_argument(
+            '--directory', default='.', help='Directory for the archive files'
+        )
+        parser.add_argument(
+            '--restore',
+            nargs='+',
+            metavar='PATH',
+            help='Attach archived partitions again',
+        )
+
+    def handle(self, *args, **options):
+        partitioning = HistoryPartitioning()
+        if options['restore']:
+            for path in options['restore']:
+                try:
+                    partitioning.restore(path)
+                except ValueError as e:
+                    raise CommandError(e)
+                self.stdout.write(f'Restored {path}.')
+            return
+
+        before = parse_date(options['before'] or '')
+        if before is None:
+            raise CommandError('Please provide a date (YYYY-MM-DD).')
+        paths = partitioning.archive(before, options['directory'])
+        for path in paths:
+            self.stdout.write(f'Archived {path}.')
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {len(paths)} partition(s).')
+        )
@@ -0,0 +1,104 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from panta.benchmarks import SCENARIOS, Benchmark, Corpus
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates a synthetic corpus in a test database, runs the benchmark '
+        'scenarios on it and reports the measurements as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--works', type=int, default=2)
+        parser.add_argument(
+            '--segments', type=int, default=1000, help='Segments per work'
+        )
+        parser.add_argument(
+            '--history',
+            type=int,
+            default=3,
+            help='Historical records per segment',
+        )
+        parser.add_argument(
+            '--votes', type=int, default=2, help='Votes per segment'
+        )
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--language', default='de')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=tuple(SCENARIOS),
+            dest='scenarios',
+            help='Run only this scenario (can be repeated)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            help='Iterations of every scenario instead of the defaults',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help="Don't destroy the test database afterwards",
+        )
+        parser.add_argument(
+            '--output', help='Write the report to this file (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+        # The metrics of the benchmark requests shouldn't be saved and the
+        # cached data must not mix with the one of the configured database
+        benchmark_settings = override_settings(
+            MIDDLEWARE=[
+                m
+                for m in settings.MIDDLEWARE
+                if m != 'misc.middleware.RequestMetricsMiddleware'
+            ],
+            CACHES={
+                alias: dict(config, KEY_PREFIX='benchmark')
+                for alias, config in settings.CACHES.items()
+            },
+        )
+        setup_test_environment()
+        benchmark_settings.enable()
+        old_config = setup_databases(
+            verbosity, interactive=False, keepdb=options['keepdb']
+        )
+        try:
+            corpus = Corpus(
+                works=options['works'],
+                segments=options['segments'],
+                history=options['history'],
+                votes=options['votes'],
+                users=options['users'],
+                language=options['language'],
+                seed=options['seed'],
+            )
+            counts = corpus.create()
+            if verbosity > 1:
+                self.stderr.write(f'Created the corpus: {counts}')
+            benchmark = Benchmark(corpus, options['iterations'])
+            report = benchmark.run(options['scenarios'])
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=options['keepdb'])
+            benchmark_settings.disable()
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from panta.partitions import HistoryPartitioning
+
+
+class Command(BaseCommand):
+    help = (
+        'Partitions the historical records of translated segments by month '
+        'without downtime. The old table is kept as backup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Number of records copied per transaction',
+        )
+        parser.add_argument(
+            '--start',
+            type=int,
+            default=0,
+            help='Resume copying after this history ID',
+        )
+        parser.add_argument(
+            '--no-swap',
+            action='store_true',
+            help="Copy the records but don't replace the table yet",
+        )
+        parser.add_argument(
+            '--drop-backup',
+            action='store_true',
+            help='Drop the old table after checking the partitioned one',
+        )
+
+    def handle(self, *args, **options):
+        partitioning = HistoryPartitioning()
+        if options['drop_backup']:
+            if not partitioning.exists(partitioning.backup):
+                raise CommandError('There is no backup table.')
+            partitioning.drop_backup()
+            self.stdout.write(self.style.SUCCESS('Dropped the backup table.'))
+            return
+        if partitioning.is_partitioned():
+            raise CommandError('The history is partitioned already.')
+
+        if not partitioning.exists(partitioning.staging):
+            partitioning.prepare()
+        for last in partitioning.copy(options['batch_size'], options['start']):
+            self.stdout.write(f'Copied records until ID {last}.')
+        if options['no_swap']:
+            return
+        partitioning.swap()
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Partitioned the history. Drop the backup table with '
+                '--drop-backup after checking it.'
+            )
+        )
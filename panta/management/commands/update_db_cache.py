@@ -1,15 +1,21 @@
 from django.core.management.base import BaseCommand
+from panta.api.catalogue import update_catalogues
 from panta.models import ImportantHeading, WorkStatistics
 
 
 class Command(BaseCommand):
     help = (
         'Updates the headings table used for the table of contents and the '
-        'statistics table of translated works.'
+        'statistics table of translated works. Rebuilds the work catalogues '
+        'afterwards.'
     )
 
     def handle(self, *args, **kwargs):
         headings = ImportantHeading.update()
         statistics = WorkStatistics.update()
-        msg = f'Updated {headings} headings and {statistics} statistics.'
+        catalogues = update_catalogues()
+        msg = (
+            f'Updated {headings} headings and {statistics} statistics. '
+            f'{catalogues} catalogues are up to date.'
+        )
         self.stdout.write(self.style.SUCCESS(msg))
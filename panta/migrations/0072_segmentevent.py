@@ -0,0 +1,243 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Django doesn't support partitioned tables. The primary key of a partitioned
+# table has to include the partition key.
+CREATE_TABLE = '''
+CREATE TABLE panta_segmentevent (
+    id bigserial NOT NULL,
+    type varchar(7) NOT NULL,
+    object_id integer NOT NULL CHECK (object_id >= 0),
+    date timestamp with time zone NOT NULL,
+    segment_id integer NOT NULL,
+    work_id integer NOT NULL,
+    user_id integer NULL,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+CREATE TABLE panta_segmentevent_default
+PARTITION OF panta_segmentevent DEFAULT;
+
+CREATE INDEX panta_segmentevent_segment
+ON panta_segmentevent (segment_id, date);
+CREATE INDEX panta_segmentevent_work ON panta_segmentevent (work_id, date);
+CREATE INDEX panta_segmentevent_user ON panta_segmentevent (user_id, date);
+
+CREATE FUNCTION panta_segmentevent_create_partitions(start date, months int)
+RETURNS int AS $$
+DECLARE
+    month date := date_trunc('month', start);
+    table_name text;
+    created int := 0;
+BEGIN
+    FOR i IN 1..months LOOP
+        table_name := 'panta_segmentevent_' || to_char(month, 'YYYY_MM');
+        IF to_regclass(table_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF panta_segmentevent '
+                'FOR VALUES FROM (%L) TO (%L)',
+                table_name, month, month + interval '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+DROP_TABLE = '''
+DROP FUNCTION panta_segmentevent_create_partitions(date, int);
+DROP TABLE panta_segmentevent;
+'''
+
+CREATE_TRIGGERS = '''
+CREATE FUNCTION panta_segmentevent_append() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'panta_historicaltranslatedsegment' THEN
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        VALUES (
+            'record', NEW.history_id, NEW.history_date, NEW.id, NEW.work_id,
+            NEW.history_user_id
+        );
+    ELSIF TG_TABLE_NAME = 'panta_vote' THEN
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        SELECT 'vote', NEW.id, NEW.date, s.id, s.work_id, NEW.user_id
+        FROM panta_translatedsegment s
+        WHERE s.id = NEW.segment_id;
+    ELSIF TG_TABLE_NAME = 'panta_segmentcomment' THEN
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        SELECT 'comment', NEW.id, NEW.created, s.id, s.work_id, NEW.user_id
+        FROM panta_translatedsegment s
+        WHERE s.work_id = NEW.work_id AND s.position = NEW.position;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER panta_segmentevent_record
+AFTER INSERT ON panta_historicaltranslatedsegment
+FOR EACH ROW EXECUTE PROCEDURE panta_segmentevent_append();
+
+CREATE TRIGGER panta_segmentevent_vote
+AFTER INSERT ON panta_vote
+FOR EACH ROW EXECUTE PROCEDURE panta_segmentevent_append();
+
+CREATE TRIGGER panta_segmentevent_comment
+AFTER INSERT ON panta_segmentcomment
+FOR EACH ROW EXECUTE PROCEDURE panta_segmentevent_append();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER panta_segmentevent_comment ON panta_segmentcomment;
+DROP TRIGGER panta_segmentevent_vote ON panta_vote;
+DROP TRIGGER panta_segmentevent_record ON panta_historicaltranslatedsegment;
+DROP FUNCTION panta_segmentevent_append();
+'''
+
+# Partitions from the month of the oldest object until three months ahead
+FILL_TABLE = '''
+SELECT panta_segmentevent_create_partitions(
+    start,
+    ((date_part('year', now()) - date_part('year', start)) * 12
+     + date_part('month', now()) - date_part('month', start))::int + 4
+)
+FROM (
+    SELECT coalesce(least(
+        (SELECT min(history_date) FROM panta_historicaltranslatedsegment),
+        (SELECT min(date) FROM panta_vote),
+        (SELECT min(created) FROM panta_segmentcomment)
+    ), now())::date AS start
+) oldest;
+
+INSERT INTO panta_segmentevent
+    (type, object_id, date, segment_id, work_id, user_id)
+SELECT 'record', history_id, history_date, id, work_id, history_user_id
+FROM panta_historicaltranslatedsegment
+UNION ALL
+-- Votes which were moved to historical records have no segment anymore
+SELECT 'vote', v.id, v.date, s.id, s.work_id, v.user_id
+FROM panta_vote v
+JOIN panta_translatedsegment s ON s.id = coalesce(v.segment_id, (
+    SELECT h.id
+    FROM panta_vote_historical_segments vh
+    JOIN panta_historicaltranslatedsegment h
+        ON h.history_id = vh.historicaltranslatedsegment_id
+    WHERE vh.vote_id = v.id
+    LIMIT 1
+))
+UNION ALL
+SELECT 'comment', c.id, c.created, s.id, s.work_id, c.user_id
+FROM panta_segmentcomment c
+JOIN panta_translatedsegment s
+    ON s.work_id = c.work_id AND s.position = c.position;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('panta', '0071_auto_20200130_1847'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(CREATE_TABLE, DROP_TABLE)],
+            state_operations=[
+                migrations.CreateModel(
+                    name='SegmentEvent',
+                    fields=[
+                        (
+                            'id',
+                            models.BigAutoField(
+                                primary_key=True, serialize=False
+                            ),
+                        ),
+                        (
+                            'type',
+                            models.CharField(
+                                choices=[
+                                    ('record', 'historical record'),
+                                    ('vote', 'vote'),
+                                    ('comment', 'comment'),
+                                ],
+                                max_length=7,
+                                verbose_name='type',
+                            ),
+                        ),
+                        (
+                            'object_id',
+                            models.PositiveIntegerField(
+                                verbose_name='object ID'
+                            ),
+                        ),
+                        ('date', models.DateTimeField(verbose_name='date')),
+                        (
+                            'segment',
+                            models.ForeignKey(
+                                db_constraint=False,
+                                on_delete=django.db.models.deletion.DO_NOTHING,
+                                related_name='events',
+                                to='panta.TranslatedSegment',
+                                verbose_name='segment',
+                            ),
+                        ),
+                        (
+                            'user',
+                            models.ForeignKey(
+                                db_constraint=False,
+                                null=True,
+                                on_delete=django.db.models.deletion.DO_NOTHING,
+                                related_name='+',
+                                to=settings.AUTH_USER_MODEL,
+                                verbose_name='user',
+                            ),
+                        ),
+                        (
+                            'work',
+                            models.ForeignKey(
+                                db_constraint=False,
+                                on_delete=django.db.models.deletion.DO_NOTHING,
+                                related_name='+',
+                                to='panta.TranslatedWork',
+                                verbose_name='work',
+                            ),
+                        ),
+                    ],
+                    options={
+                        'verbose_name': 'segment event',
+                        'verbose_name_plural': 'segment events',
+                    },
+                ),
+                migrations.AddIndex(
+                    model_name='segmentevent',
+                    index=models.Index(
+                        fields=['segment', 'date'],
+                        name='panta_segmentevent_segment',
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name='segmentevent',
+                    index=models.Index(
+                        fields=['work', 'date'], name='panta_segmentevent_work'
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name='segmentevent',
+                    index=models.Index(
+                        fields=['user', 'date'], name='panta_segmentevent_user'
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(FILL_TABLE, migrations.RunSQL.noop),
+    ]
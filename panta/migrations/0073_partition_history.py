@@ -0,0 +1,79 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:52
+
+from django.db import migrations, models
+
+from panta.partitions import HistoryPartitioning
+
+# Triggers of partitioned tables fire with the name of the partition
+REPLACE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION panta_segmentevent_append() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'panta_vote' THEN
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        SELECT 'vote', NEW.id, NEW.date, s.id, s.work_id, NEW.user_id
+        FROM panta_translatedsegment s
+        WHERE s.id = NEW.segment_id;
+    ELSIF TG_TABLE_NAME = 'panta_segmentcomment' THEN
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        SELECT 'comment', NEW.id, NEW.created, s.id, s.work_id, NEW.user_id
+        FROM panta_translatedsegment s
+        WHERE s.work_id = NEW.work_id AND s.position = NEW.position;
+    ELSE
+        INSERT INTO panta_segmentevent
+            (type, object_id, date, segment_id, work_id, user_id)
+        VALUES (
+            'record', NEW.history_id, NEW.history_date, NEW.id, NEW.work_id,
+            NEW.history_user_id
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+def partition_empty_history(apps, schema_editor):
+    """
+    Partitions the history table if it is empty (e.g. a new database).
+
+    Otherwise, the management command partition_history copies the records
+    without downtime.
+    """
+    partitioning = HistoryPartitioning()
+    if partitioning.is_partitioned():
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {partitioning.table})')
+        if cursor.fetchone()[0]:
+            return
+    partitioning.prepare()
+    partitioning.swap()
+    partitioning.drop_backup()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panta', '0072_segmentevent'),
+        ('path', '0030_contribution_statement_triggers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='historical_segments',
+            field=models.ManyToManyField(
+                blank=True,
+                db_constraint=False,
+                related_name='votes',
+                to='panta.HistoricalTranslatedSegment',
+                verbose_name='historical segment',
+            ),
+        ),
+        migrations.RunSQL(REPLACE_FUNCTION, migrations.RunSQL.noop),
+        migrations.RunPython(
+            partition_empty_history, migrations.RunPython.noop
+        ),
+    ]
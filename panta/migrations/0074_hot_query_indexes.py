@@ -0,0 +1,69 @@
+# Generated by Django 2.1.15 on 2026-10-19 12:14
+
+from django.db import migrations, models
+
+# Django 2.1 supports neither partial indexes nor indexes of the historical
+# model. The index of (id, history_date) is created with the partitions.
+CREATE_INDEXES = '''
+CREATE INDEX panta_segmentcomment_open
+ON panta_segmentcomment (work_id, position, created DESC)
+WHERE to_delete IS NULL;
+
+CREATE INDEX panta_history_user_chapter
+ON panta_historicaltranslatedsegment
+(history_user_id, chapter_id, history_date DESC);
+'''
+
+DROP_INDEXES = '''
+DROP INDEX panta_history_user_chapter;
+DROP INDEX panta_segmentcomment_open;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('panta', '0073_partition_history')]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='translatedsegment',
+            index=models.Index(
+                fields=['chapter', '-last_modified'],
+                name='panta_segment_chapter_date',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='translatedsegment',
+            index=models.Index(
+                fields=['chapter', 'progress'],
+                name='panta_segment_chapter_progress',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(
+                fields=['segment', 'role', 'user', 'value'],
+                name='panta_vote_segment_role_user',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(
+                fields=['user', '-date'], name='panta_vote_user_date'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='segmentcomment',
+            index=models.Index(
+                fields=['user', '-last_modified'],
+                name='panta_comment_user_modified',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='importantheading',
+            index=models.Index(
+                fields=['work', '-date'], name='panta_heading_work_date'
+            ),
+        ),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
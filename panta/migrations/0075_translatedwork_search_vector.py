@@ -0,0 +1,218 @@
+# Generated by Django 2.1.15 on 2026-10-19 14:03
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Copy of panta.constants.SEARCH_CONFIGS
+SEARCH_CONFIGS = {
+    'da': 'danish',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'fi': 'finnish',
+    'fr': 'french',
+    'hu': 'hungarian',
+    'it': 'italian',
+    'nb': 'norwegian',
+    'nl': 'dutch',
+    'pt': 'portuguese',
+    'ro': 'romanian',
+    'ru': 'russian',
+    'sv': 'swedish',
+    'tr': 'turkish',
+}
+
+CONFIG_CASES = '\n'.join(
+    f"        WHEN '{language}' THEN '{config}'"
+    for language, config in SEARCH_CONFIGS.items()
+)
+
+# Titles are stored unstemmed ('simple') for prefix matching and stemmed with
+# the configuration of their language. Weights: A abbreviation, B title,
+# C original title, D author and tags.
+CREATE_FUNCTIONS = f'''
+CREATE FUNCTION panta_search_config(language varchar) RETURNS regconfig AS $$
+    SELECT CASE language
+{CONFIG_CASES}
+        ELSE 'simple'
+    END::regconfig;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE FUNCTION panta_translatedwork_search_vector(
+    w_id int,
+    w_abbreviation varchar,
+    w_title varchar,
+    w_language varchar,
+    w_original_id int
+) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', w_abbreviation), 'A')
+        || setweight(
+            to_tsvector('simple', w_title)
+            || to_tsvector(panta_search_config(w_language), w_title),
+            'B'
+        )
+        || setweight(
+            to_tsvector('simple', o.title)
+            || to_tsvector(panta_search_config(o.language), o.title),
+            'C'
+        )
+        || setweight(to_tsvector('simple', concat_ws(
+            ' ', a.prefix, a.first_name, a.last_name, a.suffix, (
+                SELECT string_agg(t.name, ' ')
+                FROM panta_tag t
+                WHERE t.id IN (
+                    SELECT tag_id FROM panta_translatedwork_tags
+                    WHERE translatedwork_id = w_id
+                    UNION
+                    SELECT tag_id FROM panta_originalwork_tags
+                    WHERE originalwork_id = w_original_id
+                )
+            )
+        )), 'D')
+    FROM panta_originalwork o
+    JOIN panta_author a ON a.id = o.author_id
+    WHERE o.id = w_original_id;
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION panta_translatedwork_search_update(work_ids int[])
+RETURNS void AS $$
+    UPDATE panta_translatedwork w
+    SET search_vector = panta_translatedwork_search_vector(
+        w.id, w.abbreviation, w.title, w.language, w.original_id
+    )
+    WHERE w.id = ANY(work_ids);
+$$ LANGUAGE sql;
+'''
+
+DROP_FUNCTIONS = '''
+DROP FUNCTION panta_translatedwork_search_update(int[]);
+DROP FUNCTION panta_translatedwork_search_vector(
+    int, varchar, varchar, varchar, int
+);
+DROP FUNCTION panta_search_config(varchar);
+'''
+
+CREATE_TRIGGERS = '''
+CREATE FUNCTION panta_translatedwork_search_set() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := panta_translatedwork_search_vector(
+        NEW.id, NEW.abbreviation, NEW.title, NEW.language, NEW.original_id
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Updates the works whose original, tags or author changed
+CREATE FUNCTION panta_translatedwork_search_refresh() RETURNS trigger AS $$
+DECLARE
+    r record;
+    work_ids int[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        r := OLD;
+    ELSE
+        r := NEW;
+    END IF;
+    IF TG_TABLE_NAME = 'panta_translatedwork_tags' THEN
+        work_ids := ARRAY[r.translatedwork_id];
+    ELSIF TG_TABLE_NAME = 'panta_originalwork_tags' THEN
+        work_ids := ARRAY(
+            SELECT id FROM panta_translatedwork
+            WHERE original_id = r.originalwork_id
+        );
+    ELSIF TG_TABLE_NAME = 'panta_originalwork' THEN
+        work_ids := ARRAY(
+            SELECT id FROM panta_translatedwork WHERE original_id = r.id
+        );
+    ELSIF TG_TABLE_NAME = 'panta_author' THEN
+        work_ids := ARRAY(
+            SELECT w.id
+            FROM panta_translatedwork w
+            JOIN panta_originalwork o ON o.id = w.original_id
+            WHERE o.author_id = r.id
+        );
+    ELSIF TG_TABLE_NAME = 'panta_tag' THEN
+        work_ids := ARRAY(
+            SELECT translatedwork_id FROM panta_translatedwork_tags
+            WHERE tag_id = r.id
+            UNION
+            SELECT w.id
+            FROM panta_translatedwork w
+            JOIN panta_originalwork_tags ot
+                ON ot.originalwork_id = w.original_id
+            WHERE ot.tag_id = r.id
+        );
+    END IF;
+    PERFORM panta_translatedwork_search_update(work_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER panta_translatedwork_search
+BEFORE INSERT OR UPDATE OF abbreviation, title, language, original_id
+ON panta_translatedwork
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_set();
+
+CREATE TRIGGER panta_translatedwork_tags_search
+AFTER INSERT OR DELETE ON panta_translatedwork_tags
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_refresh();
+
+CREATE TRIGGER panta_originalwork_tags_search
+AFTER INSERT OR DELETE ON panta_originalwork_tags
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_refresh();
+
+CREATE TRIGGER panta_originalwork_search
+AFTER UPDATE OF title, language, author_id ON panta_originalwork
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_refresh();
+
+CREATE TRIGGER panta_author_search
+AFTER UPDATE OF prefix, first_name, last_name, suffix ON panta_author
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_refresh();
+
+CREATE TRIGGER panta_tag_search
+AFTER UPDATE OF name ON panta_tag
+FOR EACH ROW EXECUTE PROCEDURE panta_translatedwork_search_refresh();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER panta_tag_search ON panta_tag;
+DROP TRIGGER panta_author_search ON panta_author;
+DROP TRIGGER panta_originalwork_search ON panta_originalwork;
+DROP TRIGGER panta_originalwork_tags_search ON panta_originalwork_tags;
+DROP TRIGGER panta_translatedwork_tags_search ON panta_translatedwork_tags;
+DROP TRIGGER panta_translatedwork_search ON panta_translatedwork;
+DROP FUNCTION panta_translatedwork_search_refresh();
+DROP FUNCTION panta_translatedwork_search_set();
+'''
+
+FILL_VECTORS = '''
+SELECT panta_translatedwork_search_update(ARRAY(
+    SELECT id FROM panta_translatedwork
+));
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('panta', '0074_hot_query_indexes')]
+
+    operations = [
+        migrations.AddField(
+            model_name='translatedwork',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='translatedwork',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'], name='panta_work_search_vector'
+            ),
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, DROP_FUNCTIONS),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(FILL_VECTORS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The vectors are stemmed with the configuration of the language of the work
+# (see migration 0075). Both the vectors and the trigram indexes use the
+# content without HTML tags.
+CREATE_FUNCTIONS = '''
+CREATE FUNCTION panta_strip_tags(content text) RETURNS text AS $$
+    SELECT regexp_replace(content, '<[^>]*>', ' ', 'g');
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE FUNCTION panta_segment_search_set() RETURNS trigger AS $$
+DECLARE
+    work_language varchar;
+BEGIN
+    IF TG_TABLE_NAME = 'panta_originalsegment' THEN
+        SELECT w.language INTO work_language
+        FROM panta_originalwork w WHERE w.id = NEW.work_id;
+    ELSE
+        SELECT w.language INTO work_language
+        FROM panta_translatedwork w WHERE w.id = NEW.work_id;
+    END IF;
+    NEW.search_vector := to_tsvector(
+        panta_search_config(work_language), panta_strip_tags(NEW.content)
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER panta_originalsegment_search
+BEFORE INSERT OR UPDATE OF content ON panta_originalsegment
+FOR EACH ROW EXECUTE PROCEDURE panta_segment_search_set();
+
+CREATE TRIGGER panta_translatedsegment_search
+BEFORE INSERT OR UPDATE OF content ON panta_translatedsegment
+FOR EACH ROW EXECUTE PROCEDURE panta_segment_search_set();
+'''
+
+DROP_FUNCTIONS = '''
+DROP TRIGGER panta_translatedsegment_search ON panta_translatedsegment;
+DROP TRIGGER panta_originalsegment_search ON panta_originalsegment;
+DROP FUNCTION panta_segment_search_set();
+DROP FUNCTION panta_strip_tags(text);
+'''
+
+FILL_VECTORS = '''
+UPDATE panta_originalsegment s
+SET search_vector = to_tsvector(
+    panta_search_config(w.language), panta_strip_tags(s.content)
+)
+FROM panta_originalwork w
+WHERE w.id = s.work_id;
+
+UPDATE panta_translatedsegment s
+SET search_vector = to_tsvector(
+    panta_search_config(w.language), panta_strip_tags(s.content)
+)
+FROM panta_translatedwork w
+WHERE w.id = s.work_id;
+'''
+
+CREATE_INDEXES = '''
+CREATE INDEX panta_originalsegment_trgm
+ON panta_originalsegment USING gin (panta_strip_tags(content) gin_trgm_ops);
+
+CREATE INDEX panta_translatedsegment_trgm
+ON panta_translatedsegment USING gin (panta_strip_tags(content) gin_trgm_ops);
+'''
+
+DROP_INDEXES = '''
+DROP INDEX panta_translatedsegment_trgm;
+DROP INDEX panta_originalsegment_trgm;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panta', '0075_translatedwork_search_vector'),
+        # pg_trgm
+        ('white_estate', '0004_translationmemoryentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='originalsegment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='translatedsegment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, DROP_FUNCTIONS),
+        # Filled before the indexes exist
+        migrations.RunSQL(FILL_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='originalsegment',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'], name='panta_original_search_vector'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='translatedsegment',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'], name='panta_segment_search_vector'
+            ),
+        ),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
@@ -0,0 +1,180 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Segments before the first chapter are one group like with DISTINCT ON
+CREATE_INDEXES = '''
+CREATE UNIQUE INDEX panta_lastactivity_chapter
+ON panta_lastactivity (user_id, type, coalesce(chapter_id, 0));
+
+CREATE INDEX panta_history_user_date
+ON panta_historicaltranslatedsegment (history_user_id, history_date DESC);
+'''
+
+DROP_INDEXES = '''
+DROP INDEX panta_history_user_date;
+DROP INDEX panta_lastactivity_chapter;
+'''
+
+FILL_TABLE = '''
+INSERT INTO panta_lastactivity (user_id, type, chapter_id, segment_id, date)
+SELECT DISTINCT ON (history_user_id, coalesce(chapter_id, 0))
+    history_user_id, 'record', chapter_id, id, history_date
+FROM panta_historicaltranslatedsegment
+WHERE history_user_id IS NOT NULL
+ORDER BY history_user_id, coalesce(chapter_id, 0), history_date DESC;
+
+INSERT INTO panta_lastactivity
+    (user_id, type, chapter_id, segment_id, vote_id, date)
+SELECT DISTINCT ON (v.user_id, coalesce(s.chapter_id, 0))
+    v.user_id, 'vote', s.chapter_id, s.id, v.id, v.date
+FROM panta_vote v
+JOIN panta_translatedsegment s ON s.id = v.segment_id
+ORDER BY v.user_id, coalesce(s.chapter_id, 0), v.date DESC;
+'''
+
+# Older activities (e.g. of imports) don't replace newer ones
+CREATE_TRIGGERS = '''
+CREATE FUNCTION panta_lastactivity_record() RETURNS trigger AS $$
+BEGIN
+    IF NEW.history_user_id IS NOT NULL THEN
+        INSERT INTO panta_lastactivity
+            (user_id, type, chapter_id, segment_id, date)
+        VALUES (
+            NEW.history_user_id, 'record', NEW.chapter_id, NEW.id,
+            NEW.history_date
+        )
+        ON CONFLICT (user_id, type, coalesce(chapter_id, 0)) DO UPDATE
+        SET segment_id = EXCLUDED.segment_id, date = EXCLUDED.date
+        WHERE panta_lastactivity.date <= EXCLUDED.date;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION panta_lastactivity_vote() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO panta_lastactivity
+        (user_id, type, chapter_id, segment_id, vote_id, date)
+    SELECT NEW.user_id, 'vote', s.chapter_id, s.id, NEW.id, NEW.date
+    FROM panta_translatedsegment s
+    WHERE s.id = NEW.segment_id
+    ON CONFLICT (user_id, type, coalesce(chapter_id, 0)) DO UPDATE
+    SET segment_id = EXCLUDED.segment_id,
+        vote_id = EXCLUDED.vote_id,
+        date = EXCLUDED.date
+    WHERE panta_lastactivity.date <= EXCLUDED.date;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER panta_lastactivity_record
+AFTER INSERT ON panta_historicaltranslatedsegment
+FOR EACH ROW EXECUTE PROCEDURE panta_lastactivity_record();
+
+CREATE TRIGGER panta_lastactivity_vote
+AFTER INSERT ON panta_vote
+FOR EACH ROW EXECUTE PROCEDURE panta_lastactivity_vote();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER panta_lastactivity_vote ON panta_vote;
+DROP TRIGGER panta_lastactivity_record ON panta_historicaltranslatedsegment;
+DROP FUNCTION panta_lastactivity_vote();
+DROP FUNCTION panta_lastactivity_record();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('panta', '0076_segment_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LastActivity',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'type',
+                    models.CharField(
+                        choices=[
+                            ('record', 'historical record'),
+                            ('vote', 'vote'),
+                        ],
+                        max_length=7,
+                        verbose_name='type',
+                    ),
+                ),
+                ('date', models.DateTimeField(verbose_name='date')),
+                (
+                    'chapter',
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name='+',
+                        to='panta.ImportantHeading',
+                        verbose_name='chapter',
+                    ),
+                ),
+                (
+                    'segment',
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name='activities',
+                        to='panta.TranslatedSegment',
+                        verbose_name='segment',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name='+',
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name='user',
+                    ),
+                ),
+                (
+                    'vote',
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name='activities',
+                        to='panta.Vote',
+                        verbose_name='vote',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'last activity',
+                'verbose_name_plural': 'last activities',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lastactivity',
+            index=models.Index(
+                fields=['user', 'type', '-date'],
+                name='panta_lastactivity_user_date',
+            ),
+        ),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+        migrations.RunSQL(FILL_TABLE, migrations.RunSQL.noop),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
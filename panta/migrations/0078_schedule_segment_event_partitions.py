@@ -0,0 +1,37 @@
+from django.db import migrations
+
+TASK = 'panta.tasks.create_segment_event_partitions'
+
+
+def schedule_task(apps, schema_editor):
+    CrontabSchedule = apps.get_model('django_celery_beat', 'CrontabSchedule')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    # Daily, so a failed run is retried long before the partitions run out
+    schedule, created = CrontabSchedule.objects.get_or_create(
+        minute='0',
+        hour='3',
+        day_of_week='*',
+        day_of_month='*',
+        month_of_year='*',
+    )
+    PeriodicTask.objects.update_or_create(
+        name='Create segment event partitions',
+        defaults={'task': TASK, 'crontab': schedule, 'enabled': True},
+    )
+
+
+def unschedule_task(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    PeriodicTask.objects.filter(task=TASK).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_beat', '0011_auto_20190508_0153'),
+        ('panta', '0077_lastactivity'),
+    ]
+
+    operations = [migrations.RunPython(schedule_task, unschedule_task)]
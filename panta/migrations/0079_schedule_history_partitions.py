@@ -0,0 +1,34 @@
+from django.db import migrations
+
+TASK = 'panta.tasks.create_history_partitions'
+
+
+def schedule_task(apps, schema_editor):
+    CrontabSchedule = apps.get_model('django_celery_beat', 'CrontabSchedule')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    # Same schedule as for the segment event partitions
+    schedule, created = CrontabSchedule.objects.get_or_create(
+        minute='0',
+        hour='3',
+        day_of_week='*',
+        day_of_month='*',
+        month_of_year='*',
+    )
+    PeriodicTask.objects.update_or_create(
+        name='Create history partitions',
+        defaults={'task': TASK, 'crontab': schedule, 'enabled': True},
+    )
+
+
+def unschedule_task(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+
+    PeriodicTask.objects.filter(task=TASK).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('panta', '0078_schedule_segment_event_partitions')]
+
+    operations = [migrations.RunPython(schedule_task, unschedule_task)]
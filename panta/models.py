@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from bs4 import BeautifulSoup
 
 from base.constants import ROLES, UNTRUSTED_HTML_WARNING, get_languages
@@ -5,13 +7,15 @@ from base.history import HistoricalRecords
 from base.models import TimestampsModel
 from django.apps import apps
 from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import (
     Case,
-    Count,
+    Exists,
     ExpressionWrapper,
     F,
     Func,
@@ -26,7 +30,7 @@ from django.db.models import (
 from django.utils import timezone
 from django.utils.text import Truncator
 from django.utils.translation import gettext_lazy as _, pgettext_lazy
-from panta import queries, validators
+from panta import caching, queries, validators
 from panta.constants import (
     BLANK,
     CHANGE_REASONS,
@@ -63,7 +67,8 @@ class VersionModel(models.Model):
     Abstract model activating versioning.
     """
 
-    history = HistoricalRecords(inherit=True)
+    # The search vector of translated works is derived data
+    history = HistoricalRecords(inherit=True, excluded_fields=['search_vector'])
 
     class Meta:
         abstract = True
@@ -274,6 +279,8 @@ class TranslatedWork(AbstractWorkModel):
     tags = models.ManyToManyField(
         Tag, verbose_name=_('tags'), related_name='translatedworks', blank=True
     )
+    # Maintained by database triggers (see migration 0075)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     objects = queries.TranslatedWorkQuerySet.as_manager()
 
@@ -303,6 +310,24 @@ class TranslatedWork(AbstractWorkModel):
     def required_approvals(self):
         return REQUIRED_APPROVALS.get(self.language)
 
+    @staticmethod
+    def get_language_cache_key(pk):
+        return f'translated_work_language_{pk}'
+
+    @classmethod
+    def get_language(cls, pk) -> str:
+        """
+        Returns the language of the work with given PK from cache or DB.
+
+        Raises DoesNotExist if there is no such work.
+        """
+        key = cls.get_language_cache_key(pk)
+        language = cache.get(key)
+        if language is None:
+            language = cls.objects.values_list('language', flat=True).get(pk=pk)
+            cache.set(key, language, None)
+        return language
+
     def update_pretranslated(self, chapters=True, save=True) -> dict:
         """
         Updates statistics.pretranslated of the work.
@@ -340,6 +365,9 @@ class TranslatedWork(AbstractWorkModel):
         verbose_name_plural = pgettext_lazy(
             'literary works', 'translated works'
         )
+        indexes = [
+            GinIndex(fields=['search_vector'], name='panta_work_search_vector')
+        ]
 
 
 # Create direct object permissions
@@ -503,6 +531,10 @@ class AbstractSegmentModel(TimestampsModel):
         _('content'), blank=True, validators=[validators.valid_segment]
     )
     reference = models.CharField(_('reference'), max_length=50)
+    # Maintained by database triggers (see migration 0076)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = queries.SegmentManager()
 
     def clean(self):
         # if self.tag != 'hr' and not self.content:
@@ -548,6 +580,11 @@ class OriginalSegment(AbstractSegmentModel, VersionModel):
         verbose_name = _('original segment')
         verbose_name_plural = _('original segments')
         unique_together = ('work', 'position')
+        indexes = [
+            GinIndex(
+                fields=['search_vector'], name='panta_original_search_vector'
+            )
+        ]
 
 
 class BaseHistoricalTranslatedSegment(models.Model):
@@ -574,7 +611,13 @@ class BaseHistoricalTranslatedSegment(models.Model):
                     .latest()
                 )
             except self.DoesNotExist:
-                pass
+                # Records of archived partitions still have their events
+                self.relative_id = (
+                    SegmentEvent.objects.filter(
+                        segment_id=self.id, type=SegmentEvent.RECORD
+                    ).count()
+                    + 1
+                )
             else:
                 self.relative_id = most_recent_record.relative_id + 1
         super().save(*args, **kwargs)
@@ -626,6 +669,7 @@ class TranslatedSegment(AbstractSegmentModel):
             'progress',
             'created',
             'last_modified',
+            'search_vector',
         ],
         related_name='past',
     )
@@ -638,7 +682,9 @@ class TranslatedSegment(AbstractSegmentModel):
         null=True,
     )
 
-    objects = queries.TranslatedSegmentQuerySet.as_manager()
+    objects = queries.SegmentManager.from_queryset(
+        queries.TranslatedSegmentQuerySet
+    )()
 
     # This can't be set in save_without_historical_record because super()
     # doesn't have this method (which I'd like to call).
@@ -657,7 +703,7 @@ class TranslatedSegment(AbstractSegmentModel):
         if not self._last_historical_record:
             obj = (
                 self.history.annotate(
-                    edits=Count('history_user__historicaltranslatedsegments')
+                    edits=queries.get_edits_subquery('history_user_id')
                 )
                 .select_related('history_user')
                 .latest()
@@ -699,7 +745,7 @@ class TranslatedSegment(AbstractSegmentModel):
     def get_fresh_obj_with_stats(self, user):
         segment = (
             self.__class__.objects.select_related('locked_by')
-            .annotate(edits=Count('locked_by__historicaltranslatedsegments'))
+            .annotate(edits=queries.get_edits_subquery('locked_by_id'))
             .for_response(self.work_id, user)
             .get(pk=self.pk)
         )
@@ -707,13 +753,16 @@ class TranslatedSegment(AbstractSegmentModel):
             segment.locked_by.edits = segment.edits
         return segment
 
-    def get_history_for_serializer(self, latest=False):
+    def get_history_for_serializer(self, latest=False, pks=None):
         vote_qs = Vote.objects.select_related('user').annotate(
-            edits=Count('user__historicaltranslatedsegments')
+            edits=queries.get_edits_subquery('user_id')
         )
+        queryset = self.history.all()
+        if pks is not None:
+            queryset = queryset.filter(history_id__in=pks)
         queryset = (
-            self.history.annotate(
-                edits=Count('history_user__historicaltranslatedsegments')
+            queryset.annotate(
+                edits=queries.get_edits_subquery('history_user_id')
             )
             .select_related('history_user')
             .prefetch_related(Prefetch('votes', queryset=vote_qs))
@@ -737,6 +786,67 @@ class TranslatedSegment(AbstractSegmentModel):
             assign_edits(obj)
         return objects
 
+    def get_timeline_entries(self, before=None, limit=None):
+        """
+        Returns (type, ID, date) of comments, historical records and votes.
+
+        The entries are read from the event log and ordered by date, type and
+        ID (descending). `before` is the (date, type, ID) of the last entry of
+        the previous page.
+        """
+        # Archived records have events but no objects
+        records = TranslatedSegment.history.filter(
+            history_id=OuterRef('object_id')
+        )
+        entries = (
+            SegmentEvent.objects.timeline(self, before)
+            .annotate(exists=Exists(records))
+            .filter(~Q(type=SegmentEvent.RECORD) | Q(exists=True))
+            .values_list('type', 'object_id', 'date')
+        )
+        if limit is not None:
+            entries = entries[:limit]
+        return list(entries)
+
+    def get_timeline_objects(self, entries, user):
+        """
+        Returns (type, object) pairs for given timeline entries.
+
+        Deleted objects and comments to delete (except for their owner) are
+        left out.
+        """
+        pks = defaultdict(list)
+        for entry_type, pk, date in entries:
+            pks[entry_type].append(pk)
+        objects = {}
+        if pks['comment']:
+            comments = (
+                SegmentComment.objects.filter(
+                    Q(to_delete__isnull=True) | Q(user=user),
+                    pk__in=pks['comment'],
+                )
+                .annotate(edits=queries.get_edits_subquery('user_id'))
+                .select_related('vote', 'user')
+            )
+            for obj in comments:
+                obj.user.edits = obj.edits
+                objects['comment', obj.pk] = obj
+        if pks['record']:
+            for obj in self.get_history_for_serializer(pks=pks['record']):
+                objects['record', obj.pk] = obj
+        if pks['vote']:
+            votes = (
+                Vote.objects.filter(pk__in=pks['vote'])
+                .annotate(edits=queries.get_edits_subquery('user_id'))
+                .select_related('user')
+            )
+            for obj in votes:
+                obj.user.edits = obj.edits
+                objects['vote', obj.pk] = obj
+        return [
+            (t, objects[t, pk]) for t, pk, date in entries if (t, pk) in objects
+        ]
+
     def has_minimum_vote(self, role, minimum):
         return (getattr(self, f'{role}s_vote') or 0) >= minimum
 
@@ -935,6 +1045,20 @@ class TranslatedSegment(AbstractSegmentModel):
         unique_together = ('work', 'position')
         # Needed for the admin panel (select_related)
         index_together = ('position', 'work', 'original')
+        # For the statistics of the important headings
+        indexes = [
+            models.Index(
+                fields=['chapter', '-last_modified'],
+                name='panta_segment_chapter_date',
+            ),
+            models.Index(
+                fields=['chapter', 'progress'],
+                name='panta_segment_chapter_progress',
+            ),
+            GinIndex(
+                fields=['search_vector'], name='panta_segment_search_vector'
+            ),
+        ]
 
 
 class Vote(models.Model):
@@ -962,11 +1086,14 @@ class Vote(models.Model):
     # editing it. Not copying the vote prevents having copies of the same vote
     # in the timeline. We could filter them out but I think this implementation
     # is a DRY and thereby the best solution.
+    # The historical records are partitioned, and PostgreSQL 11 doesn't support
+    # foreign keys referencing partitioned tables.
     historical_segments = models.ManyToManyField(
         TranslatedSegment.history.model,
         verbose_name=_('historical segment'),
         related_name='votes',
         blank=True,
+        db_constraint=False,
     )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -1014,6 +1141,14 @@ class Vote(models.Model):
         verbose_name = _('vote')
         verbose_name_plural = _('votes')
         get_latest_by = 'date'
+        indexes = [
+            # Covers the vote sums of the segments (index-only scans)
+            models.Index(
+                fields=['segment', 'role', 'user', 'value'],
+                name='panta_vote_segment_role_user',
+            ),
+            models.Index(fields=['user', '-date'], name='panta_vote_user_date'),
+        ]
         # TODO in every language!
         # permissions = (('vote_as_trustee', _('Can vote as trustee')),)
 
@@ -1226,6 +1361,153 @@ class SegmentComment(TimestampsModel):
     class Meta(TimestampsModel.Meta):
         verbose_name = _('segment comment')
         verbose_name_plural = _('segment comments')
+        # The comments of segments are indexed partially (see migration 0074)
+        indexes = [
+            models.Index(
+                fields=['user', '-last_modified'],
+                name='panta_comment_user_modified',
+            )
+        ]
+
+
+class SegmentEvent(models.Model):
+    """
+    Append-only log of historical records, votes and comments of segments.
+
+    Rows are written by database triggers for every insert into the tables
+    of the objects (see migration 0072). The table is partitioned by month.
+    Objects deleted later keep their events.
+    """
+
+    RECORD = 'record'
+    VOTE = 'vote'
+    COMMENT = 'comment'
+
+    types = (
+        (RECORD, _('historical record')),
+        (VOTE, _('vote')),
+        (COMMENT, _('comment')),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    type = models.CharField(_('type'), choices=types, max_length=7)
+    object_id = models.PositiveIntegerField(_('object ID'))
+    date = models.DateTimeField(_('date'))
+    segment = models.ForeignKey(
+        TranslatedSegment,
+        verbose_name=_('segment'),
+        related_name='events',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    work = models.ForeignKey(
+        TranslatedWork,
+        verbose_name=_('work'),
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('user'),
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+    )
+
+    objects = queries.SegmentEventQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('segment event')
+        verbose_name_plural = _('segment events')
+        indexes = [
+            models.Index(
+                fields=['segment', 'date'], name='panta_segmentevent_segment'
+            ),
+            models.Index(
+                fields=['work', 'date'], name='panta_segmentevent_work'
+            ),
+            models.Index(
+                fields=['user', 'date'], name='panta_segmentevent_user'
+            ),
+        ]
+
+    @classmethod
+    def create_partitions(cls, start=None, months=3) -> int:
+        """
+        Creates missing monthly partitions beginning with the month of start.
+
+        Rows of months without partition go to the default partition, which
+        prevents creating the partition later. Therefore, partitions should
+        be created in advance.
+        """
+        start = start or timezone.now().date()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT panta_segmentevent_create_partitions(%s, %s)',
+                (start, months),
+            )
+            return cursor.fetchone()[0]
+
+
+class LastActivity(models.Model):
+    """
+    Last edit and last vote of a user per chapter.
+
+    Rows are inserted or updated by database triggers for every new
+    historical record and vote (see migration 0077), so the last activities
+    of a user are read without grouping all of them.
+    """
+
+    RECORD = 'record'
+    VOTE = 'vote'
+
+    types = ((RECORD, _('historical record')), (VOTE, _('vote')))
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('user'),
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    type = models.CharField(_('type'), choices=types, max_length=7)
+    # The chapter at the time of the activity
+    chapter = models.ForeignKey(
+        'ImportantHeading',
+        verbose_name=_('chapter'),
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+    )
+    segment = models.ForeignKey(
+        TranslatedSegment,
+        verbose_name=_('segment'),
+        related_name='activities',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    vote = models.ForeignKey(
+        Vote,
+        verbose_name=_('vote'),
+        related_name='activities',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+    )
+    date = models.DateTimeField(_('date'))
+
+    class Meta:
+        verbose_name = _('last activity')
+        verbose_name_plural = _('last activities')
+        indexes = [
+            models.Index(
+                fields=['user', 'type', '-date'],
+                name='panta_lastactivity_user_date',
+            )
+        ]
 
 
 # TODO OriginalReference in order to be able to join them and get the correct
@@ -1389,6 +1671,11 @@ class ImportantHeading(models.Model):
         verbose_name = _('important heading')
         verbose_name_plural = _('important headings')
         unique_together = (('work', 'number'),)
+        indexes = [
+            models.Index(
+                fields=['work', '-date'], name='panta_heading_work_date'
+            )
+        ]
         # An 'ordering' leads to an unexpected 'LEFT OUTER JOIN' when you
         # group votes by chapter (in Django 2.0)
 
@@ -1535,7 +1822,9 @@ class ImportantHeading(models.Model):
             Q(segment__last_modified__gt=F('date'))
             | Q(segments__last_modified__gt=F('date'))
         )
-        count = queryset.update(
+        rows = queries.update_changed(
+            queryset,
+            bookkeeping=('date',),
             content=Subquery(
                 # 'content' can't be used directly because it's a field
                 # https://code.djangoproject.com/ticket/28072
@@ -1575,7 +1864,10 @@ class ImportantHeading(models.Model):
                 ),
             ),
         )
-        return count
+        caching.invalidate_works(
+            {work for pk, work, changed in rows if changed}
+        )
+        return len(rows)
 
     @classmethod
     def get_statistics_subquery(cls, progress):
@@ -1664,7 +1956,9 @@ class WorkStatistics(models.Model):
             Q(work__important_headings__date__gt=F('last_activity'))
             | Q(last_activity=None)
         )
-        count = queryset.update(
+        rows = queries.update_changed(
+            queryset,
+            bookkeeping=('last_activity',),
             translated_count=cls.get_query_count('translation'),
             reviewed_count=cls.get_query_count('review'),
             authorized_count=cls.get_query_count('trustee'),
@@ -1672,11 +1966,9 @@ class WorkStatistics(models.Model):
             reviewed_percent=cls.get_query_percent('review'),
             authorized_percent=cls.get_query_percent('trustee'),
             contributors=queries.SubqueryCount(
-                get_user_model()
-                .objects.filter(
-                    historicaltranslatedsegments__work_id=OuterRef('work_id')
-                )
-                .distinct()
+                SegmentEvent.objects.filter(
+                    work_id=OuterRef('work_id')
+                ).contributors()
             ),
             last_activity=Subquery(
                 ImportantHeading.objects.filter(work_id=OuterRef('work_id'))
@@ -1684,7 +1976,10 @@ class WorkStatistics(models.Model):
                 .values('date')[:1]
             ),
         )
-        return count
+        caching.invalidate_works(
+            {work for pk, work, changed in rows if changed}
+        )
+        return len(rows)
 
     @classmethod
     def get_query_count(cls, task):
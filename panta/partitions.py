@@ -0,0 +1,319 @@
+"""
+Declarative partitioning of the historical records of translated segments.
+
+The table is partitioned by month of history_date without downtime:
+prepare() creates the partitioned table and a trigger that keeps it in sync,
+copy() copies the existing records in batches and swap() replaces the table
+within a short transaction. Old partitions can be archived to compressed
+files and restored from them.
+"""
+import datetime
+import gzip
+import os
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+TABLE = 'panta_historicaltranslatedsegment'
+MONTH_SUFFIX = re.compile(r'_(\d{4})_(\d{2})$')
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+class HistoryPartitioning:
+    """
+    Partitions the history table by month.
+
+    The primary key and the unique constraint of (id, relative_id) include
+    history_date because PostgreSQL requires the partition key in them.
+    """
+
+    def __init__(self, table=TABLE):
+        self.table = table
+        self.staging = f'{table}_partitioned'
+        self.backup = f'{table}_unpartitioned'
+        self.sync = f'{table}_sync'
+
+    def exists(self, name) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (name,))
+            return cursor.fetchone()[0]
+
+    def is_partitioned(self) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relkind = %s FROM pg_class WHERE oid = %s::regclass',
+                ('p', self.table),
+            )
+            return cursor.fetchone()[0]
+
+    def get_partition_name(self, month) -> str:
+        return f'{self.table}_{month:%Y_%m}'
+
+    def get_partitions(self) -> list:
+        """
+        Returns the names and months of the monthly partitions.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT c.relname FROM pg_inherits i '
+                'JOIN pg_class c ON c.oid = i.inhrelid '
+                'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+                (self.table,),
+            )
+            names = [name for name, in cursor.fetchall()]
+        partitions = []
+        for name in names:
+            match = MONTH_SUFFIX.search(name)
+            if match:
+                month = datetime.date(*map(int, match.groups()), 1)
+                partitions.append((name, month))
+        return partitions
+
+    def create_partitions(self, start=None, months=3, parent=None) -> int:
+        """
+        Creates missing monthly partitions beginning with the month of start.
+
+        Like for the segment event log, partitions should be created in
+        advance because records in the default partition prevent creating
+        the partition of their month.
+        """
+        parent = connection.ops.quote_name(parent or self.table)
+        month = (start or timezone.now().date()).replace(day=1)
+        created = 0
+        with connection.cursor() as cursor:
+            for i in range(months):
+                name = self.get_partition_name(month)
+                if not self.exists(name):
+                    cursor.execute(
+                        f'CREATE TABLE {connection.ops.quote_name(name)} '
+                        f'PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)',
+                        (month, next_month(month)),
+                    )
+                    created += 1
+                month = next_month(month)
+        return created
+
+    @transaction.atomic
+    def prepare(self):
+        """
+        Creates the partitioned table and the trigger syncing it.
+        """
+        table = self.table
+        staging = self.staging
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS '
+                'INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+                'PARTITION BY RANGE (history_date)'
+            )
+            cursor.execute(
+                f'ALTER TABLE {staging} ADD CONSTRAINT {table}_pk '
+                'PRIMARY KEY (history_id, history_date)'
+            )
+            cursor.execute(
+                f'ALTER TABLE {staging} ADD CONSTRAINT {table}_relative_uniq '
+                'UNIQUE (id, relative_id, history_date)'
+            )
+            # Newest records of a segment first
+            cursor.execute(
+                f'CREATE INDEX {table}_id_date '
+                f'ON {staging} (id, history_date DESC)'
+            )
+
+            # Remaining indexes and foreign keys
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes '
+                'WHERE tablename = %s',
+                (table,),
+            )
+            for name, definition in cursor.fetchall():
+                if not definition.startswith('CREATE INDEX'):
+                    continue
+                cursor.execute(
+                    re.sub(
+                        r'^CREATE INDEX \S+ ON \S+',
+                        f'CREATE INDEX {name}_p ON {staging}',
+                        definition,
+                    )
+                )
+            cursor.execute(
+                'SELECT conname, pg_get_constraintdef(oid) '
+                'FROM pg_constraint WHERE conrelid = %s::regclass '
+                "AND contype = 'f'",
+                (table,),
+            )
+            for name, definition in cursor.fetchall():
+                cursor.execute(
+                    f'ALTER TABLE {staging} ADD CONSTRAINT {name}_p '
+                    f'{definition}'
+                )
+
+            cursor.execute(
+                f'CREATE TABLE {table}_default PARTITION OF {staging} DEFAULT'
+            )
+            cursor.execute(
+                f'SELECT coalesce(min(history_date), now())::date FROM {table}'
+            )
+            start = cursor.fetchone()[0]
+            now = timezone.now().date()
+            months = (now.year - start.year) * 12 + now.month - start.month
+            self.create_partitions(start, months + 4, parent=staging)
+
+            # Changes of records which are already copied
+            cursor.execute(
+                f'''
+                CREATE FUNCTION {self.sync}() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        DELETE FROM {staging}
+                        WHERE history_id = OLD.history_id;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        INSERT INTO {staging} SELECT NEW.*
+                        ON CONFLICT DO NOTHING;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER {self.sync}
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE {self.sync}();
+                '''
+            )
+
+    def copy(self, batch_size=10000, start=0):
+        """
+        Copies the records in batches and yields the last copied ID.
+
+        Every batch is a transaction of its own. The records are locked while
+        copying so that the sync trigger can't miss a concurrent change.
+        """
+        last = start
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT max(history_id) FROM ('
+                    f'SELECT history_id FROM {self.table} '
+                    'WHERE history_id > %s ORDER BY history_id LIMIT %s'
+                    ') batch',
+                    (last, batch_size),
+                )
+                end = cursor.fetchone()[0]
+                if end is None:
+                    return
+                cursor.execute(
+                    f'INSERT INTO {self.staging} SELECT * FROM {self.table} '
+                    'WHERE history_id > %s AND history_id <= %s FOR SHARE '
+                    'ON CONFLICT DO NOTHING',
+                    (last, end),
+                )
+            last = end
+            yield last
+
+    @transaction.atomic
+    def swap(self):
+        """
+        Replaces the table with the partitioned one and keeps it as backup.
+        """
+        table = self.table
+        staging = self.staging
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(
+                f'SELECT (SELECT max(history_id) FROM {table}) '
+                f'IS DISTINCT FROM (SELECT max(history_id) FROM {staging})'
+            )
+            if cursor.fetchone()[0]:
+                raise ValueError('Not all records are copied.')
+            cursor.execute(
+                'SELECT conname FROM pg_constraint '
+                'WHERE confrelid = %s::regclass',
+                (table,),
+            )
+            references = [name for name, in cursor.fetchall()]
+            if references:
+                raise ValueError(
+                    f'The table is referenced by {", ".join(references)}.'
+                )
+
+            cursor.execute(f'DROP TRIGGER {self.sync} ON {table}')
+            cursor.execute(f'DROP FUNCTION {self.sync}()')
+            # Segment event log and contributions
+            cursor.execute(
+                'SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger '
+                'WHERE tgrelid = %s::regclass AND NOT tgisinternal',
+                (table,),
+            )
+            for name, definition in cursor.fetchall():
+                cursor.execute(f'DROP TRIGGER {name} ON {table}')
+                cursor.execute(
+                    re.sub(r' ON \S+ ', f' ON {staging} ', definition, count=1)
+                )
+
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, 'history_id')", (table,)
+            )
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {self.backup}')
+            cursor.execute(f'ALTER TABLE {staging} RENAME TO {table}')
+            cursor.execute(
+                f'ALTER SEQUENCE {sequence} OWNED BY {table}.history_id'
+            )
+
+    def drop_backup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {self.backup}')
+
+    def archive(self, before, directory) -> list:
+        """
+        Moves the partitions of months ending before the given date to files.
+
+        Returns the paths of the gzipped files. The events of the records are
+        kept, they number new records of segments without remaining records
+        (see BaseHistoricalTranslatedSegment.save).
+        """
+        paths = []
+        for name, month in self.get_partitions():
+            if next_month(month) > before:
+                continue
+            path = os.path.join(directory, f'{name}.copy.gz')
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {name} IN SHARE MODE')
+                with open(path, 'wb') as f:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as archive:
+                        cursor.copy_expert(f'COPY {name} TO STDOUT', archive)
+                    os.fsync(f.fileno())
+                cursor.execute(
+                    f'ALTER TABLE {self.table} DETACH PARTITION {name}'
+                )
+                cursor.execute(f'DROP TABLE {name}')
+            paths.append(path)
+        return paths
+
+    @transaction.atomic
+    def restore(self, path):
+        """
+        Attaches an archived partition again.
+        """
+        name = os.path.basename(path).split('.')[0]
+        match = MONTH_SUFFIX.search(name)
+        if not name.startswith(self.table) or not match:
+            raise ValueError(f'{path} is no archived partition.')
+        month = datetime.date(*map(int, match.groups()), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE {name} (LIKE {self.table} '
+                'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            )
+            with gzip.open(path, 'rb') as archive:
+                cursor.copy_expert(f'COPY {name} FROM STDIN', archive)
+            cursor.execute(
+                f'ALTER TABLE {self.table} ATTACH PARTITION {name} '
+                'FOR VALUES FROM (%s) TO (%s)',
+                (month, next_month(month)),
+            )
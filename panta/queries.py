@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.db import connection, models
+from django.db.models import Func, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 
 def get_vote_subquery(role, user=None):
@@ -18,6 +20,22 @@ def get_vote_subquery(role, user=None):
     return subquery
 
 
+def get_edits_subquery(user_field):
+    """
+    Returns the number of historical records of the user in given field.
+    """
+    from path.models import Contribution
+
+    subquery = Coalesce(
+        SubquerySum(
+            Contribution.objects.filter(user_id=OuterRef(user_field)),
+            field='edits',
+        ),
+        0,
+    )
+    return subquery
+
+
 class SubqueryCount(Subquery):
     template = "(SELECT count(*) FROM (%(subquery)s) _count)"
     output_field = models.IntegerField()
@@ -28,6 +46,113 @@ class SubquerySum(Subquery):
     output_field = models.IntegerField()
 
 
+class StripTags(Func):
+    """
+    The text without HTML tags (as indexed for the segment search).
+    """
+
+    function = 'panta_strip_tags'
+    output_field = models.TextField()
+
+
+class WordSimilarity(Func):
+    """
+    Trigram similarity of the text and the most similar part of the field.
+    """
+
+    function = 'word_similarity'
+    output_field = models.FloatField()
+
+    def __init__(self, text, expression, **extra):
+        super().__init__(Value(text), expression, **extra)
+
+
+class Headline(Func):
+    """
+    Fragments of the text with the matches of the query highlighted.
+    """
+
+    function = 'ts_headline'
+    output_field = models.TextField()
+
+    def __init__(self, config, expression, query, options='', **extra):
+        super().__init__(
+            Value(config), expression, query, Value(options), **extra
+        )
+
+
+@models.TextField.register_lookup
+class TrigramWordSimilar(PostgresSimpleLookup):
+    """
+    Whether the text is similar to a part of the field (using the threshold
+    pg_trgm.word_similarity_threshold).
+    """
+
+    lookup_name = 'trigram_word_similar'
+    operator = '%%>'
+
+
+def update_changed(queryset, bookkeeping=(), **values) -> list:
+    """
+    Updates the rows of the queryset whose values change (in one query).
+
+    Returns (PK, work ID, changed) of the written rows. `changed` is false if
+    only bookkeeping fields (like the date of the last update) changed. Rows
+    without changes aren't written so that they don't create dead tuples
+    and the cache of their work stays valid.
+    """
+    meta = queryset.model._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    pk = quote(meta.pk.column)
+    annotations = {f'new_{name}': value for name, value in values.items()}
+    # Filters across multi-valued relations join more rows than the result
+    # has, the annotations have to be computed once per row
+    rows = queryset.model.objects.filter(
+        pk__in=queryset.order_by().values('pk')
+    )
+    subquery = rows.annotate(**annotations).values(
+        'pk', 'work_id', *values, *annotations
+    )
+    sql, params = subquery.query.sql_with_params()
+    assignments, changes, bookkeeping_changes = [], [], []
+    for name in values:
+        field = meta.get_field(name)
+        column = quote(field.column)
+        value = (
+            f'CAST(new.{quote(f"new_{name}")} '
+            f'AS {field.db_type(connection)})'
+        )
+        assignments.append(f'{column} = {value}')
+        # The subquery contains the values before the update
+        change = f'new.{column} IS DISTINCT FROM {value}'
+        if name in bookkeeping:
+            bookkeeping_changes.append(change)
+        else:
+            changes.append(change)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {", ".join(assignments)} FROM ({sql}) new '
+            f'WHERE {table}.{pk} = new.{pk} '
+            f'AND ({" OR ".join(changes + bookkeeping_changes)}) '
+            f'RETURNING {table}.{pk}, {table}.work_id, '
+            f'{" OR ".join(changes) or "false"}',
+            params,
+        )
+        return cursor.fetchall()
+
+
+class SegmentManager(models.Manager):
+    """
+    Defers the search vector of segments, which is only used for filtering.
+
+    Saving an instance with deferred fields doesn't write them back.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class TranslatedSegmentQuerySet(models.QuerySet):
     def add_2_votes(self):
         """
@@ -59,23 +184,16 @@ class TranslatedSegmentQuerySet(models.QuerySet):
         from .models import SegmentComment
 
         history = self.model.history
+        # Both use the partial index of comments not to delete
+        comments = SegmentComment.objects.filter(
+            work=OuterRef('work'),
+            position=OuterRef('position'),
+            to_delete__isnull=True,
+        )
         queryset = self.add_votes().annotate(
-            comments=Count(
-                'work__segmentcomments',
-                filter=Q(
-                    work__segmentcomments__position=F('position'),
-                    work__segmentcomments__to_delete__isnull=True,
-                ),
-                distinct=True,
-            ),
+            comments=SubqueryCount(comments),
             last_comment_date=Subquery(
-                SegmentComment.objects.filter(
-                    work=OuterRef('work'),
-                    position=OuterRef('position'),
-                    to_delete__isnull=True,
-                )
-                .order_by('-created')
-                .values('created')[:1]
+                comments.order_by('-created').values('created')[:1]
             ),
             # It turned out that subqueries are faster than counts (because
             # we needed twice as much). For details see the Jupyter notebook
@@ -141,3 +259,34 @@ class TranslatedWorkQuerySet(models.QuerySet):
             ),
         )
         return queryset
+
+
+class SegmentEventQuerySet(models.QuerySet):
+    def timeline(self, segment, before=None):
+        """
+        Events of given segment, the newest first.
+
+        `before` is the (date, type, object ID) of an event to continue after.
+        """
+        queryset = self.filter(segment_id=segment.pk)
+        if before:
+            date, entry_type, object_id = before
+            queryset = queryset.filter(
+                Q(date__lt=date)
+                | Q(date=date, type__lt=entry_type)
+                | Q(date=date, type=entry_type, object_id__lt=object_id)
+            )
+        return queryset.order_by('-date', '-type', '-object_id')
+
+    def contributors(self):
+        """
+        IDs of the users who created historical records.
+        """
+        queryset = (
+            self.filter(type=self.model.RECORD)
+            .exclude(user=None)
+            .order_by()
+            .values('user_id')
+            .distinct()
+        )
+        return queryset
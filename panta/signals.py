@@ -1,9 +1,16 @@
-from django.db.models import Prefetch
-from django.db.models.signals import post_save
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
 from misc.utils import add_task_for_comments_deletion
 
-from . import models
+from . import caching, models
 
 
 @receiver(
@@ -85,3 +92,176 @@ def schedule_segment_comment_deletion(sender, **kwargs):
     Triggers a Celery task if the comment has a TTL.
     """
     add_task_for_comments_deletion(kwargs)
+
+
+@receiver(
+    (post_save, post_delete),
+    sender=models.TranslatedWork,
+    dispatch_uid='delete_cached_work_language',
+)
+def delete_cached_work_language(sender, instance, **kwargs):
+    """
+    Removes the cached language of the work (see TranslatedWork.get_language).
+    """
+    cache.delete(sender.get_language_cache_key(instance.pk))
+
+
+def get_changed_works(instance, kwargs):
+    """
+    Returns the PKs of the works of a change of their tags.
+    """
+    if not kwargs['action'].startswith('post_'):
+        return []
+    if kwargs['reverse']:
+        return kwargs['pk_set'] or []
+    return [instance.pk]
+
+
+@receiver(
+    (post_save, post_delete),
+    sender=models.TranslatedWork,
+    dispatch_uid='invalidate_cached_work',
+)
+def invalidate_cached_work(sender, instance, **kwargs):
+    """
+    Invalidates the cached representation of the work (see panta.caching).
+    """
+    caching.invalidate_works([instance.pk])
+
+
+@receiver(
+    (post_save, post_delete),
+    sender=models.ImportantHeading,
+    dispatch_uid='invalidate_cached_work_heading',
+)
+@receiver(
+    (post_save, post_delete),
+    sender=models.WorkStatistics,
+    dispatch_uid='invalidate_cached_work_statistics',
+)
+def invalidate_cached_work_parts(sender, instance, **kwargs):
+    """
+    Invalidates the work of a changed heading or statistics row.
+
+    Their bulk updates invalidate the changed works themselves.
+    """
+    caching.invalidate_works([instance.work_id])
+
+
+@receiver(
+    m2m_changed,
+    sender=models.TranslatedWork.tags.through,
+    dispatch_uid='invalidate_cached_work_tags',
+)
+def invalidate_cached_work_tags(sender, instance, **kwargs):
+    caching.invalidate_works(get_changed_works(instance, kwargs))
+
+
+@receiver(
+    post_save,
+    sender=models.OriginalWork,
+    dispatch_uid='invalidate_cached_translations',
+)
+def invalidate_cached_translations(sender, instance, **kwargs):
+    """
+    Invalidates the translations of the original (title, key and tags).
+
+    The catalogues contain originals as Growing Together dummies, too.
+    """
+    works = models.TranslatedWork.objects.filter(original_id=instance.pk)
+    caching.invalidate_works(works.values_list('pk', flat=True))
+    caching.invalidate_catalogues()
+
+
+@receiver(
+    m2m_changed,
+    sender=models.OriginalWork.tags.through,
+    dispatch_uid='invalidate_cached_translations_tags',
+)
+def invalidate_cached_translations_tags(sender, instance, **kwargs):
+    originals = get_changed_works(instance, kwargs)
+    works = models.TranslatedWork.objects.filter(original_id__in=originals)
+    caching.invalidate_works(works.values_list('pk', flat=True))
+    if originals:
+        caching.invalidate_catalogues()
+
+
+@receiver(
+    (post_save, post_delete),
+    sender=models.Tag,
+    dispatch_uid='invalidate_work_catalogues',
+)
+def invalidate_work_catalogues(sender, **kwargs):
+    """
+    Invalidates the catalogues because of their tag filter values.
+    """
+    caching.invalidate_catalogues()
+
+
+@receiver(
+    (post_save, pre_delete),
+    sender=models.Tag,
+    dispatch_uid='invalidate_cached_tagged_works',
+)
+def invalidate_cached_tagged_works(sender, instance, **kwargs):
+    """
+    Invalidates the works with the tag (also of their originals).
+
+    The works of a deleted tag are determined before the deletion.
+    """
+    works = models.TranslatedWork.objects.filter(
+        Q(tags=instance) | Q(original__tags=instance)
+    )
+    caching.invalidate_works(works.values_list('pk', flat=True).distinct())
+
+
+@receiver(
+    (post_save, post_delete),
+    sender=models.Author,
+    dispatch_uid='invalidate_cached_author_works',
+)
+def invalidate_cached_author_works(sender, instance, **kwargs):
+    """
+    Invalidates the works and the catalogues (which contain originals).
+    """
+    works = models.TranslatedWork.objects.filter(
+        original__author_id=instance.pk
+    )
+    caching.invalidate_works(works.values_list('pk', flat=True))
+    caching.invalidate_catalogues()
+
+
+@receiver(
+    m2m_changed,
+    sender=models.TranslatedWork.tags.through,
+    dispatch_uid='invalidate_searched_works_tags',
+)
+@receiver(
+    m2m_changed,
+    sender=models.OriginalWork.tags.through,
+    dispatch_uid='invalidate_searched_works_original_tags',
+)
+@receiver(
+    post_save,
+    sender=models.OriginalWork,
+    dispatch_uid='invalidate_searched_works_original',
+)
+@receiver(
+    post_save, sender=models.Author, dispatch_uid='invalidate_searched_works'
+)
+@receiver(
+    post_save, sender=models.Tag, dispatch_uid='invalidate_searched_works_tag'
+)
+def invalidate_searched_works(sender, **kwargs):
+    """
+    Invalidates the cached queries of translated works (cachalot).
+
+    Triggers update the search vectors of the works when their originals,
+    tags or authors change, which cachalot doesn't notice.
+    """
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    if apps.is_installed('cachalot'):
+        from cachalot.api import invalidate
+
+        invalidate(models.TranslatedWork)
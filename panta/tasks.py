@@ -5,6 +5,9 @@ from misc.apis import SlackClient
 
 from . import models
 from .api.external import QuotaExceeded
+from .constants import BLANK
+from .export import WorkExport
+from .partitions import HistoryPartitioning
 
 
 @app.task
@@ -37,3 +40,37 @@ def translate_segment_with_deepl():
     else:
         # Trigger translation of next segment with a two minutes delay
         translate_segment_with_deepl.apply_async(countdown=120)
+
+
+@app.task
+def create_segment_event_partitions(months=3):
+    """
+    Creates the partitions of the segment event log for the next months.
+
+    Should be scheduled at least once a month.
+    """
+    return models.SegmentEvent.create_partitions(months=months)
+
+
+@app.task
+def create_history_partitions(months=3):
+    """
+    Creates the partitions of the historical records for the next months.
+
+    Should be scheduled at least once a month.
+    """
+    partitioning = HistoryPartitioning()
+    if not partitioning.is_partitioned():
+        return 0
+    return partitioning.create_partitions(months=months)
+
+
+@app.task(soft_time_limit=600)
+def export_translated_work(work_id, format, originals=False, progress=BLANK):
+    """
+    Renders the export of the work if it doesn't exist and returns its path.
+    """
+    work = models.TranslatedWork.objects.select_related('original__author').get(
+        pk=work_id
+    )
+    return WorkExport(work, format, originals, progress).create()
@@ -1,5 +1,8 @@
 import datetime
+import gzip
+import json
 import random
+import tempfile
 from copy import deepcopy
 from unittest.mock import patch
 from urllib import parse
@@ -9,12 +12,13 @@ from rest_framework import test
 from base.constants import COMMENT_DELETION_DELAY, LANGUAGES_DICT, PERMISSIONS
 from base.tests import APITests
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import IntegrityError, connection, reset_queries
 from django.db.models import ProtectedError, Sum
 from django.test import TestCase, override_settings, tag
 from django.urls import NoReverseMatch, reverse
 from django.utils import timezone
-from panta import factories, management, models
+from panta import caching, factories, management, models
 from panta.api import serializers, views
 from panta.constants import (
     BLANK,
@@ -27,6 +31,7 @@ from panta.constants import (
     TRANSLATION_DONE,
     TRUSTEE_DONE,
 )
+from panta.export import WorkExport
 from path.factories import UserFactory
 from path.models import Reputation
 from white_estate.models import Class, Tag
@@ -469,6 +474,8 @@ class TranslatedWorkTests(APITests):
         cls.url_detail = cls.get_url('detail', cls.obj.pk)
 
     def setUp(self):
+        # The work cache isn't rolled back with the database
+        cache.clear()
         self.user = deepcopy(self._user)
         self.client.force_login(self.user)
 
@@ -484,7 +491,8 @@ class TranslatedWorkTests(APITests):
         request = self.factory.get(self.url_list)
         list_view = views.TranslatedWorkViewSet.as_view({'get': 'list'})
         res = list_view(request)
-        with self.assertNumQueries(7):
+        # The catalogue is cached
+        with self.assertNumQueries(1):
             res = self.client.get(self.url_list, {'ordering': '-title'})
         results = res.json()['results']
         self.assertEqual(len(results), 2)
@@ -695,6 +703,96 @@ class TranslatedWorkTests(APITests):
             f'{self.url_detail}segments/?limit=2&position=1',
         )
 
+    def test_cache(self):
+        other = models.TranslatedWork.objects.exclude(pk=self.obj.pk).get()
+        res = self.client.get(self.url_detail)
+        self.assertEqual(res.json()['statistics']['translationDone'], 0)
+        versions = caching.get_versions([self.obj.pk, other.pk])
+
+        segment = self.obj.segments.get(position=2)
+        segment.content = 'Translation'
+        segment.progress = TRANSLATION_DONE
+        segment.save_without_historical_record()
+        self.assertEqual(models.ImportantHeading.update(), 1)
+        models.WorkStatistics.update()
+        # Nothing to write anymore
+        self.assertEqual(models.ImportantHeading.update(), 0)
+
+        # Only the changed work lost its cache
+        new_versions = caching.get_versions([self.obj.pk, other.pk])
+        self.assertNotEqual(new_versions[self.obj.pk], versions[self.obj.pk])
+        self.assertEqual(new_versions[other.pk], versions[other.pk])
+        res = self.client.get(self.url_detail)
+        self.assertEqual(res.json()['statistics']['translationDone'], 1)
+
+    def test_cache_author_and_tags(self):
+        tag = factories.TagFactory()
+        self.owork.tags.add(tag)
+        self.client.get(self.url_detail)
+
+        author = self.owork.author
+        author.name = 'Renamed author'
+        author.save()
+        res = self.client.get(self.url_detail)
+        self.assertEqual(res.json()['author'], 'Renamed author')
+
+        tag.name = 'renamed-tag'
+        tag.save()
+        res = self.client.get(self.url_detail)
+        self.assertEqual(res.json()['tags'], ['renamed-tag'])
+
+    def test_catalogue(self):
+        params = {'language': 'de', 'ordering': '-title'}
+        res = self.client.get(self.url_list, params)
+        self.assertEqual(res.json()['count'], 1)
+        self.assertEqual(res.json()['results'][0]['id'], self.obj.pk)
+
+        # Changes of works invalidate it
+        work = factories.TranslatedWorkFactory(
+            title='z', language='de', original=self.owork
+        )
+        res = self.client.get(self.url_list, params)
+        results = res.json()['results']
+        self.assertEqual([w['id'] for w in results], [work.pk, self.obj.pk])
+        res = self.client.get(self.url_list, {'ordering': 'abbreviation'})
+        self.assertEqual(
+            [w['id'] for w in res.json()['results']],
+            list(
+                models.TranslatedWork.objects.order_by(
+                    'abbreviation'
+                ).values_list('pk', flat=True)
+            ),
+        )
+
+        # Other filters query the database (with cached works)
+        with self.assertNumQueries(3):
+            res = self.client.get(self.url_list, {'type': 'book'})
+        self.assertEqual(res.json()['count'], 2)
+
+    def test_catalogue_rebuilt_once(self):
+        params = {'language': 'de'}
+        self.client.get(self.url_list, params)
+        factories.TranslatedWorkFactory(language='de', original=self.owork)
+        # Another process rebuilds the catalogue
+        version = cache.get(caching.CATALOGUE_VERSION_KEY)
+        lock_key = f'{caching.get_catalogue_key("de", version)}_lock'
+        cache.add(lock_key, True)
+        res = self.client.get(self.url_list, params)
+        self.assertEqual(res.json()['count'], 1)
+
+        cache.delete(lock_key)
+        res = self.client.get(self.url_list, params)
+        self.assertEqual(res.json()['count'], 2)
+
+    def test_filters_endpoint_gzip(self):
+        url = reverse('work_filters')
+        expected = self.client.get(url, {'language': 'de'}).json()
+        res = self.client.get(
+            url, {'language': 'de'}, HTTP_ACCEPT_ENCODING='gzip, br'
+        )
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(res.content)), expected)
+
     # Filters
 
     def test_filters(self):
@@ -800,7 +898,11 @@ class TranslatedWorkTests(APITests):
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0]['abbreviation'], 'MLB')
 
+        # Prefix
         res = self.client.get(self.url_list, {'search': 'ml'})
+        self.assertEqual(len(res.json()['results']), 2)
+
+        res = self.client.get(self.url_list, {'search': 'mlx'})
         self.assertEqual(len(res.json()['results']), 0)
 
     def test_search_translated_title(self):
@@ -815,6 +917,89 @@ class TranslatedWorkTests(APITests):
         models.TranslatedWork.objects.filter(pk=self.obj.pk).update(title='၂၈')
         res = self.client.get(self.url_list, {'search': '၂၈'})
         self.assertEqual(len(res.json()['results']), 1)
+        # Words with combining marks
+        for title in ('မြန်မာ', 'हिन्दी'):
+            models.TranslatedWork.objects.filter(pk=self.obj.pk).update(
+                title=title
+            )
+            res = self.client.get(self.url_list, {'search': title})
+            self.assertEqual(len(res.json()['results']), 1)
+
+    def test_search_terms(self):
+        res = self.client.get(self.url_list, {'search': 'LOV, bo'})
+        self.assertEqual(len(res.json()['results']), 1)
+        res = self.client.get(self.url_list, {'search': 'lovely bag'})
+        self.assertEqual(len(res.json()['results']), 0)
+        res = self.client.get(self.url_list, {'search': ' &!:* '})
+        self.assertEqual(len(res.json()['results']), 0)
+
+    def test_search_tags_and_author(self):
+        tag = factories.TagFactory(name='Devotional', slug='devotional')
+        self.owork.tags.add(tag)
+        res = self.client.get(self.url_list, {'search': 'devot'})
+        self.assertEqual(len(res.json()['results']), 2)
+
+        tag.name = 'Prophecy'
+        tag.save()
+        res = self.client.get(self.url_list, {'search': 'devot'})
+        self.assertEqual(len(res.json()['results']), 0)
+        res = self.client.get(self.url_list, {'search': 'proph'})
+        self.assertEqual(len(res.json()['results']), 2)
+
+        self.obj.tags.add(factories.TagFactory(name='Youth', slug='youth'))
+        res = self.client.get(self.url_list, {'search': 'youth'})
+        self.assertEqual(len(res.json()['results']), 1)
+
+        author = self.owork.author
+        author.last_name = 'Whitfieldson'
+        author.save()
+        res = self.client.get(self.url_list, {'search': 'whitfield'})
+        self.assertEqual(len(res.json()['results']), 2)
+
+    @patch('panta.tasks.export_translated_work.apply_async')
+    def test_export(self, task):
+        url = self.get_url('export', pk=self.obj.pk, file_format='json')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(SENDFILE_ROOT=directory):
+                res = self.client.get(url, {'progress': TRANSLATION_DONE})
+                self.assertEqual(res.status_code, 202)
+                task.assert_called_once_with(
+                    (self.obj.pk, 'json'),
+                    {'originals': False, 'progress': TRANSLATION_DONE},
+                )
+                # The job is queued once
+                res = self.client.get(url, {'progress': TRANSLATION_DONE})
+                self.assertEqual(res.status_code, 202)
+                self.assertEqual(task.call_count, 1)
+
+                export = WorkExport(self.obj, 'json', progress=TRANSLATION_DONE)
+                export.create()
+                res = self.client.get(url, {'progress': TRANSLATION_DONE})
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(
+                    res['Content-Disposition'],
+                    'attachment; filename="MLB_de.json"',
+                )
+                data = json.loads(b''.join(res.streaming_content))
+                self.assertEqual(data['segments'], [])
+
+        res = self.client.get(url, {'progress': 9})
+        self.assertEqual(res.status_code, 400)
+        url = self.get_url('detail', self.obj.pk) + 'export/pdf/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @patch('panta.tasks.export_translated_work.apply_async')
+    def test_export_permissions(self, task):
+        url = self.get_url('export', pk=self.obj.pk, file_format='html')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.client.force_login(self.user)
+        models.TranslatedWork.objects.filter(pk=self.obj.pk).update(
+            private=True
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+        task.assert_not_called()
 
     # Other
 
@@ -932,6 +1117,15 @@ class TranslatedSegmentSwitchedTests(APITests):
         self.assertEqual(res.json(), self.get_response())
         self.assertIsNone(self.segment_1.locked_by)
 
+    def test_query_budget(self):
+        self.segment_1.locked_by = self.user
+        self.segment_1.content = 'Translation'
+        self.segment_1.save()
+        factories.VoteFactory(segment=self.segment_1)
+        with self.assertQueryBudget('translatedwork-switched-segments', 'POST'):
+            res = self.client.post(self.url, self.data)
+        self.assertEqual(res.status_code, 200)
+
     def test_no_current_segment(self):
         self.segment_1.locked_by = self.user
         self.segment_1.save_without_historical_record()
@@ -1210,6 +1404,50 @@ class TranslatedSegmentTests(APITests):
         data['statistics']['lastEdited'] = None
         self.assertEqual(res.json()['results'][0], data)
 
+    def test_list_equals_retrieve(self):
+        # The list serializer builds the dicts itself
+        self.obj.locked_by = self.user_2
+        self.obj.save()
+        for position in (2, 3):
+            factories.TranslatedSegmentFactory(
+                work=self.work,
+                original=factories.OriginalSegmentFactory(
+                    work=self.original_work, position=position
+                ),
+                locked_by=self.user_2 if position == 2 else None,
+            )
+        base_translation = factories.BaseTranslationFactory(language='tr')
+        for segment in models.TranslatedSegment.objects.filter(
+            work=self.work, position__lte=2
+        ):
+            factories.BaseTranslationSegmentFactory(
+                original_id=segment.original_id, translation=base_translation
+            )
+        factories.SegmentCommentFactory(work=self.work, position=2)
+
+        res = self.client.get(self.url_list)
+        results = res.json()['results']
+        self.assertEqual(len(results), 3)
+        for data in results:
+            url = self.get_url('detail', self.work.pk, data['position'])
+            expected = self.client.get(url).json()
+            self.assertEqual(list(data), list(expected))
+            self.assertEqual(data, expected)
+
+    def test_list_without_chapter(self):
+        self.assertIsNone(self.obj.chapter_id)
+        segments = models.TranslatedSegment.objects.filter(
+            pk=self.obj.pk
+        ).for_response(self.work.pk, self.user)
+        serializer = serializers.LeanTranslatedSegmentSerializer(
+            segments, many=True
+        )
+        # Like outside of tests
+        serializer.child.fields['chapter'].allow_null = False
+        data, = serializer.data
+        fields = serializers.LeanTranslatedSegmentSerializer.Meta.fields
+        self.assertEqual(list(data), [f for f in fields if f != 'chapter'])
+
     def test_retrieve(self):
         with self.assertNumQueries(4):
             res = self.client.get(self.url_detail)
@@ -1677,6 +1915,19 @@ class TranslatedSegmentTests(APITests):
         self.assertFalse(self.obj.votes.exists())
         self.assertEqual(self.record.votes.count(), 1)
 
+    @patch('panta.models.TranslatedSegment.can_edit', lambda s, r: True)
+    def test_edit_query_budget(self):
+        # Releasing moves the votes to the history (the most queries)
+        self.obj.progress = RELEASED
+        self.obj.save_without_historical_record()
+        self.create_vote()
+        with self.assertQueryBudget('translatedsegment-detail', 'PATCH'):
+            res = self.client.patch(
+                self.url_detail,
+                {'content': 'new', 'lastModified': self.obj.last_modified},
+            )
+        self.assertEqual(res.status_code, 200)
+
     def test_successive_spaces_are_removed(self):
         res = self.client.patch(
             self.url_detail,
@@ -2055,6 +2306,42 @@ class TranslatedSegmentTests(APITests):
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0]['id'], segment_2.pk)
 
+    def test_after(self):
+        relations = {
+            'work_id': self.obj.work_id,
+            'original_id': self.obj.original_id,
+        }
+        segment_2 = factories.TranslatedSegmentFactory(position=5, **relations)
+        segment_3 = factories.TranslatedSegmentFactory(position=9, **relations)
+        res = self.client.get(self.url_list, {'after': 1, 'size': 1})
+        data = res.json()
+        self.assertEqual([s['id'] for s in data['results']], [segment_2.pk])
+        res = self.client.get(data['next'])
+        data = res.json()
+        self.assertEqual([s['id'] for s in data['results']], [segment_3.pk])
+        self.assertIsNone(data['next'])
+
+        res = self.client.get(self.url_list, {'after': -1})
+        self.assertEqual(res.status_code, 400)
+
+    def test_stream(self):
+        segment_2 = factories.TranslatedSegmentFactory(
+            position=2, work=self.obj.work, original=self.obj.original
+        )
+
+        def get_lines(url, params=None):
+            res = self.client.get(url, params)
+            self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+            content = b''.join(res.streaming_content)
+            return [json.loads(line) for line in content.splitlines()]
+
+        lines = get_lines(self.url_list, {'format': 'ndjson', 'size': 1})
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['id'], self.obj.pk)
+        self.assertIn('lastModified', lines[0])
+        lines = get_lines(lines[1]['next'])
+        self.assertEqual([line['id'] for line in lines], [segment_2.pk])
+
     # Query parameters
 
     def test_get_segments_since_date_content(self):
@@ -2215,6 +2502,17 @@ class TranslatedSegmentTests(APITests):
             self.obj.history.latest().history_user_id, self.user.pk
         )
 
+    def test_restore_query_budget(self):
+        self.set_reputation('restore_translation')
+        self.record.votes.add(factories.VoteFactory(role='translator'))
+        self.obj.content = 'change'
+        self.obj.save()  # 2
+        factories.VoteFactory(segment=self.obj)
+        with self.assertQueryBudget('translatedsegment-restore', 'POST'):
+            res = self.client.post(self.url_restore, {'relativeId': 1})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['segment']['content'], self._obj.content)
+
     def test_restore_nothing_changed(self):
         res = self.client.post(self.url_restore, {'relativeId': 1})
         self.assertEqual(res.status_code, 200)
@@ -2669,6 +2967,114 @@ class SegmentsTests(APITests):
         self.assertEqual(res.json()['results'], self.data)
 
 
+class SegmentSearchTests(APITests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory()
+        cls.original = factories.OriginalSegmentFactory(
+            work__language='en',
+            content='The <em>righteous</em> shall live by faith.',
+        )
+        factories.OriginalSegmentFactory(
+            work=cls.original.work, position=2, content='Something else.'
+        )
+        cls.work = factories.TranslatedWorkFactory(
+            original=cls.original.work, language='de'
+        )
+        cls.segment = cls.work.segments.get(position=cls.original.position)
+        models.TranslatedSegment.objects.filter(pk=cls.segment.pk).update(
+            content='Der Gerechte wird aus <b>Glauben</b> leben.'
+        )
+        cls.url_originals = reverse('original_segment_search')
+        cls.url_translations = reverse('translated_segment_search')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, url, params, count=1):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200)
+        results = res.json()['results']
+        self.assertEqual(len(results), count)
+        return results
+
+    def test_login_required(self):
+        self.client.logout()
+        res = self.client.get(self.url_originals, {'text': 'faith'})
+        self.assertEqual(res.status_code, 401)
+
+    def test_words(self):
+        with self.assertNumQueries(3):
+            results = self.search(
+                self.url_originals, {'text': 'Lives righteous'}
+            )
+        snippet = results[0].pop('snippet')
+        self.assertEqual(
+            results,
+            [
+                {
+                    'id': self.original.pk,
+                    'work': self.original.work_id,
+                    'position': self.original.position,
+                    'reference': self.original.reference,
+                    'similarity': None,
+                }
+            ],
+        )
+        self.assertIn('<mark>righteous</mark>', snippet)
+        self.assertIn('<mark>live</mark>', snippet)
+        self.assertNotIn('<em>', snippet)
+        self.search(self.url_originals, {'text': 'righteous else'}, count=0)
+
+    def test_phrase(self):
+        params = {'text': 'live by faith', 'mode': 'phrase'}
+        self.search(self.url_originals, params)
+        params['text'] = 'faith by live'
+        self.search(self.url_originals, params, count=0)
+
+    def test_fuzzy(self):
+        params = {'text': 'shall liv by fath', 'mode': 'fuzzy'}
+        results = self.search(self.url_originals, params)
+        self.assertGreater(results[0]['similarity'], 0.6)
+        self.assertLess(results[0]['similarity'], 1)
+        params['text'] = 'completely different'
+        self.search(self.url_originals, params, count=0)
+
+    def test_translations(self):
+        res = self.client.get(self.url_translations, {'text': 'gerecht'})
+        self.assertEqual(res.status_code, 400)
+
+        params = {'text': 'gerecht glauben', 'language': 'de'}
+        results = self.search(self.url_translations, params)
+        self.assertEqual(results[0]['id'], self.segment.pk)
+        self.assertEqual(results[0]['original'], self.original.pk)
+        self.assertNotIn('<b>', results[0]['snippet'])
+        self.search(
+            self.url_translations,
+            dict(params, progress=IN_TRANSLATION),
+            count=0,
+        )
+        self.search(self.url_translations, dict(params, language='fr'), count=0)
+        self.search(self.url_translations, dict(params, work=self.work.pk))
+
+    def test_private_works(self):
+        models.TranslatedWork.objects.update(private=True)
+        params = {'text': 'glauben', 'language': 'de'}
+        self.search(self.url_translations, params, count=0)
+
+    def test_pagination(self):
+        factories.OriginalSegmentFactory(
+            work=self.original.work, position=3, content='Faith and faith.'
+        )
+        with patch.object(views.SegmentSearchPagination, 'page_size', 1):
+            res = self.client.get(self.url_originals, {'text': 'faith'})
+            data = res.json()
+            self.assertEqual(data['results'][0]['id'], self.original.pk)
+            res = self.client.get(data['next'])
+            self.assertEqual(len(res.json()['results']), 1)
+            self.assertIsNone(res.json()['next'])
+
+
 class VoteTests(APITests):
     basename = 'translatedsegment'
 
@@ -2728,6 +3134,11 @@ class VoteTests(APITests):
             },
         )
 
+    def test_query_budget(self):
+        with self.assertQueryBudget('translatedsegment-vote', 'POST'):
+            res = self.client.post(self.url, self.translator_vote)
+        self.assertEqual(res.status_code, 201)
+
     def test_permission_role_translator_set_to_plus_1(self):
         self.set_reputation('approve_translation', -1)
         res = self.client.post(self.url, self.translator_vote)
@@ -3718,14 +4129,46 @@ class TimelineTests(APITests):
             res = self.client.get(self.url)
         self.assertEqual(res.status_code, 200)
         response_json = res.json()
-        self.assertEqual(len(response_json), 4)
-        self.assertEqual(response_json, self.data)
+        self.assertIsNone(response_json['next'])
+        self.assertEqual(len(response_json['results']), 4)
+        self.assertEqual(response_json['results'], self.data)
+
+    @patch('panta.api.pagination.TimelinePagination.page_size', 1)
+    def test_most_recent_record_on_later_page(self):
+        models.Vote.objects.all().delete()
+        factories.SegmentCommentFactory(
+            work_id=self.comment.work_id, position=self.comment.position
+        )
+        res = self.client.get(self.url)
+        self.assertEqual(res.json()['results'][0]['type'], 'comment')
+        res = self.client.get(res.json()['next'])
+        record, = res.json()['results']
+        self.assertEqual(record['relativeId'], 2)
+        self.assertEqual(record['expires'], self.record_expires)
+
+    def test_query_budget(self):
+        segment = models.TranslatedSegment.objects.get(
+            work_id=self.comment.work_id, position=self.comment.position
+        )
+        for i in range(5):
+            user = UserFactory()
+            segment.content = f'Change {i}'
+            segment._history_user = user
+            segment.save()
+            factories.VoteFactory(user=user, segment=segment)
+            factories.SegmentCommentFactory(
+                work_id=segment.work_id, position=segment.position, user=user
+            )
+        with self.assertQueryBudget('timeline-list'):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(len(res.json()['results']), 4)
 
     def test_historical_votes_are_included(self):
         models.Vote.objects.update(segment=None)
         res = self.client.get(self.url)
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(len(res.json()), 4)
+        self.assertEqual(len(res.json()['results']), 4)
 
     def test_retrieve_without_votes(self):
         """
@@ -3737,7 +4180,7 @@ class TimelineTests(APITests):
         data = self.data[1:]
         data[0]['expires'] = self.record_expires
         data[0]['votes'] = []
-        self.assertEqual(res.json(), data)
+        self.assertEqual(res.json()['results'], data)
 
     def test_retrieve_no_objects(self):
         models.SegmentComment.objects.all().delete()
@@ -3745,7 +4188,7 @@ class TimelineTests(APITests):
         models.Vote.objects.all().delete()
         res = self.client.get(self.url)
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(res.json(), [])
+        self.assertEqual(res.json(), {'next': None, 'results': []})
 
     def test_deleted_comments_are_excluded(self):
         factories.SegmentCommentFactory(
@@ -3754,7 +4197,7 @@ class TimelineTests(APITests):
             to_delete=timezone.now(),
         )
         res = self.client.get(self.url)
-        self.assertEqual(res.json(), self.data)
+        self.assertEqual(res.json()['results'], self.data)
 
     def test_deleted_comments_are_visible_for_owner(self):
         now = timezone.now()
@@ -3765,7 +4208,7 @@ class TimelineTests(APITests):
             to_delete=now,
         )
         res = self.client.get(self.url)
-        response_json = res.json()
+        response_json = res.json()['results']
         self.assertEqual(len(response_json), 5)
         data = self.data.copy()
         data.insert(
@@ -3784,6 +4227,22 @@ class TimelineTests(APITests):
         )
         self.assertEqual(response_json, data)
 
+    @patch.object(views.TimelinePagination, 'page_size', 2)
+    def test_pagination(self):
+        with self.assertNumQueries(7):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        response_json = res.json()
+        self.assertEqual(response_json['results'], self.data[:2])
+        # Second page
+        res = self.client.get(response_json['next'])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'next': None, 'results': self.data[2:]})
+
+    def test_invalid_cursor(self):
+        res = self.client.get(self.url, {'cursor': 'invalid'})
+        self.assertEqual(res.status_code, 404)
+
 
 class SegmentCommentTests(APITests):
     basename = 'segmentcomment'
@@ -4354,21 +4813,79 @@ class LastActivitiesTests(APITests):
         )
         self.assertEqual(received, expected)
 
+    def test_last_activities_before(self):
+        before = self.votes[-1].date.isoformat()
+        res = self.client.get(self.url, {'before': before})
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertEqual(
+            [s['id'] for s in data['segments']], [self.segments[1].pk]
+        )
+        self.assertEqual(
+            [v['vote']['id'] for v in data['votes']], [self.votes[1].pk]
+        )
+        # The comments were created after the activities
+        self.assertEqual(data['comments'], [])
+
+        res = self.client.get(self.url, {'before': 'yesterday'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_last_activity_feed(self):
+        activities = models.LastActivity.objects.filter(
+            user=self.user_1, type=models.LastActivity.RECORD
+        )
+        self.assertEqual(
+            set(activities.values_list('segment', flat=True)),
+            {self.segments[1].pk, self.segments[3].pk},
+        )
+        # A newer edit replaces the last one of the chapter, an older doesn't
+        self.segments[0].add_to_history(
+            history_date=timezone.now(), history_user=self.user_1
+        )
+        self.segments[2].add_to_history(
+            history_date=timezone.now() - datetime.timedelta(days=10),
+            history_user=self.user_1,
+        )
+        self.assertEqual(
+            set(activities.values_list('segment', flat=True)),
+            {self.segments[0].pk, self.segments[3].pk},
+        )
+        data = self.client.get(self.url).json()
+        self.assertEqual(
+            [s['id'] for s in data['segments']],
+            [self.segments[0].pk, self.segments[3].pk],
+        )
+
     def test_segments(self):
         url = '{}?days=2'.format(self.get_url('segments'))
         with self.assertNumQueries(4):
             res = self.client.get(url)
-        data = res.json()
+        data = res.json()['results']
         self.assertEqual(len(data), 2)
         expected = tuple(segment.pk for segment in self.segments[:-3:-1])
         received = tuple(segment['id'] for segment in data)
         self.assertEqual(received, expected)
 
+    def test_segments_pagination(self):
+        url = self.get_url('segments')
+        res = self.client.get(url, {'limit': 2})
+        data = res.json()
+        self.assertEqual(
+            [s['id'] for s in data['results']],
+            [s.pk for s in self.segments[:0:-1][:2]],
+        )
+        res = self.client.get(data['next'])
+        data = res.json()
+        self.assertEqual(
+            [s['id'] for s in data['results']], [self.segments[1].pk]
+        )
+        self.assertIsNone(data['next'])
+
     def test_votes(self):
         url = '{}?days=2'.format(self.get_url('votes'))
         with self.assertNumQueries(6):
             res = self.client.get(url)
-        data = res.json()
+        data = res.json()['results']
         self.assertEqual(len(data), 2)
         expected = tuple(
             (vote.pk, segment.pk)
@@ -4383,7 +4900,7 @@ class LastActivitiesTests(APITests):
         url = '{}?days=2'.format(self.get_url('comments'))
         with self.assertNumQueries(11):
             res = self.client.get(url)
-        data = res.json()
+        data = res.json()['results']
         self.assertEqual(len(data), 3)
         expected = tuple(
             (comment.pk, segment.pk)
@@ -0,0 +1,46 @@
+from django.test import TestCase, tag  # noqa: F401
+from panta import benchmarks, models
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.corpus = benchmarks.Corpus(
+            works=2, segments=30, history=2, votes=2, users=3
+        )
+        cls.counts = cls.corpus.create()
+
+    def test_corpus(self):
+        self.assertEqual(
+            self.counts,
+            {
+                'users': 3,
+                'works': 2,
+                'segments': 60,
+                'historical_records': 120,
+                'votes': 120,
+            },
+        )
+        self.assertEqual(models.TranslatedSegment.history.count(), 120)
+        record = models.TranslatedSegment.history.latest('history_date')
+        self.assertEqual(record.relative_id, 2)
+        self.assertEqual(record.content, record.history_relation.content)
+        self.assertFalse(
+            models.TranslatedSegment.objects.filter(content='').exists()
+        )
+
+    def test_run(self):
+        benchmark = benchmarks.Benchmark(self.corpus, iterations=2)
+        report = benchmark.run(list(benchmarks.SCENARIOS))
+        self.assertEqual(report['corpus']['segments'], 60)
+        self.assertEqual(set(report['scenarios']), set(benchmarks.SCENARIOS))
+        for result in report['scenarios'].values():
+            self.assertEqual(result['iterations'], 2)
+            self.assertLessEqual(result['p50'], result['p95'])
+            self.assertGreater(result['queries'], 0)
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(benchmarks.percentile(values, 50), 3)
+        self.assertEqual(benchmarks.percentile(values, 95), 5)
+        self.assertEqual(benchmarks.percentile([1], 95), 1)
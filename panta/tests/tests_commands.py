@@ -78,11 +78,15 @@ class UnlockSegmentsTests(TestCase):
 class UpdateDBCacheTests(SimpleTestCase):
     @patch('panta.models.ImportantHeading.update')
     @patch('panta.models.WorkStatistics.update')
-    def test(self, update_statistics, update_headings):
+    @patch('panta.management.commands.update_db_cache.update_catalogues')
+    def test(self, update_catalogues, update_statistics, update_headings):
         update_headings.return_value = 10
         update_statistics.return_value = 5
+        update_catalogues.return_value = 3
         out = StringIO()
         call_command('update_db_cache', stdout=out)
         self.assertIn('Updated 10 headings and 5 statistics.', out.getvalue())
+        self.assertIn('3 catalogues are up to date.', out.getvalue())
         update_headings.assert_called_once_with()
         update_statistics.assert_called_once_with()
+        update_catalogues.assert_called_once_with()
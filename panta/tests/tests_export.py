@@ -0,0 +1,107 @@
+import datetime
+import json
+import os
+import tempfile
+import zipfile
+
+import lxml.etree
+
+from django.test import TestCase, override_settings, tag  # noqa: F401
+from django.utils import timezone
+from panta import factories, models
+from panta.constants import TRANSLATION_DONE
+from panta.export import WorkExport
+
+
+class WorkExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        original = factories.OriginalWorkFactory(
+            segments='h1 p hr p', language='en'
+        )
+        cls.work = factories.TranslatedWorkFactory(
+            title='Das Buch',
+            abbreviation='DB',
+            language='de',
+            original=original,
+            trustee=original.trustee,
+        )
+        segments = models.TranslatedSegment.objects.filter(work=cls.work)
+        segments.filter(position=1).update(
+            content='Kapitel <em>eins</em>', progress=TRANSLATION_DONE
+        )
+        segments.filter(position=2).update(
+            content='Ein Absatz.', progress=TRANSLATION_DONE
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SENDFILE_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_json(self):
+        path = WorkExport(self.work, 'json').create()
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data['work']['title'], 'Das Buch')
+        self.assertEqual(
+            [s['position'] for s in data['segments']], [1, 2, 3, 4]
+        )
+        self.assertEqual(
+            data['segments'][0]['content'], 'Kapitel <em>eins</em>'
+        )
+        self.assertNotIn('original', data['segments'][0])
+
+        export = WorkExport(
+            self.work, 'json', originals=True, progress=TRANSLATION_DONE
+        )
+        with open(export.create()) as f:
+            data = json.load(f)
+        self.assertEqual([s['position'] for s in data['segments']], [1, 2])
+        original = self.work.original.segments.get(position=2)
+        self.assertEqual(data['segments'][1]['original'], original.content)
+
+    def test_html(self):
+        export = WorkExport(self.work, 'html', originals=True)
+        with open(export.create(), encoding='utf-8') as f:
+            document = f.read()
+        self.assertIn('<title>Das Buch</title>', document)
+        self.assertIn('<h1>Kapitel <em>eins</em></h1></div>', document)
+        self.assertIn('<div class="row"><h1 lang="en">', document)
+        self.assertIn('<hr lang="en"><hr></div>', document)
+        self.assertEqual(export.filename, 'DB_de.html')
+
+    def test_epub(self):
+        path = WorkExport(self.work, 'epub').create()
+        with zipfile.ZipFile(path) as archive:
+            mimetype = archive.infolist()[0]
+            self.assertEqual(mimetype.filename, 'mimetype')
+            self.assertEqual(mimetype.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.read(mimetype), b'application/epub+zip')
+            text = lxml.etree.fromstring(archive.read('EPUB/text.xhtml'))
+            navigation = archive.read('EPUB/nav.xhtml').decode()
+            lxml.etree.fromstring(archive.read('EPUB/content.opf'))
+        namespaces = {'x': 'http://www.w3.org/1999/xhtml'}
+        heading = text.find('.//x:h1', namespaces)
+        self.assertEqual(heading.get('id'), 'p1')
+        self.assertEqual(len(text.findall('.//x:hr', namespaces)), 1)
+        self.assertIn('<a href="text.xhtml#p1">Kapitel eins</a>', navigation)
+
+    def test_versions(self):
+        export = WorkExport(self.work, 'json')
+        path = export.create()
+        self.assertTrue(export.exists())
+        self.assertEqual(WorkExport(self.work, 'json').create(), path)
+        other = WorkExport(self.work, 'html').create()
+
+        date = timezone.now() + datetime.timedelta(minutes=1)
+        self.work.segments.filter(position=2).update(last_modified=date)
+        export = WorkExport(self.work, 'json')
+        self.assertFalse(export.exists())
+        new_path = export.create()
+        self.assertNotEqual(new_path, path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(other))
+        self.assertEqual(len(os.listdir(export.directory)), 2)
@@ -7,6 +7,7 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.test import SimpleTestCase, TestCase, override_settings, tag
 from django.utils import timezone
+from django_celery_beat.models import PeriodicTask
 from panta import factories, models
 from panta.constants import (
     BLANK,
@@ -349,6 +350,17 @@ class TranslatedSegmentTests(TestCase):
         )
         cls.vote = factories.VoteFactory(segment=cls.obj)
 
+    def test_search_vector_deferred(self):
+        segment = self.obj.work.segments.get(pk=self.obj.pk)
+        self.assertEqual(segment.get_deferred_fields(), {'search_vector'})
+        original = models.OriginalSegment.objects.get(pk=self.original.pk)
+        self.assertEqual(original.get_deferred_fields(), {'search_vector'})
+
+        segment.content = 'Changed'
+        segment.save()
+        segment.refresh_from_db()
+        self.assertEqual(segment.content, 'Changed')
+
     def test_create_and_update_same_instance_with_progress_released(self):
         segment = factories.TranslatedSegmentFactory(
             progress=RELEASED, work=self.obj.work, original=self.original
@@ -743,6 +755,74 @@ class HistoricalTranslatedSegmentTests(TestCase):
         )
 
 
+class SegmentEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory()
+        cls.segment = factories.TranslatedSegmentFactory()
+        cls.segment.content = 'Changed'
+        cls.segment._history_user = cls.user
+        cls.segment.save()
+        cls.vote = factories.VoteFactory(user=cls.user, segment=cls.segment)
+        cls.comment = factories.SegmentCommentFactory(
+            work_id=cls.segment.work_id, position=cls.segment.position
+        )
+
+    def test_events_are_appended(self):
+        records = self.segment.history.order_by('-history_date')
+        self.assertEqual(
+            list(
+                models.SegmentEvent.objects.timeline(self.segment).values_list(
+                    'type', 'object_id', 'work_id', 'user_id'
+                )
+            ),
+            [
+                (
+                    'comment',
+                    self.comment.pk,
+                    self.segment.work_id,
+                    self.comment.user_id,
+                ),
+                ('vote', self.vote.pk, self.segment.work_id, self.user.pk),
+                ('record', records[0].pk, self.segment.work_id, self.user.pk),
+                ('record', records[1].pk, self.segment.work_id, None),
+            ],
+        )
+
+    def test_deleted_objects_keep_their_events(self):
+        models.SegmentComment.objects.all().delete()
+        self.assertEqual(self.segment.events.count(), 4)
+        self.assertEqual(
+            self.segment.get_timeline_objects(
+                self.segment.get_timeline_entries(), self.user
+            )[0],
+            ('vote', self.vote),
+        )
+
+    def test_timeline_before(self):
+        entries = self.segment.get_timeline_entries(limit=2)
+        self.assertEqual([e[0] for e in entries], ['comment', 'vote'])
+        entries = self.segment.get_timeline_entries(before=entries[-1])
+        self.assertEqual([e[0] for e in entries], ['record', 'record'])
+
+    def test_contributors(self):
+        self.assertEqual(
+            list(models.SegmentEvent.objects.contributors()),
+            [{'user_id': self.user.pk}],
+        )
+
+    def test_create_partitions(self):
+        start = timezone.now().date().replace(year=2100)
+        self.assertEqual(models.SegmentEvent.create_partitions(start, 2), 2)
+        self.assertEqual(models.SegmentEvent.create_partitions(start, 3), 1)
+
+    def test_create_partitions_scheduled(self):
+        task = PeriodicTask.objects.get(
+            task='panta.tasks.create_segment_event_partitions'
+        )
+        self.assertTrue(task.enabled)
+
+
 class VoteTests(SimpleTestCase):
     def test__str__(self):
         vote = models.Vote(value=1)
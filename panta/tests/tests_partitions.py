@@ -0,0 +1,121 @@
+import datetime
+import os
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, tag  # noqa: F401
+from django.utils import timezone
+from django_celery_beat.models import PeriodicTask
+from panta import factories, models
+from panta.partitions import HistoryPartitioning
+from path.factories import UserFactory
+
+
+class HistoryPartitioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.partitioning = HistoryPartitioning()
+        cls.partitioning.create_partitions(datetime.date(2019, 1, 1), 1)
+        cls.user = UserFactory()
+        cls.segment = factories.TranslatedSegmentFactory()
+        cls.segment.content = 'Changed'
+        cls.segment._history_user = cls.user
+        cls.segment.save()
+        cls.history = models.TranslatedSegment.history.all()
+        cls.records = cls.history.count()
+        cls.history.update(
+            history_date=datetime.datetime(2019, 1, 15, tzinfo=timezone.utc)
+        )
+
+    def test_records_are_partitioned(self):
+        self.assertTrue(self.partitioning.is_partitioned())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT DISTINCT tableoid::regclass::text '
+                f'FROM {self.partitioning.table}'
+            )
+            self.assertEqual(
+                cursor.fetchall(),
+                [('panta_historicaltranslatedsegment_2019_01',)],
+            )
+
+    def test_create_partitions(self):
+        created = self.partitioning.create_partitions(
+            datetime.date(2019, 1, 20), 2
+        )
+        self.assertEqual(created, 1)
+        self.assertIn(
+            (
+                'panta_historicaltranslatedsegment_2019_02',
+                datetime.date(2019, 2, 1),
+            ),
+            self.partitioning.get_partitions(),
+        )
+
+    def test_create_partitions_scheduled(self):
+        task = PeriodicTask.objects.get(
+            task='panta.tasks.create_history_partitions'
+        )
+        self.assertTrue(task.enabled)
+
+    def test_archive_and_restore(self):
+        # Pending checks of deferred foreign keys prevent detaching
+        connection.check_constraints()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = self.partitioning.archive(
+                datetime.date(2019, 1, 31), directory
+            )
+            self.assertEqual(paths, [])
+
+            paths = self.partitioning.archive(
+                datetime.date(2019, 2, 1), directory
+            )
+            self.assertEqual(
+                paths,
+                [
+                    os.path.join(
+                        directory,
+                        'panta_historicaltranslatedsegment_2019_01.copy.gz',
+                    )
+                ],
+            )
+            self.assertFalse(self.history.exists())
+            # Archived records still count as contributions
+            self.assertEqual(self.user.contributions.get().edits, 1)
+
+            self.partitioning.restore(paths[0])
+            self.assertEqual(self.history.count(), self.records)
+            self.assertEqual(
+                self.segment.history.latest().history_user, self.user
+            )
+
+    def test_save_after_archive(self):
+        records = self.segment.history.count()
+        connection.check_constraints()
+        with tempfile.TemporaryDirectory() as directory:
+            path, = self.partitioning.archive(
+                datetime.date(2019, 2, 1), directory
+            )
+            # The timeline leaves the archived records out
+            self.assertEqual(self.segment.get_timeline_entries(), [])
+
+            self.segment.content = 'Changed after archiving'
+            self.segment.save()
+            record = self.segment.history.get()
+            self.assertEqual(record.relative_id, records + 1)
+            self.assertEqual(
+                self.segment.get_timeline_entries(),
+                [('record', record.pk, record.history_date)],
+            )
+
+            self.partitioning.restore(path)
+            self.assertEqual(
+                sorted(
+                    self.segment.history.values_list('relative_id', flat=True)
+                ),
+                list(range(1, records + 2)),
+            )
+
+    def test_restore_invalid_file(self):
+        with self.assertRaisesMessage(ValueError, 'no archived partition'):
+            self.partitioning.restore('/tmp/panta_segmentevent.copy.gz')
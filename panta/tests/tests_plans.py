@@ -0,0 +1,129 @@
+import datetime
+
+from django.db import connection
+from django.test import TestCase, tag  # noqa: F401
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from panta import factories, models
+from path.factories import UserFactory
+
+# Tables of the hot queries which must not be scanned sequentially
+INDEXED_TABLES = (
+    'panta_translatedsegment',
+    'panta_historicaltranslatedsegment',
+    'panta_vote',
+    'panta_segmentcomment',
+    'panta_importantheading',
+    'panta_segmentevent',
+)
+
+
+def get_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from get_nodes(child)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Checks the plans of the hot queries on a realistic dataset.
+
+    Sequential scans are disabled for the EXPLAIN so that a plan falls back to
+    one only if no index is usable. The buffers (shared blocks hit or read)
+    of all queries have to stay within a budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = UserFactory.create_batch(2)
+        original = factories.OriginalWorkFactory(segments=400)
+        cls.work = factories.TranslatedWorkFactory(original=original)
+        factories.TranslatedWorkFactory(original=original)
+        now = timezone.now()
+        roles = ('translator', 'reviewer', 'trustee')
+        records, votes, comments = [], [], []
+        segments = models.TranslatedSegment.objects.order_by('pk')
+        for i, segment in enumerate(segments):
+            for relative_id, user in enumerate((cls.user, cls.other), 1):
+                date = now - datetime.timedelta(minutes=i * 2 + relative_id)
+                segment.add_to_history(
+                    history_date=date,
+                    history_user=user,
+                    relative_id=relative_id,
+                    add_to=records,
+                )
+                votes.append(
+                    models.Vote(
+                        segment=segment,
+                        user=user,
+                        role=roles[i % 3],
+                        value=1,
+                        date=date,
+                    )
+                )
+            comments.append(
+                models.SegmentComment(
+                    work_id=segment.work_id,
+                    position=segment.position,
+                    user=cls.other,
+                    role='translator',
+                    content='Comment',
+                    to_delete=now if i % 4 == 0 else None,
+                )
+            )
+        models.TranslatedSegment.history.bulk_create(records)
+        models.Vote.objects.bulk_create(votes)
+        models.SegmentComment.objects.bulk_create(comments)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {", ".join(INDEXED_TABLES)}')
+
+    def assertPlans(self, function, budget):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        statements = [
+            query['sql']
+            for query in context.captured_queries
+            if query['sql'].startswith(('SELECT', 'UPDATE'))
+        ]
+        self.assertTrue(statements)
+        buffers = 0
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for sql in statements:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0][0]['Plan']
+                scans = [
+                    node['Relation Name']
+                    for node in get_nodes(plan)
+                    if node['Node Type'] == 'Seq Scan'
+                    and node['Relation Name'].startswith(INDEXED_TABLES)
+                ]
+                self.assertEqual(scans, [], f'Sequential scan of {sql}')
+                buffers += (
+                    plan['Shared Hit Blocks'] + plan['Shared Read Blocks']
+                )
+            cursor.execute('RESET enable_seqscan')
+        self.assertLessEqual(buffers, budget)
+
+    def test_segments_for_response(self):
+        def get_segments():
+            segments = models.TranslatedSegment.objects.filter(
+                work=self.work, position__lte=50
+            )
+            list(segments.for_response(self.work.pk, self.user))
+
+        self.assertPlans(get_segments, 5000)
+
+    def test_last_activities(self):
+        self.client.force_login(self.user)
+        url = reverse('lastactivities-list')
+        self.assertPlans(lambda: self.client.get(url), 3000)
+
+    def test_update_important_headings(self):
+        headings = models.ImportantHeading.objects.filter(work=self.work)
+        self.assertPlans(lambda: models.ImportantHeading.update(headings), 3000)
+
+    def test_update_work_statistics(self):
+        statistics = models.WorkStatistics.objects.filter(work=self.work)
+        self.assertPlans(lambda: models.WorkStatistics.update(statistics), 2000)
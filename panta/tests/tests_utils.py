@@ -30,6 +30,7 @@ from panta.utils import (
     assign_progress,
     get_system_user,
     notify_users,
+    render_diffs,
     sanitize_content,
     sanitize_content_of_queryset,
 )
@@ -259,7 +260,33 @@ class NotifyUsersTests(TestCase):
             'me@example.com',
         )
 
-    # TODO test diff
+    @override_settings(DEFAULT_TO_EMAILS=('admin@example.com',))
+    @patch('panta.utils.MAILJET_BATCH_SIZE', 1)
+    def test_messages_are_sent_in_batches(self):
+        notify_users(sandbox=True)
+        self.assertEqual(len(self.outbox), 2)
+        for call in self.outbox:
+            self.assertEqual(len(call[3]['data']['Messages']), 1)
+
+
+class RenderDiffsTests(SimpleTestCase):
+    def test_render_diffs(self):
+        pairs = {('A b', 'A c'), ('Same', 'Same')}
+        diffs = render_diffs(pairs, processes=1)
+        self.assertEqual(
+            diffs,
+            {
+                ('A b', 'A c'): (
+                    '<p xmlns:diff="http://namespaces.shoobx.com/diff">'
+                    'A <del>b</del><ins>c</ins></p>\n'
+                ),
+                ('Same', 'Same'): '<p>Same</p>\n',
+            },
+        )
+        # Cached
+        with patch('panta.utils.render_diff') as render_diff:
+            self.assertEqual(render_diffs(pairs), diffs)
+        render_diff.assert_not_called()
 
 
 class SanitizeContentTests(SimpleTestCase):
@@ -1,7 +1,9 @@
-import functools
+import bisect
+import hashlib
 import json
-import operator
-from datetime import date, timedelta
+import multiprocessing
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
 
 import lxml.etree
 from docutils.utils.smartquotes import smartyPants
@@ -10,7 +12,9 @@ from xmldiff.main import diff_texts
 
 from base.constants import SYSTEM_USERS
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
 from frontend_urls import SEGMENT
 from langify.celery import app
 from misc.apis import MailjetClient
@@ -19,7 +23,6 @@ from . import models
 from .constants import (
     BLANK,
     CHANGE_REASONS,
-    IMPORTANT_HEADINGS,
     IN_REVIEW,
     IN_TRANSLATION,
     LANGUAGE_SPECIFIC_REPLACE,
@@ -98,138 +101,179 @@ def add_segments_to_deepl_queue(work, language):
     return {'added': len(segments), 'total': redis.llen(key)}
 
 
+NOTIFICATIONS_SQL = """
+    WITH record_vote AS (
+        SELECT r.id AS segment_id, r.history_date, r.content, v.user_id, v.date
+        FROM {history} r
+        JOIN {vote_records} vr ON vr.{record_column} = r.history_id
+        JOIN {vote} v ON v.id = vr.{vote_column}
+        JOIN {user} u ON u.id = v.user_id
+        WHERE r.history_date >= %(start)s AND r.history_date < %(end)s
+            AND u.subscribed_edits
+    )
+    SELECT DISTINCT ON (rv.user_id, rv.segment_id)
+        rv.user_id, rv.segment_id, rv.content
+    FROM record_vote rv
+    -- The user didn't vote again after the edit
+    WHERE NOT EXISTS (
+        SELECT 1 FROM record_vote o
+        WHERE o.segment_id = rv.segment_id AND o.user_id = rv.user_id
+            AND o.date > rv.date
+    ) AND NOT EXISTS (
+        SELECT 1 FROM {vote} c
+        WHERE c.segment_id = rv.segment_id AND c.user_id = rv.user_id
+            AND c.date > rv.date
+    )
+    ORDER BY rv.user_id, rv.segment_id, rv.history_date DESC
+"""
+
+# Messages per Mailjet API call (the maximum is 50)
+MAILJET_BATCH_SIZE = 50
+
+
+def get_notifications(day):
+    """
+    Returns (user ID, segment ID, content) of segments edited on given day.
+
+    The content is the one of the most recent historical record the user
+    voted for (and didn't vote for again).
+    """
+    vote_records = models.Vote._meta.get_field('historical_segments')
+    history = models.TranslatedSegment.history.model
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    sql = NOTIFICATIONS_SQL.format(
+        history=history._meta.db_table,
+        vote_records=vote_records.m2m_db_table(),
+        record_column=vote_records.m2m_reverse_name(),
+        vote_column=vote_records.m2m_column_name(),
+        vote=models.Vote._meta.db_table,
+        user=get_user_model()._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'start': start, 'end': start + timedelta(1)})
+        return cursor.fetchall()
+
+
+def render_diff(old, new):
+    """
+    Returns the HTML diff of two segment contents.
+    """
+    formatter = HTMLFormatter(
+        text_tags=('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'),
+        formatting_tags=('a', 'em', 'span', 'strong', 'sub', 'sup', 'u'),
+    )
+    p = '<p>{}</p>'  # Required to generate valid XML
+    return diff_texts(p.format(old), p.format(new), formatter=formatter)
+
+
+def render_diffs(pairs, processes=None):
+    """
+    Returns a dict of HTML diffs for given (old, new) pairs.
+
+    Diffs are cached and missing ones rendered by a process pool.
+    """
+    keys = {
+        pair: 'diff_{}'.format(
+            hashlib.md5(json.dumps(pair).encode()).hexdigest()
+        )
+        for pair in pairs
+    }
+    cached = cache.get_many(keys.values())
+    diffs = {pair: cached[key] for pair, key in keys.items() if key in cached}
+    missing = [pair for pair in keys if pair not in diffs]
+    if len(missing) > 1 and processes != 1:
+        with multiprocessing.Pool(processes) as pool:
+            rendered = pool.starmap(render_diff, missing)
+    else:
+        rendered = [render_diff(*pair) for pair in missing]
+    rendered = dict(zip(missing, rendered))
+    cache.set_many({keys[pair]: diff for pair, diff in rendered.items()})
+    diffs.update(rendered)
+    return diffs
+
+
 def notify_users(to=None, sandbox=False):
     """
     Notifies users about segments they voted and that have been edited recently.
 
     Uses Mailjet to send the e-mails. Considered edits are from yesterday.
     """
-    # Get all segments that were edited yesterday
-    records = (
-        models.TranslatedSegment.history.filter(
-            history_date__date=date.today() - timedelta(1)
-        )
-        .order_by('history_date')
-        .prefetch_related('votes__user')
-    )
+    notifications = get_notifications(date.today() - timedelta(1))
+    last_votes = defaultdict(dict)
+    for user_id, segment_id, content in notifications:
+        last_votes[user_id][segment_id] = content
 
-    # Get the newest votes of each user
-    newest_votes = {r.id: {} for r in records}
-    for record in records:
-        for vote in record.votes.all():
-            if vote.user.subscribed_edits:
-                newest_votes[record.id][vote.user_id] = vote.date
-    current_votes = models.Vote.objects.filter(
-        segment_id__in=records.values('id'), user__subscribed_edits=True
-    )
-    for vote in current_votes:
-        newest_votes[vote.segment_id][vote.user_id] = vote.date
-
-    # Find out if the user voted again
-    notify_users = {}
-    last_votes = {}
-    for record in records:
-        for vote in record.votes.all():
-            send = vote.user.subscribed_edits
-            if send and newest_votes[record.id][vote.user_id] == vote.date:
-                # The user didn't vote after the edit again
-                try:
-                    notify_users[vote.user_id].append(record.id)
-                except KeyError:
-                    notify_users[vote.user_id] = [record.id]
-
-                try:
-                    last_votes[vote.user_id][record.id] = record.content
-                except KeyError:
-                    last_votes[vote.user_id] = {record.id: record.content}
-
-    # Create the e-mail messages
-    users = get_user_model().objects.filter(pk__in=notify_users)
+    users = get_user_model().objects.filter(pk__in=last_votes)
     segments = (
-        models.TranslatedSegment.objects
-        # https://stackoverflow.com/a/45323085
-        .filter(
-            pk__in=functools.reduce(operator.iconcat, notify_users.values(), [])
+        models.TranslatedSegment.objects.filter(
+            pk__in={n[1] for n in notifications}
         )
         # Segments of the same chapter should be near each other in the e-mail
         .order_by('work', 'position').select_related('work')
     )
-    headings_qs = models.TranslatedSegment.objects.filter(
-        work_id__in=segments.values('work_id'), tag__in=IMPORTANT_HEADINGS[1:]
-    ).only('work_id', 'position')
-    headings = {}
-    for heading in headings_qs:
-        try:
-            headings[heading.work_id].append(heading.position)
-        except KeyError:
-            headings[heading.work_id] = [heading.position]
+    order = {segment.pk: i for i, segment in enumerate(segments)}
 
-    mailjet = MailjetClient()
-    formatter = HTMLFormatter(
-        text_tags=('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'),
-        formatting_tags=('a', 'em', 'span', 'strong', 'sub', 'sup', 'u'),
+    # First positions and numbers of the chapters of each work
+    chapters = defaultdict(lambda: ([], []))
+    headings = (
+        models.ImportantHeading.objects.filter(
+            work_id__in={s.work_id for s in segments}, number__isnull=False
+        )
+        .order_by('work_id', 'first_position')
+        .values_list('work_id', 'first_position', 'number')
     )
-    p = '<p>{}</p>'  # Required to generate valid XML
+    for work_id, first_position, number in headings:
+        chapters[work_id][0].append(first_position)
+        chapters[work_id][1].append(number)
+
+    diffs = render_diffs(
+        {(n[2], segments[order[n[1]]].content) for n in notifications}
+    )
+
+    mailjet = MailjetClient()
     url = 'https://www.ellen4all.org/{}'
-    segment_attrs = ('diff', 'reference', 'url', 'button')
+    # TODO Translate
+    subject = 'Edits of translations you voted for'
+    heading = 'List of edited texts'
+    introduction = (
+        'We are excited that people like you were diligent and reviewed '
+        'our translations! Below you find the texts that were edited '
+        'recently. Help us by coming over and vote for the edits!'
+    )
+    button = 'Open chapter {}'
+    unsubscribe_note = (
+        'You received this e-mail because you voted for translations on '
+        'Ellen4all.org. Therefore, we assume you want to get this '
+        'notification. If you do not want this type of e-mail '
+        'notification anymore, please reply to this message with a short '
+        'note saying so.'
+    )
     for user in users:
-        # TODO Translate
-        subject = 'Edits of translations you voted for'
-        heading = 'List of edited texts'
-        introduction = (
-            'We are excited that people like you were diligent and reviewed '
-            'our translations! Below you find the texts that were edited '
-            'recently. Help us by coming over and vote for the edits!'
-        )
-        button = 'Open chapter {}'
-        unsubscribe_note = (
-            'You received this e-mail because you voted for translations on '
-            'Ellen4all.org. Therefore, we assume you want to get this '
-            'notification. If you do not want this type of e-mail '
-            'notification anymore, please reply to this message with a short '
-            'note saying so.'
-        )
-
         works = {}
-        for segment in segments:
-            if segment.pk not in notify_users[user.pk]:
-                continue
-            segment.diff = diff_texts(
-                p.format(last_votes[user.pk][segment.pk]),
-                p.format(segment.content),
-                formatter=formatter,
+        for pk in sorted(last_votes[user.pk], key=order.get):
+            segment = segments[order[pk]]
+            positions, numbers = chapters[segment.work_id]
+            index = bisect.bisect_right(positions, segment.position) - 1
+            chapter = numbers[index] if index >= 0 else 1
+            works.setdefault(segment.work, []).append(
+                {
+                    'diff': diffs[(last_votes[user.pk][pk], segment.content)],
+                    'reference': segment.reference,
+                    'url': url.format(
+                        SEGMENT.format(
+                            work_language=segment.work.language,
+                            work_id=segment.work.pk,
+                            chapter=chapter,
+                            # TODO Use
+                            # 'segment.position - first_position' here
+                            position_in_chapter=1,
+                        )
+                    ),
+                    'button': button.format(chapter),
+                }
             )
-            chapter = 1
-            for i, position in enumerate(headings[segment.work_id], start=1):
-                if position > segment.position:
-                    break
-                chapter = i
-            segment.button = button.format(chapter)
-            segment.url = url.format(
-                SEGMENT.format(
-                    work_language=segment.work.language,
-                    work_id=segment.work.pk,
-                    # TODO Use 'ImportantHeading' here
-                    chapter=chapter,
-                    # TODO Use
-                    # 'segment.position - ImportantHeading.first_position' here
-                    position_in_chapter=1,
-                )
-            )
-            try:
-                works[segment.work].append(segment)
-            except KeyError:
-                works[segment.work] = [segment]
-
-        works = [
-            {
-                'title': w.title,
-                'segments': [
-                    {k: getattr(s, k) for k in segment_attrs} for s in ss
-                ],
-            }
-            for w, ss in works.items()
-        ]
+
+        works = [{'title': w.title, 'segments': ss} for w, ss in works.items()]
 
         mailjet.create_email(
             id=640_058,
@@ -242,8 +286,10 @@ def notify_users(to=None, sandbox=False):
                 'unsubscribe_note': unsubscribe_note,
             },
         )
+        if len(mailjet.messages) >= MAILJET_BATCH_SIZE:
+            mailjet.send(sandbox=sandbox)
 
-    # Send e-mails
+    # Send remaining e-mails
     if mailjet.messages:
         mailjet.send(sandbox=sandbox)
 
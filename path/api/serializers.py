@@ -1279,10 +1279,14 @@ class PersonalDataSerializer(UserRequestSerializer, PersonalDataBaseSerializer):
     def get_session(self, obj):
         return SessionSerializer(self.context['request'].session).data
 
+    @staticmethod
+    def get_historical_email_addresses(user):
+        return models.HistoricalEmailAddress.objects.filter(
+            Q(user_id=user.pk) | Q(history_user_id=user.pk)
+        )
+
     @swagger_serializer_method(HistoricalEmailAddressSerializer)
     def get_historicalemailaddresses(self, obj):
-        objects = models.HistoricalEmailAddress.objects.filter(
-            Q(user_id=obj.pk) | Q(history_user_id=obj.pk)
-        )
+        objects = self.get_historical_email_addresses(obj)
         serializer = HistoricalEmailAddressSerializer(objects, many=True)
         return serializer.data
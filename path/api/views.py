@@ -1,7 +1,3 @@
-import datetime
-import os
-import zipfile
-
 from allauth.account.adapter import get_adapter
 from allauth.account.models import EmailAddress
 from allauth.account.utils import user_pk_to_url_str
@@ -35,13 +31,17 @@ from sendfile import sendfile
 
 from django.conf import settings
 from django.contrib.auth import logout
+from django.core import signing
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db.models import Count
 from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from panta.api.permissions import FlagUserPermissions
-from path import models
+from path import models, tasks
+from path.export import EXPORT_TIME_LIMIT, PersonalDataExport
 
 from . import serializers
 
@@ -223,6 +223,10 @@ class ExportPersonalDataView(generics.CreateAPIView):
 
     Securely retrieves the authenticated user's personal data as zip file.
 
+    The file is created in the background and kept until the data changes.
+    Responses with a *202 Accepted* while it is created and sends a download
+    link to the user's e-mail address afterwards.
+
     Meets the needs of article 20 (1) GDPR concerning data of the database.
     See also recital 68 and (working paper) WP 242 rev.01 of the article 29
     data protection working party.
@@ -230,40 +234,74 @@ class ExportPersonalDataView(generics.CreateAPIView):
 
     serializer_class = serializers.PasswordUserSerializer
 
-    @swagger_auto_schema(responses={200: 'http://example.com'})
+    @swagger_auto_schema(
+        responses={
+            200: '*The zip file*',
+            202: '*The export is being created, an e-mail follows*',
+        }
+    )
     def create(self, request, *args, **kwargs):
         user = request.user
         # Check password
         serializer = self.get_serializer(user, data=request.data)
         serializer.is_valid(raise_exception=True)
-        # ZIP file
-        filename = 'ellen4all.org_{name}_{id}_{date}.{{ext}}'.format(
-            name=user.username,
-            id=user.public_id,
-            date=datetime.date.today().isoformat(),
-        )
-        path = os.path.join(settings.SENDFILE_ROOT, filename.format(ext='zip'))
-        info = _(
-            'Literary works and their translations are copyrighted by the '
-            'Ellen G. White Estate®. You shall not adversely affect the '
-            'rights and freedoms of the Ellen G. White Estate® or others '
-            '(see article 20 (4) GDPR).'
+        export = PersonalDataExport(user)
+        if export.exists():
+            # Secure download
+            return sendfile(
+                request,
+                export.path,
+                attachment=True,
+                attachment_filename=export.filename,
+                mimetype='application/zip',
+            )
+        # Only one job per export
+        key = f'personal_data_export_{export.path}'
+        if cache.add(key, True, EXPORT_TIME_LIMIT):
+            url = request.build_absolute_uri(reverse('export_personal_data'))
+            tasks.export_personal_data.apply_async(
+                (user.pk, request.session.session_key, url)
+            )
+        return Response(
+            {
+                'detail': _(
+                    'Your data is being exported. We will send you an e-mail '
+                    'when it is ready.'
+                )
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
+
+
+class DownloadPersonalDataView(APIView):
+    """
+    Download exported data
+
+    Downloads the zip file of the personal data with the token of the link
+    sent by e-mail. The user who requested the export has to be logged in.
+    Links expire after a week or when a newer export of changed data
+    replaces the file.
+    """
+
+    @swagger_auto_schema(responses={200: '*The zip file*'})
+    def get(self, request, token):
         try:
-            with zipfile.ZipFile(path, 'x', zipfile.ZIP_DEFLATED) as f:
-                ctx = {'request': request}
-                data = self.get_renderers()[0].render(
-                    serializers.PersonalDataSerializer(user, context=ctx).data
-                )
-                obj = b'{"info":"%(info)s","data":%(data)s}' % {
-                    b'info': info.encode(),
-                    b'data': data,
-                }
-                f.writestr(filename.format(ext='json'), obj)
-        except FileExistsError:
-            pass
-        # Secure download
-        return sendfile(request, path)
+            export = PersonalDataExport.from_token(token)
+        except (signing.BadSignature, models.User.DoesNotExist):
+            raise NotFound()
+        if export.user != request.user:
+            raise NotFound()
+        if not export.exists():
+            raise NotFound(
+                _('The link expired. Please request a new export of your data.')
+            )
+        return sendfile(
+            request,
+            export.path,
+            attachment=True,
+            attachment_filename=export.filename,
+            mimetype='application/zip',
+        )
 
 
 class CommunityUserProfileView(generics.RetrieveAPIView):
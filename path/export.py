@@ -0,0 +1,216 @@
+"""
+Exports of the personal data of users as zip files (article 20 GDPR).
+
+Every relation of PersonalDataSerializer is read with a server-side cursor
+and written as JSON array into its own file of the archive, the remaining
+fields go to user.json. The archives are stored below SENDFILE_ROOT and
+named after a fingerprint of the data. Thus, an archive is reused until the
+data of the user changes (older archives are removed). The session in the
+archive is the one of the request which created it.
+"""
+import datetime
+import glob
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import zipfile
+
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import ListSerializer
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Count, DateTimeField, Max, prefetch_related_objects
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+
+from . import models
+from .api.serializers import (
+    HistoricalEmailAddressSerializer,
+    PersonalDataSerializer,
+    SessionSerializer,
+)
+
+DIRECTORY = 'personal-data'
+TOKEN_SALT = 'path.export'
+TOKEN_MAX_AGE = 60 * 60 * 24 * 7
+# Of the task, new jobs for the export aren't queued before
+EXPORT_TIME_LIMIT = 60 * 30
+
+
+def get_info() -> str:
+    return _(
+        'Literary works and their translations are copyrighted by the '
+        'Ellen G. White Estate®. You shall not adversely affect the '
+        'rights and freedoms of the Ellen G. White Estate® or others '
+        '(see article 20 (4) GDPR).'
+    )
+
+
+class PersonalDataExport:
+    chunk_size = 500
+
+    def __init__(self, user, session=None, fingerprint=None):
+        self.user = user
+        self.session = session
+        if fingerprint is not None:
+            self.fingerprint = fingerprint
+        self.renderer = CamelCaseJSONRenderer()
+
+    @classmethod
+    def from_token(cls, token):
+        """
+        Returns the export of a download token.
+
+        Raises BadSignature for invalid or expired tokens and DoesNotExist for
+        inactive users.
+        """
+        pk, fingerprint = signing.loads(
+            token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE
+        )
+        user = models.User.objects.get(pk=pk, is_active=True)
+        return cls(user, fingerprint=fingerprint)
+
+    def get_token(self) -> str:
+        return signing.dumps([self.user.pk, self.fingerprint], salt=TOKEN_SALT)
+
+    @cached_property
+    def serializer(self):
+        # The URLs are relative
+        return PersonalDataSerializer(self.user, context={'request': None})
+
+    @cached_property
+    def relations(self) -> dict:
+        """
+        Returns the querysets and serializers of the relations by name.
+        """
+        relations = {}
+        for name, field in self.serializer.fields.items():
+            if isinstance(field, ListSerializer):
+                manager = getattr(self.user, field.source)
+                relations[name] = (manager.all(), field.child)
+        relations['historicalemailaddresses'] = (
+            PersonalDataSerializer.get_historical_email_addresses(self.user),
+            HistoricalEmailAddressSerializer(),
+        )
+        return relations
+
+    def get_profile(self) -> dict:
+        """
+        Returns the data of the user without relations.
+        """
+        fields = self.serializer.fields
+        for name in (*self.relations, 'session'):
+            fields.pop(name, None)
+        return self.serializer.data
+
+    def get_fingerprint(self) -> str:
+        """
+        Returns a hash of the profile and the state of the relations.
+
+        The state consists of the count, the highest PK and the latest
+        modification date of the rows.
+        """
+        states = [self.get_profile()]
+        for name, (queryset, serializer) in self.relations.items():
+            aggregations = {'count': Count('pk'), 'pk': Max('pk')}
+            for field in queryset.model._meta.concrete_fields:
+                if isinstance(field, DateTimeField) and field.auto_now:
+                    aggregations[field.name] = Max(field.name)
+            states.append(queryset.order_by().aggregate(**aggregations))
+        data = json.dumps(states, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    @cached_property
+    def fingerprint(self) -> str:
+        return self.get_fingerprint()
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(
+            settings.SENDFILE_ROOT, DIRECTORY, str(self.user.public_id)
+        )
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f'{self.fingerprint}.zip')
+
+    @property
+    def filename(self) -> str:
+        """
+        Name of the archive for downloads.
+        """
+        user = self.user
+        date = datetime.date.today().isoformat()
+        return f'ellen4all.org_{user.username}_{user.public_id}_{date}.zip'
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get_objects(self, queryset, serializer):
+        """
+        Yields the objects of the relation with prefetched many-to-many
+        fields.
+        """
+        lookups = [
+            field.source
+            for field in serializer.fields.values()
+            if isinstance(field, ManyRelatedField)
+        ]
+        objects = queryset.order_by('pk').iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(itertools.islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            if lookups:
+                prefetch_related_objects(chunk, *lookups)
+            yield from chunk
+
+    def create(self) -> str:
+        """
+        Writes the archive if it doesn't exist and returns its path.
+        """
+        path = self.path
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        # Another process mustn't serve an incomplete file
+        descriptor, temporary = tempfile.mkstemp(
+            suffix='.tmp', dir=self.directory
+        )
+        try:
+            with open(descriptor, 'wb') as f:
+                self.write(f)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.remove_outdated()
+        return path
+
+    def remove_outdated(self):
+        for path in glob.iglob(os.path.join(self.directory, '*.zip')):
+            if path != self.path:
+                os.remove(path)
+
+    def write(self, f):
+        render = self.renderer.render
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+            profile = dict(self.get_profile())
+            if self.session is not None:
+                profile['session'] = SessionSerializer(self.session).data
+            profile = render({'info': get_info(), 'data': profile})
+            archive.writestr('user.json', profile)
+            for name, (queryset, serializer) in self.relations.items():
+                with archive.open(f'{name}.json', 'w') as data:
+                    data.write(b'[')
+                    separator = b'\n'
+                    for obj in self.get_objects(queryset, serializer):
+                        data.write(separator)
+                        data.write(render(serializer.to_representation(obj)))
+                        separator = b',\n'
+                    data.write(b'\n]\n')
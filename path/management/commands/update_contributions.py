@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from path.models import Contribution
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the contributions (edits per user and language) from the '
+        'historical records of translated segments.'
+    )
+
+    def handle(self, *args, **kwargs):
+        count = Contribution.update()
+        msg = f'Updated contributions of {count} users and languages.'
+        self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,205 @@
+# Generated by Django 2.1.15 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Counts a historical record of a translated segment (edits) and whether it is
+# the first one of the user for the segment (segments). Row-level BEFORE
+# triggers see the rows changed before by the same statement, so bulk inserts
+# and deletes are counted correctly.
+CREATE_TRIGGER = '''
+CREATE FUNCTION path_contribution_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.history_user_id IS NOT NULL THEN
+        UPDATE path_contribution c
+        SET edits = c.edits - 1,
+            segments = c.segments - (NOT EXISTS (
+                SELECT 1 FROM panta_historicaltranslatedsegment h
+                WHERE h.id = OLD.id
+                AND h.history_user_id = OLD.history_user_id
+                AND h.history_id <> OLD.history_id
+            ))::int
+        FROM panta_translatedwork w
+        WHERE w.id = OLD.work_id
+        AND c.user_id = OLD.history_user_id
+        AND c.language = w.language;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.history_user_id IS NOT NULL THEN
+        INSERT INTO path_contribution (user_id, language, edits, segments)
+        SELECT NEW.history_user_id, w.language, 1, (NOT EXISTS (
+            SELECT 1 FROM panta_historicaltranslatedsegment h
+            WHERE h.id = NEW.id
+            AND h.history_user_id = NEW.history_user_id
+            AND h.history_id <> NEW.history_id
+        ))::int
+        FROM panta_translatedwork w
+        WHERE w.id = NEW.work_id
+        ON CONFLICT (user_id, language) DO UPDATE
+        SET edits = path_contribution.edits + 1,
+            segments = path_contribution.segments + EXCLUDED.segments;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER path_contribution_insert_delete
+BEFORE INSERT OR DELETE ON panta_historicaltranslatedsegment
+FOR EACH ROW EXECUTE PROCEDURE path_contribution_count();
+
+CREATE TRIGGER path_contribution_update
+BEFORE UPDATE ON panta_historicaltranslatedsegment
+FOR EACH ROW WHEN (
+    OLD.history_user_id IS DISTINCT FROM NEW.history_user_id
+    OR OLD.work_id IS DISTINCT FROM NEW.work_id
+    OR OLD.id <> NEW.id
+)
+EXECUTE PROCEDURE path_contribution_count();
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER path_contribution_update ON panta_historicaltranslatedsegment;
+DROP TRIGGER path_contribution_insert_delete
+ON panta_historicaltranslatedsegment;
+DROP FUNCTION path_contribution_count();
+'''
+
+# Same as Contribution.update()
+FILL_TABLE = '''
+INSERT INTO path_contribution (user_id, language, edits, segments)
+SELECT h.history_user_id, w.language, count(*), count(DISTINCT h.id)
+FROM panta_historicaltranslatedsegment h
+JOIN panta_translatedwork w ON w.id = h.work_id
+WHERE h.history_user_id IS NOT NULL
+GROUP BY h.history_user_id, w.language;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panta', '0071_auto_20200130_1847'),
+        ('path', '0028_oidcuser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contribution',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'language',
+                    models.CharField(
+                        choices=[
+                            ('af', 'Afrikaans'),
+                            ('am', 'Amharic'),
+                            ('ar', 'Arabic'),
+                            ('hy', 'Armenian'),
+                            ('bn', 'Bengali'),
+                            ('ber', 'Berber'),
+                            ('bg', 'Bulgarian'),
+                            ('my', 'Burmese'),
+                            ('ckb', 'Central Kurdish'),
+                            ('zh', 'Chinese'),
+                            ('hr', 'Croatian'),
+                            ('cs', 'Czech'),
+                            ('da', 'Danish'),
+                            ('nl', 'Dutch'),
+                            ('en', 'English'),
+                            ('fi', 'Finnish'),
+                            ('fr', 'French'),
+                            ('grt', 'Garo'),
+                            ('de', 'German'),
+                            ('hi', 'Hindi'),
+                            ('hu', 'Hungarian'),
+                            ('is', 'Icelandic'),
+                            ('ilo', 'Ilocano'),
+                            ('id', 'Indonesian'),
+                            ('it', 'Italian'),
+                            ('ja', 'Japanese'),
+                            ('kha', 'Khasi'),
+                            ('rw', 'Kinyarwanda'),
+                            ('ko', 'Korean'),
+                            ('lv', 'Latvian'),
+                            ('lt', 'Lithuanian'),
+                            ('lus2', 'Lushai'),
+                            ('mk', 'Macedonian'),
+                            ('mg', 'Malagasy'),
+                            ('ms', 'Malay'),
+                            ('mr', 'Marathi'),
+                            ('lus', 'Mizo'),
+                            ('nb', 'Norwegian Bokmål'),
+                            ('hil', 'Panayan'),
+                            ('fa', 'Persian'),
+                            ('pl', 'Polish'),
+                            ('pt', 'Portuguese'),
+                            ('ro', 'Romanian'),
+                            ('ru', 'Russian'),
+                            ('ksw', "S'gaw Karen"),
+                            ('sr', 'Serbian'),
+                            ('si', 'Sinhala'),
+                            ('sk', 'Slovak'),
+                            ('es', 'Spanish'),
+                            ('sw', 'Swahili'),
+                            ('sv', 'Swedish'),
+                            ('tl', 'Tagalog'),
+                            ('ta', 'Tamil'),
+                            ('te', 'Telugu'),
+                            ('th', 'Thai'),
+                            ('toi', 'Tonga (Zambia and Zimbabwe)'),
+                            ('ton', 'Tongan (Tonga Islands)'),
+                            ('tr', 'Turkish'),
+                            ('uk', 'Ukrainian'),
+                            ('ur', 'Urdu'),
+                            ('vi', 'Vietnamese'),
+                        ],
+                        max_length=7,
+                        verbose_name='language',
+                    ),
+                ),
+                (
+                    'edits',
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text='Number of historical records.',
+                        verbose_name='edits',
+                    ),
+                ),
+                (
+                    'segments',
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text='Number of edited segments.',
+                        verbose_name='segments',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='contributions',
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name='user',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'contribution',
+                'verbose_name_plural': 'contributions',
+                'unique_together': {('user', 'language')},
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunSQL(FILL_TABLE, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,148 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:27
+
+from importlib import import_module
+
+from django.db import migrations
+
+# Row-level BEFORE triggers aren't supported on partitioned tables
+# (PostgreSQL 11). Statement-level triggers with transition tables count all
+# records of a statement at once.
+CREATE_TRIGGERS = '''
+DROP TRIGGER path_contribution_update ON panta_historicaltranslatedsegment;
+DROP TRIGGER path_contribution_insert_delete
+ON panta_historicaltranslatedsegment;
+DROP FUNCTION path_contribution_count();
+
+CREATE FUNCTION path_contribution_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO path_contribution (user_id, language, edits, segments)
+    SELECT n.history_user_id, w.language, count(*),
+        count(DISTINCT n.id) FILTER (WHERE NOT EXISTS (
+            SELECT 1 FROM panta_historicaltranslatedsegment h
+            WHERE h.id = n.id
+            AND h.history_user_id = n.history_user_id
+            AND NOT EXISTS (
+                SELECT 1 FROM new_records x WHERE x.history_id = h.history_id
+            )
+        ))
+    FROM new_records n
+    JOIN panta_translatedwork w ON w.id = n.work_id
+    WHERE n.history_user_id IS NOT NULL
+    GROUP BY n.history_user_id, w.language
+    ON CONFLICT (user_id, language) DO UPDATE
+    SET edits = path_contribution.edits + EXCLUDED.edits,
+        segments = path_contribution.segments + EXCLUDED.segments;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION path_contribution_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE path_contribution c
+    SET edits = c.edits - o.edits, segments = c.segments - o.segments
+    FROM (
+        SELECT o.history_user_id AS user_id, w.language, count(*) AS edits,
+            count(DISTINCT o.id) FILTER (WHERE NOT EXISTS (
+                SELECT 1 FROM panta_historicaltranslatedsegment h
+                WHERE h.id = o.id AND h.history_user_id = o.history_user_id
+            )) AS segments
+        FROM old_records o
+        JOIN panta_translatedwork w ON w.id = o.work_id
+        WHERE o.history_user_id IS NOT NULL
+        GROUP BY o.history_user_id, w.language
+    ) o
+    WHERE c.user_id = o.user_id AND c.language = o.language;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Counts updated records like deleted old and inserted new ones
+CREATE FUNCTION path_contribution_update() RETURNS trigger AS $$
+BEGIN
+    CREATE TEMPORARY TABLE path_contribution_changed ON COMMIT DROP AS
+    SELECT n.history_id, o.history_user_id AS old_user_id,
+        o.work_id AS old_work_id, o.id AS old_id,
+        n.history_user_id AS new_user_id, n.work_id AS new_work_id,
+        n.id AS new_id
+    FROM old_records o
+    JOIN new_records n ON n.history_id = o.history_id
+    WHERE o.history_user_id IS DISTINCT FROM n.history_user_id
+    OR o.work_id <> n.work_id OR o.id <> n.id;
+
+    UPDATE path_contribution c
+    SET edits = c.edits - o.edits, segments = c.segments - o.segments
+    FROM (
+        SELECT ch.old_user_id AS user_id, w.language, count(*) AS edits,
+            count(DISTINCT ch.old_id) FILTER (WHERE NOT EXISTS (
+                SELECT 1 FROM panta_historicaltranslatedsegment h
+                WHERE h.id = ch.old_id AND h.history_user_id = ch.old_user_id
+            )) AS segments
+        FROM path_contribution_changed ch
+        JOIN panta_translatedwork w ON w.id = ch.old_work_id
+        WHERE ch.old_user_id IS NOT NULL
+        GROUP BY ch.old_user_id, w.language
+    ) o
+    WHERE c.user_id = o.user_id AND c.language = o.language;
+
+    INSERT INTO path_contribution (user_id, language, edits, segments)
+    SELECT ch.new_user_id, w.language, count(*),
+        count(DISTINCT ch.new_id) FILTER (WHERE NOT EXISTS (
+            SELECT 1 FROM panta_historicaltranslatedsegment h
+            WHERE h.id = ch.new_id
+            AND h.history_user_id = ch.new_user_id
+            AND NOT EXISTS (
+                SELECT 1 FROM path_contribution_changed x
+                WHERE x.history_id = h.history_id
+            )
+        ))
+    FROM path_contribution_changed ch
+    JOIN panta_translatedwork w ON w.id = ch.new_work_id
+    WHERE ch.new_user_id IS NOT NULL
+    GROUP BY ch.new_user_id, w.language
+    ON CONFLICT (user_id, language) DO UPDATE
+    SET edits = path_contribution.edits + EXCLUDED.edits,
+        segments = path_contribution.segments + EXCLUDED.segments;
+
+    DROP TABLE path_contribution_changed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER path_contribution_insert
+AFTER INSERT ON panta_historicaltranslatedsegment
+REFERENCING NEW TABLE AS new_records
+FOR EACH STATEMENT EXECUTE PROCEDURE path_contribution_insert();
+
+CREATE TRIGGER path_contribution_delete
+AFTER DELETE ON panta_historicaltranslatedsegment
+REFERENCING OLD TABLE AS old_records
+FOR EACH STATEMENT EXECUTE PROCEDURE path_contribution_delete();
+
+CREATE TRIGGER path_contribution_update
+AFTER UPDATE ON panta_historicaltranslatedsegment
+REFERENCING OLD TABLE AS old_records NEW TABLE AS new_records
+FOR EACH STATEMENT EXECUTE PROCEDURE path_contribution_update();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER path_contribution_update ON panta_historicaltranslatedsegment;
+DROP TRIGGER path_contribution_delete ON panta_historicaltranslatedsegment;
+DROP TRIGGER path_contribution_insert ON panta_historicaltranslatedsegment;
+DROP FUNCTION path_contribution_update();
+DROP FUNCTION path_contribution_delete();
+DROP FUNCTION path_contribution_insert();
+'''
+
+# Recreates the row-level triggers
+previous = import_module('path.migrations.0029_contribution')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('path', '0029_contribution')]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_TRIGGERS, DROP_TRIGGERS + previous.CREATE_TRIGGER
+        )
+    ]
@@ -22,8 +22,8 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import PermissionDenied
-from django.db import models
-from django.db.models import Count, Q
+from django.db import connection, models, transaction
+from django.db.models import Sum
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.translation import (
@@ -301,6 +301,7 @@ class User(user_model):
 
     work = None  # Used to get reputation based permissions
     _edits = None
+    _reputations = None
 
     @property
     def name(self):
@@ -328,7 +329,9 @@ class User(user_model):
         """
         # Determine roles
         roles_dict = OrderedDict()
-        for r in self.reputations.all().order_by('language'):
+        reputations = self.reputations.all().order_by('language')
+        self.set_reputations(reputations)
+        for r in reputations:
             if r.score >= PERMISSIONS['trustee']:
                 role = 'trustee'
             elif r.score >= PERMISSIONS['review_translation']:
@@ -340,20 +343,17 @@ class User(user_model):
             roles_dict[r.language] = role
 
         # Edits per language based on segments, not on the history
-        edits = TranslatedSegment.objects.filter(
-            pk__in=self.historicaltranslatedsegments.values('id')
-        ).aggregate(
-            **{
-                l: Count('pk', filter=Q(work__language=l), distinct=True)
-                for l in roles_dict
-            }
+        edits = dict(
+            self.contributions.filter(language__in=roles_dict).values_list(
+                'language', 'segments'
+            )
         )
 
         # Build list with OrderedDicts
         roles_list = []
         for l, r in roles_dict.items():
             # Filter out languages without edits
-            if edits[l]:
+            if edits.get(l):
                 roles_list.append(
                     OrderedDict(
                         (
@@ -385,7 +385,7 @@ class User(user_model):
         no_score_permissions = OrderedDict(
             (name, minimum <= 1) for name, minimum in PERMISSIONS.items()
         )
-        reputations = {r.language: r.score for r in self.reputations.all()}
+        reputations = self.set_reputations(self.reputations.all())
         for language_code, language in LANGUAGES:
             score = reputations.get(language_code)
             if score is None:
@@ -400,7 +400,9 @@ class User(user_model):
     @property
     def edits(self):
         if self._edits is None:
-            self._edits = self.historicaltranslatedsegments.count()
+            self._edits = (
+                self.contributions.aggregate(edits=Sum('edits'))['edits'] or 0
+            )
         return self._edits
 
     @edits.setter
@@ -456,11 +458,30 @@ class User(user_model):
             urllib.parse.quote(AVATAR.format(color=color), safe=' /:=%')
         )
 
+    def set_reputations(self, reputations) -> dict:
+        """
+        Stores the scores of given reputations for later permission checks.
+        """
+        self._reputations = {r.language: r.score for r in reputations}
+        return self._reputations
+
+    def get_reputations(self) -> dict:
+        """
+        Returns the reputation scores by language, loaded once per instance.
+
+        A user object lives as long as a request, so permission checks don't
+        query the database more than once.
+        """
+        if self._reputations is None:
+            self.set_reputations(self.reputations.all())
+        return self._reputations
+
     def get_reputation(self, language: str) -> int:
         """
         Returns the reputation score for a given language from cache or DB.
         """
-        score = getattr(self, f'reputation_{language}', None)
+        reputations = self.get_reputations()
+        score = reputations.get(language)
         if score is None:
             # Give the user a reputation of 5 if it doesn't exist for given
             # language yet.
@@ -474,7 +495,7 @@ class User(user_model):
             #     score = self.reputations.get(language=language).score
             # except ObjectDoesNotExist:
             #     score = 1
-            setattr(self, f'reputation_{language}', score)
+            reputations[language] = score
         return score
 
     def get_role_from_reputation(self, reputation_score):
@@ -538,10 +559,11 @@ class User(user_model):
             self.work = work
         elif self.work is None or self.work.pk != int(work):
             try:
-                self.work = TranslatedWork.objects.only('language').get(pk=work)
+                language = TranslatedWork.get_language(work)
             except TranslatedWork.DoesNotExist:
                 # Happens when rendering the OpenAPI schema
                 return '--'
+            self.work = TranslatedWork(pk=int(work), language=language)
         return self.work.language
 
     def flag(self, user, reason=None):
@@ -600,6 +622,59 @@ class Reputation(models.Model):
         index_together = unique_together
 
 
+class Contribution(models.Model):
+    """
+    Edits of a user per language.
+
+    Kept up to date by a trigger on the historical records of translated
+    segments (see migration 0029).
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name=_('user'),
+        related_name='contributions',
+        on_delete=models.CASCADE,
+    )
+    language = models.CharField(_('language'), choices=LANGUAGES, max_length=7)
+    edits = models.PositiveIntegerField(
+        _('edits'), default=0, help_text=_('Number of historical records.')
+    )
+    segments = models.PositiveIntegerField(
+        _('segments'), default=0, help_text=_('Number of edited segments.')
+    )
+
+    class Meta:
+        verbose_name = _('contribution')
+        verbose_name_plural = _('contributions')
+        unique_together = ('user', 'language')
+
+    @classmethod
+    @transaction.atomic
+    def update(cls) -> int:
+        """
+        Rebuilds the table from the historical records.
+        """
+        table = cls._meta.db_table
+        history = TranslatedSegment.history.model._meta.db_table
+        with connection.cursor() as cursor:
+            # Changes by the trigger have to wait until the table is rebuilt
+            cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (user_id, language, edits, segments)
+                SELECT h.history_user_id, w.language, count(*),
+                       count(DISTINCT h.id)
+                FROM {history} h
+                JOIN {TranslatedWork._meta.db_table} w ON w.id = h.work_id
+                WHERE h.history_user_id IS NOT NULL
+                GROUP BY h.history_user_id, w.language
+                '''
+            )
+            return cursor.rowcount
+
+
 class FlagUser(models.Model):
     flagger = models.ForeignKey(
         User, related_name='flagger_user', on_delete=models.CASCADE
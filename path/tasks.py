@@ -0,0 +1,45 @@
+from importlib import import_module
+
+from langify.celery import app
+from misc.apis import MailjetClient
+
+from django.conf import settings
+from django.utils.translation import gettext as _
+
+from . import models
+from .export import EXPORT_TIME_LIMIT, PersonalDataExport
+
+
+@app.task(soft_time_limit=EXPORT_TIME_LIMIT)
+def export_personal_data(user_id, session_key=None, url=None):
+    """
+    Creates the archive of the personal data of the user.
+
+    Sends the download link to the user if the URL of the download view
+    (without token) is given.
+    """
+    user = models.User.objects.get(pk=user_id)
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    export = PersonalDataExport(user, session)
+    path = export.create()
+    if url:
+        context = {
+            'heading': _('Your data is ready'),
+            'introduction': _('We exported your personal data as requested.'),
+            'task': _(
+                'Just click on the green button to download it. The link '
+                'is valid for one week.'
+            ),
+            'button': _('Download data'),
+            'link': f'{url}{export.get_token()}/',
+            'ignore_note': _(
+                'In case you didn\'t request an export of your data on '
+                'ellen4all.org please change your password.'
+            ),
+        }
+        client = MailjetClient()
+        # The generic template of the transactional e-mails
+        client.send_transactional_email(
+            533_481, user.email, _('Export of your data'), context
+        )
+    return path
@@ -1,6 +1,7 @@
 import datetime
 import json
 import sys
+import tempfile
 from collections import OrderedDict
 from copy import deepcopy
 from io import BytesIO
@@ -21,7 +22,7 @@ from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core import mail
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.test import SimpleTestCase, tag  # noqa: F401
+from django.test import SimpleTestCase, override_settings, tag  # noqa: F401
 from django.urls import reverse
 from django.utils import timezone
 from misc.apis import MailjetClient
@@ -49,6 +50,7 @@ from .api.serializers import (
     TransactionalPasswordResetForm,
     get_permissions_serializer,
 )
+from .tasks import export_personal_data
 
 
 class UserTests:
@@ -315,6 +317,32 @@ class UserModelTests(UserTests, APITests):
         with self.assertNumQueries(0):
             self.assertEqual(self.user.get_language_of(work.pk), work.language)
 
+    def test_permission_checks_query_once(self):
+        work = TranslatedWorkFactory(language='de')
+        models.Reputation.objects.update_or_create(
+            user=self.user, language='de', defaults={'score': 100}
+        )
+        user = models.User.objects.get(pk=self.user.pk)
+        # Language of the work and reputations
+        with self.assertNumQueries(2):
+            user.check_perms(work.pk, 'add_translation', 'add_comment')
+        with self.assertNumQueries(0):
+            user.check_role('translator', str(work.pk))
+            self.assertFalse(user.has_required_reputation('trustee', work.pk))
+        # The language of the work is cached between users (requests)
+        another_user = models.User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            another_user.check_perms(work.pk, 'add_translation')
+
+    def test_cached_work_language_is_invalidated(self):
+        work = TranslatedWorkFactory(language='de')
+        self.assertEqual(TranslatedWork.get_language(work.pk), 'de')
+        work.language = 'fr'
+        work.save()
+        self.assertEqual(TranslatedWork.get_language(work.pk), 'fr')
+        with self.assertRaises(TranslatedWork.DoesNotExist):
+            TranslatedWork.get_language(0)
+
     def test_create_historical_record_changing_a_field(self):
         self.assertEqual(self.user.history.count(), 2)
         self.user.address = 'Long Road 123'
@@ -330,6 +358,64 @@ class UserModelTests(UserTests, APITests):
         self.assertEqual(self.user.get_avatar(), self.get_svg_avatar(self.user))
 
 
+class ContributionTests(UserTests, APITests):
+    def setUp(self):
+        self.user = deepcopy(self._user)
+        create_work(3, 2, ('de', 'fr'), random=False)
+        self.segments = tuple(
+            TranslatedSegment.objects.order_by('work__language', 'position')
+        )
+
+    def get_contributions(self):
+        return sorted(
+            self.user.contributions.values_list('language', 'edits', 'segments')
+        )
+
+    def test_counted_when_historical_records_change(self):
+        kw = {'history_user': self.user, 'save': False}
+        records = [
+            self.segments[0].add_to_history(relative_id=1, **kw),
+            self.segments[0].add_to_history(relative_id=2, **kw),
+            self.segments[1].add_to_history(relative_id=1, **kw),
+            self.segments[3].add_to_history(relative_id=1, **kw),
+            self.segments[4].add_to_history(relative_id=1, save=False),
+        ]
+        TranslatedSegment.history.bulk_create(records)
+        self.assertEqual(self.get_contributions(), [('de', 3, 2), ('fr', 1, 1)])
+        self.assertEqual(self.user.edits, 4)
+
+        # Deleting one of two records of a segment
+        TranslatedSegment.history.filter(
+            id=self.segments[0].pk, relative_id=2
+        ).delete()
+        self.assertEqual(self.get_contributions(), [('de', 2, 2), ('fr', 1, 1)])
+        # Deleting all records of the user
+        TranslatedSegment.history.filter(
+            history_user=self.user, work__language='de'
+        ).delete()
+        self.assertEqual(self.get_contributions(), [('de', 0, 0), ('fr', 1, 1)])
+        # Changing the user
+        TranslatedSegment.history.filter(
+            id=self.segments[4].pk, history_user=None
+        ).update(history_user=self.user)
+        self.assertEqual(self.get_contributions(), [('de', 0, 0), ('fr', 2, 2)])
+
+    def test_update(self):
+        kw = {'history_user': self.user, 'save': False}
+        TranslatedSegment.history.bulk_create(
+            [
+                self.segments[0].add_to_history(relative_id=1, **kw),
+                self.segments[0].add_to_history(relative_id=2, **kw),
+                self.segments[5].add_to_history(relative_id=1, **kw),
+            ]
+        )
+        expected = self.get_contributions()
+        models.Contribution.objects.update(edits=0, segments=0)
+        self.assertEqual(models.Contribution.update(), 2)
+        self.assertEqual(self.get_contributions(), expected)
+        self.assertEqual(expected, [('de', 2, 1), ('fr', 1, 1)])
+
+
 class SerializerTests(SimpleTestCase):
     def test_country_serializer_options(self):
         """
@@ -1315,21 +1401,76 @@ class UserAPITests(APITests):
             self.assertNotIn(k, objects[0])
 
     @skipIf(sys.version_info[:3] < (3, 6, 2), 'Python 3.6.2+ required')
-    def test_export_data(self):
-        res = self.client.post(f'{self.url}export-data/', {'password': 'pw'})
-        self.assertEqual(res.status_code, 200)
-        with BytesIO(res.getvalue()) as archive:
-            with ZipFile(archive) as folder:
-                with folder.open(folder.filelist[0]) as f:
-                    data = json.load(f)
-        expected = (
-            'Literary works and their translations are copyrighted by the '
-            'Ellen G. White Estate®. You shall not adversely affect the '
-            'rights and freedoms of the Ellen G. White Estate® or others '
-            '(see article 20 (4) GDPR).'
-        )
-        self.assertEqual(data['info'], expected)
-        self.assertIn('username', data['data'])
+    @patch('path.tasks.export_personal_data.apply_async')
+    def test_export_data(self, task):
+        url = f'{self.url}export-data/'
+        outbox = MailjetClient.test_outbox
+        outbox.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(SENDFILE_ROOT=directory):
+                res = self.client.post(url, {'password': 'pw'})
+                self.assertEqual(res.status_code, 202)
+                self.assertEqual(task.call_count, 1)
+                args = task.call_args[0][0]
+                self.assertEqual(args[0], self.user.pk)
+                self.assertEqual(args[2], f'http://testserver{url}')
+                # The job is queued once
+                res = self.client.post(url, {'password': 'pw'})
+                self.assertEqual(res.status_code, 202)
+                self.assertEqual(task.call_count, 1)
+
+                export_personal_data(*args)
+                self.assertEqual(len(outbox), 1)
+                msg = outbox[0][-1]['data']['Messages'][0]
+                self.assertEqual(msg['To'][0]['Email'], self.user.email)
+                link = msg['Variables']['link']
+
+                res = self.client.post(url, {'password': 'pw'})
+                self.assertEqual(res.status_code, 200)
+                with BytesIO(res.getvalue()) as archive:
+                    with ZipFile(archive) as folder:
+                        with folder.open('user.json') as f:
+                            data = json.load(f)
+                        with folder.open('developercomments.json') as f:
+                            comments = json.load(f)
+                expected = (
+                    'Literary works and their translations are copyrighted '
+                    'by the Ellen G. White Estate®. You shall not adversely '
+                    'affect the rights and freedoms of the Ellen G. White '
+                    'Estate® or others (see article 20 (4) GDPR).'
+                )
+                self.assertEqual(data['info'], expected)
+                self.assertIn('username', data['data'])
+                self.assertIn('expireDate', data['data']['session'])
+                self.assertEqual(comments, [])
+
+                res = self.client.get(link)
+                self.assertEqual(res.status_code, 200)
+                res = self.client.get(f'{url}{link[-10:]}')
+                self.assertEqual(res.status_code, 404)
+                # Only the user can download the data
+                self.client.force_login(factories.UserFactory())
+                res = self.client.get(link)
+                self.assertEqual(res.status_code, 404)
+                self.client.logout()
+                res = self.client.get(link)
+                self.assertEqual(res.status_code, 401)
+
+                # A change of the data requires a new export
+                DeveloperCommentFactory(user=self.user)
+                self.client.force_login(self.user)
+                res = self.client.post(url, {'password': 'pw'})
+                self.assertEqual(res.status_code, 202)
+                self.assertEqual(task.call_count, 2)
+                export_personal_data(self.user.pk)
+                res = self.client.get(link)
+                self.assertEqual(res.status_code, 404)
+                res = self.client.post(url, {'password': 'pw'})
+                self.assertEqual(res.status_code, 200)
+                with BytesIO(res.getvalue()) as archive:
+                    with ZipFile(archive) as folder:
+                        with folder.open('developercomments.json') as f:
+                            self.assertEqual(len(json.load(f)), 1)
 
 
 class LittleUserAPITests(APITests):
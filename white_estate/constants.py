@@ -437,3 +437,16 @@ EXISTING_WORKS = {
         'Christ Our Saviour',
     ),
 }
+
+# Words a term of the concordance doesn't start or end with
+ENGLISH_STOPWORDS = frozenset(
+    (
+        'a an and are as at be been but by did do does for from had has have '
+        'he her him his i if in into is it its me my no nor not of on or our '
+        'she so than that the their them then there these they this those '
+        'thou thee thy to too us was we were what when which who whom why '
+        'will with would ye you your shall should may might can could must '
+        'unto upon all any each every also only very more most such own same '
+        'about after before while again'
+    ).split()
+)
@@ -0,0 +1,75 @@
+# Generated by Django 2.1.15 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panta', '0071_auto_20200130_1847'),
+        ('white_estate', '0003_auto_20190211_1741'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='TranslationMemoryEntry',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'language',
+                    models.CharField(max_length=7, verbose_name='language'),
+                ),
+                ('source', models.TextField(verbose_name='source')),
+                (
+                    'source_hash',
+                    models.CharField(max_length=32, verbose_name='source hash'),
+                ),
+                ('content', models.TextField(verbose_name='content')),
+                (
+                    'updated',
+                    models.DateTimeField(auto_now=True, verbose_name='updated'),
+                ),
+                (
+                    'original',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='+',
+                        to='panta.OriginalSegment',
+                        verbose_name='original',
+                    ),
+                ),
+                (
+                    'segment',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='tm_entry',
+                        to='panta.TranslatedSegment',
+                        verbose_name='segment',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'translation memory entry',
+                'verbose_name_plural': 'translation memory entries',
+                'index_together': {('language', 'source_hash')},
+            },
+        ),
+        # Django 2.1 doesn't support operator classes for indexes
+        migrations.RunSQL(
+            'CREATE INDEX white_estate_tm_source_trgm '
+            'ON white_estate_translationmemoryentry '
+            'USING gin (source gin_trgm_ops);',
+            'DROP INDEX white_estate_tm_source_trgm;',
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.1.15 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panta', '0071_auto_20200130_1847'),
+        ('white_estate', '0004_translationmemoryentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkSimilarity',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'sentences',
+                    models.PositiveIntegerField(verbose_name='sentences'),
+                ),
+                (
+                    'other',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='+',
+                        to='panta.OriginalWork',
+                        verbose_name='other work',
+                    ),
+                ),
+                (
+                    'work',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='similarities',
+                        to='panta.OriginalWork',
+                        verbose_name='work',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'work similarity',
+                'verbose_name_plural': 'work similarities',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='worksimilarity', unique_together={('work', 'other')}
+        ),
+    ]
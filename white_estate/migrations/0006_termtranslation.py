@@ -0,0 +1,71 @@
+# Generated by Django 2.1.15 on 2026-10-19 16:02
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('white_estate', '0005_worksimilarity')]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermTranslation',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'language',
+                    models.CharField(max_length=7, verbose_name='language'),
+                ),
+                ('term', models.CharField(max_length=100, verbose_name='term')),
+                (
+                    'translation',
+                    models.CharField(
+                        max_length=200, verbose_name='translation'
+                    ),
+                ),
+                (
+                    'count',
+                    models.PositiveIntegerField(
+                        help_text='Segments with the term and the translation',
+                        verbose_name='count',
+                    ),
+                ),
+                (
+                    'segments',
+                    models.PositiveIntegerField(
+                        help_text='Aligned segments with the term',
+                        verbose_name='segments',
+                    ),
+                ),
+                ('score', models.FloatField(verbose_name='score')),
+                (
+                    'references',
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=50),
+                        size=None,
+                        verbose_name='references',
+                    ),
+                ),
+                (
+                    'updated',
+                    models.DateTimeField(auto_now=True, verbose_name='updated'),
+                ),
+            ],
+            options={
+                'verbose_name': 'term translation',
+                'verbose_name_plural': 'term translations',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='termtranslation', index_together={('language', 'term')}
+        ),
+    ]
@@ -1,6 +1,7 @@
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models, transaction
 from django.utils.translation import gettext_lazy as _
-from panta.models import OriginalSegment
+from panta.models import OriginalSegment, OriginalWork, TranslatedSegment
 
 
 class Tag(models.Model):
@@ -66,3 +67,139 @@ class OriginalSegmentSentenceRelation(models.Model):
 
     class Meta:
         unique_together = ('segment', 'number')
+
+
+class TranslationMemoryEntry(models.Model):
+    """
+    Approved translation of a segment, indexed by its original text.
+
+    The source is the plain text of the original sentences, the hash allows
+    exact lookups and a trigram index (see migration) fuzzy ones.
+    """
+
+    segment = models.OneToOneField(
+        TranslatedSegment,
+        verbose_name=_('segment'),
+        on_delete=models.CASCADE,
+        related_name='tm_entry',
+    )
+    original = models.ForeignKey(
+        OriginalSegment,
+        verbose_name=_('original'),
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    language = models.CharField(_('language'), max_length=7)
+    source = models.TextField(_('source'))
+    source_hash = models.CharField(_('source hash'), max_length=32)
+    content = models.TextField(_('content'))
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+
+    def __str__(self):
+        return self.source
+
+    class Meta:
+        verbose_name = _('translation memory entry')
+        verbose_name_plural = _('translation memory entries')
+        index_together = ('language', 'source_hash')
+
+
+class TermTranslation(models.Model):
+    """
+    Observed translation of a recurring term of the originals.
+
+    Built from the translation memory (see utils.Concordance).
+    """
+
+    language = models.CharField(_('language'), max_length=7)
+    term = models.CharField(_('term'), max_length=100)
+    translation = models.CharField(_('translation'), max_length=200)
+    count = models.PositiveIntegerField(
+        _('count'), help_text=_('Segments with the term and the translation')
+    )
+    segments = models.PositiveIntegerField(
+        _('segments'), help_text=_('Aligned segments with the term')
+    )
+    score = models.FloatField(_('score'))
+    references = ArrayField(
+        models.CharField(max_length=50), verbose_name=_('references')
+    )
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+
+    def __str__(self):
+        return f'{self.term} - {self.translation}'
+
+    class Meta:
+        verbose_name = _('term translation')
+        verbose_name_plural = _('term translations')
+        index_together = ('language', 'term')
+
+
+class WorkSimilarity(models.Model):
+    """
+    Sparse matrix of the sentences original works have in common.
+
+    For other == work, sentences is the number of sentences found in no
+    other work.
+    """
+
+    work = models.ForeignKey(
+        OriginalWork,
+        verbose_name=_('work'),
+        on_delete=models.CASCADE,
+        related_name='similarities',
+    )
+    other = models.ForeignKey(
+        OriginalWork,
+        verbose_name=_('other work'),
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    sentences = models.PositiveIntegerField(_('sentences'))
+
+    @classmethod
+    @transaction.atomic
+    def update(cls) -> int:
+        """
+        Recomputes the matrix from the sentence relations.
+        """
+        cls.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH work_sentence AS (
+                    SELECT DISTINCT segment.work_id, relation.sentence_id
+                    FROM {relations} relation
+                    JOIN {segments} segment ON segment.id = relation.segment_id
+                )
+                INSERT INTO {similarities} (work_id, other_id, sentences)
+                SELECT a.work_id, b.work_id, COUNT(*)
+                FROM work_sentence a
+                JOIN work_sentence b
+                    ON b.sentence_id = a.sentence_id
+                    AND b.work_id <> a.work_id
+                GROUP BY a.work_id, b.work_id
+                UNION ALL
+                SELECT a.work_id, a.work_id, COUNT(*)
+                FROM work_sentence a
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM work_sentence b
+                    WHERE b.sentence_id = a.sentence_id
+                    AND b.work_id <> a.work_id
+                )
+                GROUP BY a.work_id
+                """.format(
+                    relations=OriginalSegmentSentenceRelation._meta.db_table,
+                    segments=OriginalSegment._meta.db_table,
+                    similarities=cls._meta.db_table,
+                )
+            )
+            return cursor.rowcount
+
+    def __str__(self):
+        return f'{self.work_id} - {self.other_id}: {self.sentences}'
+
+    class Meta:
+        verbose_name = _('work similarity')
+        verbose_name_plural = _('work similarities')
+        unique_together = ('work', 'other')
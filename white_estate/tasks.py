@@ -1,23 +1,48 @@
-import datetime
+import io
+import itertools
 import json
+from collections import Counter
 
+import ijson
+
+from django.db import connection, transaction
+from django.utils import timezone
 from langify.celery import app
-from panta.constants import CHANGE_REASONS
+from panta.constants import (
+    CHANGE_REASONS,
+    IN_TRANSLATION,
+    LANGUAGE_RATIOS,
+    TRANSLATION_DONE,
+)
 from panta.models import (
     BaseTranslation,
     BaseTranslationSegment,
     BaseTranslator,
+    OriginalSegment,
     TranslatedSegment,
+    TranslatedWork,
     WorkStatistics,
 )
 from panta.utils import get_system_user
 
+from .models import WorkSimilarity
+from .utils import Concordance, TranslationMemory
+
+# Rows per COPY chunk and per bulk insert
+BATCH_SIZE = 5000
+
+# Characters with a special meaning in the text format of COPY
+COPY_ESCAPES = str.maketrans(
+    {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+)
+
 
-def notify(start, message):
-    time = str(datetime.datetime.now() - start)[:-7]
-    with open('tasks.log', 'a') as log_file:
-        log_file.write(f'{time} {message}\n')
-    print(time, message)
+def report_progress(task, step, **meta):
+    """
+    Stores the current step in the task state (if run by a worker).
+    """
+    if task.request.id:
+        task.update_state(state='PROGRESS', meta={'step': step, **meta})
 
 
 def get_base_translation(type, language):
@@ -35,61 +60,160 @@ def get_base_translation(type, language):
     return base_translation
 
 
-@app.task
-def add_tm_paragraphs(language):
+def copy_rows(cursor, table, columns, rows):
     """
-    Adds content of similar segments as base translations.
+    Loads rows (tuples of strings or None) into given table with COPY in chunks.
     """
-    segments = TranslatedSegment.objects.filter(work__language=language)
-    user = get_system_user('TM')
-    base_translation = get_base_translation('tm', language)
-    now = datetime.datetime.now()
-    notify(now, f'{now} ===============================')
+    count = 0
+    buffer = io.StringIO()
 
-    notify(now, 'Create base translations…')
-    with open('similarities.jsons') as f:
+    def flush():
+        buffer.seek(0)
+        cursor.copy_from(buffer, table, columns=columns)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for count, row in enumerate(rows, start=1):
+        buffer.write(
+            '\t'.join(
+                '\\N' if v is None else v.translate(COPY_ESCAPES) for v in row
+            )
+            + '\n'
+        )
+        if count % BATCH_SIZE == 0:
+            flush()
+    flush()
+    return count
+
+
+def read_tm_similarities(path):
+    """
+    Yields (line, source key, target key) for 100 % similar segments.
+    """
+    with open(path) as f:
         for i, line in enumerate(f, start=1):
-            if i % 500 == 0:
-                notify(now, f'Line {i}')
             data = json.loads(line)
-            try:
-                segment = segments.exclude(content='').get(
-                    original__key=data[0][0]
-                )
-            except TranslatedSegment.DoesNotExist:
-                continue
-            # TODO Maybe also import TM when 100% similar and history is because
-            # of AI or third-party base translation?
+            # TODO Maybe also import TM when 100% similar and history is
+            # because of AI or third-party base translation?
             # TODO Add support for segments < 100%
-            keys = (p[1] for p in data if p[4] == 100)
-            if not keys:
-                continue
-            similar = segments.filter(
-                original__key__in=keys, content='', past=None
-            )
-            for s in similar:
-                base_segment = BaseTranslationSegment.objects.create(
-                    content=segment.content,
-                    original_id=s.original_id,
+            for p in data:
+                if p[4] == 100:
+                    yield (str(i), data[0][0], p[1])
+
+
+TM_MATCHES_SQL = """
+    SELECT DISTINCT ON (target.id)
+        target.id, target.original_id, target.work_id, target.chapter_id,
+        source.content
+    FROM tm_similarity tm
+    JOIN {original} source_original ON source_original.key = tm.source_key
+    JOIN {segment} source ON source.original_id = source_original.id
+    JOIN {work} source_work ON source_work.id = source.work_id
+    JOIN {original} target_original ON target_original.key = tm.target_key
+    JOIN {segment} target ON target.original_id = target_original.id
+    JOIN {work} target_work ON target_work.id = target.work_id
+    WHERE source_work.language = %(language)s
+        AND source.content <> ''
+        AND target_work.language = %(language)s
+        AND target.content = ''
+        AND NOT EXISTS (
+            SELECT 1 FROM {history} h WHERE h.id = target.id
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM {base} b
+            WHERE b.original_id = target.original_id
+                AND b.translation_id = %(translation)s
+        )
+    ORDER BY target.id, tm.line
+"""
+
+
+@app.task(bind=True)
+def add_tm_paragraphs(self, language, path='similarities.jsons'):
+    """
+    Adds content of similar segments as base translations.
+
+    Loads the similarities into a temporary table, resolves them with one
+    query and inserts base translations and historical records in bulk.
+    """
+    user = get_system_user('TM')
+    base_translation = get_base_translation('tm', language)
+    now = timezone.now()
+    sql = TM_MATCHES_SQL.format(
+        original=OriginalSegment._meta.db_table,
+        segment=TranslatedSegment._meta.db_table,
+        work=TranslatedWork._meta.db_table,
+        history=TranslatedSegment.history.model._meta.db_table,
+        base=BaseTranslationSegment._meta.db_table,
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        report_progress(self, 'load similarities')
+        # ON COMMIT DROP doesn't apply within savepoints of outer transactions
+        cursor.execute('DROP TABLE IF EXISTS tm_similarity')
+        cursor.execute(
+            'CREATE TEMPORARY TABLE tm_similarity ('
+            'line integer, source_key varchar(30), target_key varchar(30)'
+            ') ON COMMIT DROP'
+        )
+        rows = copy_rows(
+            cursor,
+            'tm_similarity',
+            ('line', 'source_key', 'target_key'),
+            read_tm_similarities(path),
+        )
+        cursor.execute('ANALYZE tm_similarity')
+
+        report_progress(self, 'resolve segments', similarities=rows)
+        cursor.execute(
+            sql, {'language': language, 'translation': base_translation.pk}
+        )
+        matches = cursor.fetchall()
+
+        base_segments = {}
+        historical_records = []
+        for pk, original_id, work_id, chapter_id, content in matches:
+            if original_id not in base_segments:
+                base_segments[original_id] = BaseTranslationSegment(
+                    content=content,
+                    original_id=original_id,
                     translation=base_translation,
                 )
-                if s.history.exists():
-                    # Edge case (
-                    notify(now, f'History exists for {s}!')
-                else:
-                    s.add_to_history(
-                        content=base_segment.content,
-                        history_type='+',
-                        history_date=base_segment.created,
-                        history_change_reason=CHANGE_REASONS['tm'],
-                        history_user=user,
-                    )
-
-    notify(now, 'Update pretranslated statistics…')
+            segment = TranslatedSegment(
+                pk=pk, work_id=work_id, chapter_id=chapter_id
+            )
+            segment.add_to_history(
+                content=content,
+                history_type='+',
+                history_date=now,
+                history_change_reason=CHANGE_REASONS['tm'],
+                history_user=user,
+                add_to=historical_records,
+            )
+
+        report_progress(
+            self,
+            'create base translations',
+            similarities=rows,
+            base_translations=len(base_segments),
+            historical_records=len(historical_records),
+        )
+        BaseTranslationSegment.objects.bulk_create(
+            base_segments.values(), batch_size=BATCH_SIZE
+        )
+        TranslatedSegment.history.bulk_create(
+            historical_records, batch_size=BATCH_SIZE
+        )
+
+    report_progress(self, 'update pretranslated statistics')
     WorkStatistics.update_pretranslated(language)
     # The other statistics get updated next time the update runs
 
-    notify(now, 'Mission accomplished :)\n')
+    return {
+        'similarities': rows,
+        'base_translations': len(base_segments),
+        'historical_records': len(historical_records),
+    }
 
 
 HUNGARIAN_TRANSLATION_QUALITY = {
@@ -115,80 +239,273 @@ HUNGARIAN_TRANSLATION_QUALITY = {
 
 
 @app.task
-def import_hungarian_translations(path, start=None, rows=None, log=True):
+def update_translation_memory(language=None, full=False):
+    """
+    Updates the translation memory of the given or all translated languages.
     """
-    Function to create base translations from a JSON file from Peter.
+    if language:
+        languages = (language,)
+    else:
+        languages = (
+            TranslatedWork.objects.order_by('language')
+            .values_list('language', flat=True)
+            .distinct()
+        )
+    return {
+        code: TranslationMemory(code).update(full=full) for code in languages
+    }
 
-    All works should be protected during the process.
 
-    Will probably be used once only.
+@app.task
+def update_concordance(language=None, full=False):
     """
-    with open(path) as f:
-        data = json.load(f)
-    user = get_system_user('third-party')
-    base_translation = get_base_translation('hb', 'hu')
-    # historical_segments = []
-    now = datetime.datetime.now()
-    notify(now, f'{now} ===============================')
-
-    if start:
-        data = data[start:]
-    if rows:
-        data = data[:rows]
-
-    notify(now, 'Import segments…')
-    for i, row in enumerate(data, start=1):
-        if i % 500 == 0:
-            notify(now, f'Row {i}')
-
-        if row['publisher'] == 'egervari-dezso':
-            # Skip low quality
-            continue
-
-        content = row['translation']
-        if not content:
-            continue
-
-        try:
-            segment = TranslatedSegment.objects.get(
-                original__key=row['para_id'], work__language='hu', content=''
+    Updates the concordance of the given or all translated languages.
+
+    Run it after update_translation_memory (only entries changed since the
+    last run are realigned unless full is True).
+    """
+    if language:
+        languages = (language,)
+    else:
+        languages = (
+            TranslatedWork.objects.order_by('language')
+            .values_list('language', flat=True)
+            .distinct()
+        )
+    return {code: Concordance(code).update(full=full) for code in languages}
+
+
+@app.task
+def update_work_similarities():
+    """
+    Recomputes the sentences original works have in common.
+    """
+    return WorkSimilarity.update()
+
+
+THIRD_PARTY_MATCHES_SQL = """
+    CREATE TEMPORARY TABLE third_party_match ON COMMIT DROP AS
+    SELECT DISTINCT ON (segment.id)
+        segment.id, segment.original_id, segment.work_id, segment.chapter_id,
+        i.quality, i.translation,
+        EXISTS (
+            SELECT 1 FROM {history} h WHERE h.id = segment.id
+        ) AS has_history,
+        -- Same as TranslatedSegment.determine_progress(votes=False)
+        CASE WHEN char_length(
+            regexp_replace(i.translation, '<[^>]*>', '', 'g')
+        ) <= char_length(
+            regexp_replace(original.content, '<[^>]*>', '', 'g')
+        ) * %(ratio)s * CASE WHEN char_length(
+            regexp_replace(original.content, '<[^>]*>', '', 'g')
+        ) <= 50 THEN 0.5 ELSE 1 END
+        THEN {in_translation} ELSE {translation_done} END AS progress
+    FROM third_party_import i
+    JOIN {original} original ON original.key = i.para_id
+    JOIN {segment} segment ON segment.original_id = original.id
+    JOIN {work} work ON work.id = segment.work_id
+    WHERE work.language = %(language)s
+        AND segment.content = ''
+        AND NOT EXISTS (
+            SELECT 1 FROM {base} b
+            WHERE b.original_id = segment.original_id
+                AND b.translation_id = %(translation)s
+        )
+    ORDER BY segment.id, i.line
+"""
+
+
+class ThirdPartyImport:
+    """
+    Imports translations of third parties from a JSON file.
+
+    The file contains a list of objects with the keys para_id (key of the
+    original segment), publisher and translation. Translations of publishers
+    with quality 1 become the content of empty segments, the others base
+    translations. Publishers listed in skip are ignored.
+
+    Rows are processed in batches, each in its own transaction. Use the
+    returned row offset to resume an interrupted import.
+    """
+
+    def __init__(self, language, quality, skip=(), default_quality=2):
+        self.language = language
+        self.quality = quality
+        self.skip = skip
+        self.default_quality = default_quality
+        self.user = get_system_user('third-party')
+        self.base_translation = get_base_translation('hb', language)
+        self.sql = THIRD_PARTY_MATCHES_SQL.format(
+            original=OriginalSegment._meta.db_table,
+            segment=TranslatedSegment._meta.db_table,
+            work=TranslatedWork._meta.db_table,
+            history=TranslatedSegment.history.model._meta.db_table,
+            base=BaseTranslationSegment._meta.db_table,
+            in_translation=IN_TRANSLATION,
+            translation_done=TRANSLATION_DONE,
+        )
+
+    def read_rows(self, path, start=0, rows=None):
+        """
+        Yields (line, para_id, quality, translation) streaming the file.
+
+        `next_row` is the offset after the last read row (including skipped
+        ones).
+        """
+        stop = None if rows is None else start + rows
+        self.next_row = start
+        with open(path, 'rb') as f:
+            items = ijson.items(f, 'item')
+            for row, item in enumerate(itertools.islice(items, start, stop)):
+                self.next_row = start + row + 1
+                publisher = item['publisher']
+                if publisher in self.skip or not item['translation']:
+                    continue
+                yield (
+                    str(start + row),
+                    item['para_id'],
+                    str(self.quality.get(publisher, self.default_quality)),
+                    item['translation'],
+                )
+
+    @transaction.atomic
+    def import_batch(self, rows):
+        """
+        Writes content, base translations and history for a batch of rows.
+        """
+        now = timezone.now()
+        segment_table = TranslatedSegment._meta.db_table
+        with connection.cursor() as cursor:
+            # ON COMMIT DROP doesn't apply within savepoints of outer
+            # transactions
+            cursor.execute(
+                'DROP TABLE IF EXISTS third_party_import, third_party_match'
             )
-        except TranslatedSegment.DoesNotExist:
-            continue
-
-        if HUNGARIAN_TRANSLATION_QUALITY[row['publisher']] == 1:
-            segment.content = content
-            segment.progress = segment.determine_progress(votes=False)
-            segment.save_without_historical_record()
-            obj = segment
-        else:
-            base_segment = BaseTranslationSegment.objects.create(
-                content=content,
-                original_id=segment.original_id,
-                translation=base_translation,
+            cursor.execute(
+                'CREATE TEMPORARY TABLE third_party_import ('
+                'line integer, para_id varchar(30), quality smallint, '
+                'translation text) ON COMMIT DROP'
             )
-            obj = base_segment
-        if segment.history.exists():
-            notify(now, f'History exists for {row["para_id"]}!')
-        else:
-            segment.add_to_history(
-                content=obj.content,
-                history_type='+',
-                history_date=obj.created,
-                history_change_reason=CHANGE_REASONS['import'],
-                history_user=user,
-                # add_to=historical_segments,
+            copy_rows(
+                cursor,
+                'third_party_import',
+                ('line', 'para_id', 'quality', 'translation'),
+                rows,
+            )
+            cursor.execute('ANALYZE third_party_import')
+            cursor.execute(
+                self.sql,
+                {
+                    'language': self.language,
+                    'translation': self.base_translation.pk,
+                    'ratio': LANGUAGE_RATIOS[self.language],
+                },
+            )
+            cursor.execute(
+                f'UPDATE {segment_table} segment '
+                'SET content = m.translation, progress = m.progress, '
+                'last_modified = %s '
+                'FROM third_party_match m '
+                'WHERE segment.id = m.id AND m.quality = 1',
+                [now],
+            )
+            segments = cursor.rowcount
+            cursor.execute(
+                'INSERT INTO {} (original_id, translation_id, content, '
+                'created, last_modified) '
+                'SELECT DISTINCT ON (original_id) '
+                'original_id, %s, translation, %s, %s '
+                'FROM third_party_match WHERE quality <> 1 '
+                'ORDER BY original_id'.format(
+                    BaseTranslationSegment._meta.db_table
+                ),
+                [self.base_translation.pk, now, now],
+            )
+            base_translations = cursor.rowcount
+            cursor.execute(
+                'SELECT id, work_id, chapter_id, translation '
+                'FROM third_party_match WHERE NOT has_history'
+            )
+            historical_records = []
+            for pk, work_id, chapter_id, content in cursor.fetchall():
+                segment = TranslatedSegment(
+                    pk=pk, work_id=work_id, chapter_id=chapter_id
+                )
+                segment.add_to_history(
+                    content=content,
+                    history_type='+',
+                    history_date=now,
+                    history_change_reason=CHANGE_REASONS['import'],
+                    history_user=self.user,
+                    add_to=historical_records,
+                )
+            TranslatedSegment.history.bulk_create(
+                historical_records, batch_size=BATCH_SIZE
             )
+        return {
+            'segments': segments,
+            'base_translations': base_translations,
+            'historical_records': len(historical_records),
+        }
 
-    # notify(now, 'Create history…')
-    # TranslatedSegment.history.bulk_create(historical_segments)
+    def run(self, path, start=0, rows=None, task=None):
+        """
+        Imports the rows from start (offset) on and returns the counts.
 
-    # notify(now, 'Sanitizse content…')
-    # segments = TranslatedSegment.objects.filter(work__language='hu')
-    # sanitize_content_of_queryset(segments)
+        'next_row' is the offset to continue with.
+        """
+        counts = Counter()
+        batch = []
 
-    notify(now, 'Update pretranslated statistics…')
-    WorkStatistics.update_pretranslated('hu')
-    # The other statistics get updated next time the update runs
+        def import_batch():
+            counts.update(self.import_batch(batch))
+            batch.clear()
+            if task:
+                report_progress(
+                    task, 'import', next_row=self.next_row, **counts
+                )
+
+        for row in self.read_rows(path, start, rows):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                import_batch()
+        if batch:
+            import_batch()
+
+        WorkStatistics.update_pretranslated(self.language)
+        # The other statistics get updated next time the update runs
+        return {
+            'segments': counts['segments'],
+            'base_translations': counts['base_translations'],
+            'historical_records': counts['historical_records'],
+            'next_row': self.next_row,
+        }
 
-    notify(now, 'Mission accomplished :)\n')
+
+@app.task(bind=True)
+def import_third_party_translations(
+    self, path, language, quality, skip=(), start=0, rows=None
+):
+    """
+    Imports translations of third parties (see ThirdPartyImport).
+
+    All works of the language should be protected during the process.
+    """
+    importer = ThirdPartyImport(language, quality, skip=skip)
+    return importer.run(path, start=start, rows=rows, task=self)
+
+
+@app.task(bind=True)
+def import_hungarian_translations(self, path, start=0, rows=None):
+    """
+    Creates (base) translations from a JSON file from Peter.
+
+    All works should be protected during the process.
+    """
+    importer = ThirdPartyImport(
+        'hu',
+        HUNGARIAN_TRANSLATION_QUALITY,
+        # Skip low quality
+        skip=('egervari-dezso',),
+    )
+    return importer.run(path, start=start, rows=rows, task=self)
@@ -13,9 +13,15 @@ from django.test import (  # noqa: F401
 from django.urls import reverse
 from panta.factories import OriginalSegmentFactory, TagFactory
 from panta.models import Tag
+from path.factories import UserFactory
 
 from .apis import EGWWritingsClient
 from .conversion import Import
+from .models import (
+    OriginalSegmentSentenceRelation,
+    OriginalSentence,
+    WorkSimilarity,
+)
 
 
 @patch('white_estate.apis.BackendApplicationClient')
@@ -137,3 +143,61 @@ class WhiteEstateSocialAccountAPITests(PostOnlyAPITests):
     # def test_email_exists(self):
     # def test_connected_accounts(self):
     # def test_disconnect_account(self):
+
+
+class WorkSimilarityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sentences = OriginalSentence.objects.bulk_create(
+            OriginalSentence(content=c) for c in ('1.', '2.', '3.', '4.')
+        )
+        segment_a = OriginalSegmentFactory()
+        segment_b1 = OriginalSegmentFactory()
+        segment_b2 = OriginalSegmentFactory(
+            work=segment_b1.work, position=segment_b1.position + 1
+        )
+        cls.work_a = segment_a.work
+        cls.work_b = segment_b1.work
+        relations = (
+            (segment_a, sentences[:3]),
+            (segment_b1, sentences[1:3]),
+            (segment_b2, sentences[2:]),
+        )
+        OriginalSegmentSentenceRelation.objects.bulk_create(
+            OriginalSegmentSentenceRelation(
+                segment=segment, sentence=sentence, number=number
+            )
+            for segment, related_sentences in relations
+            for number, sentence in enumerate(related_sentences, start=1)
+        )
+        cls.user = UserFactory()
+
+    def test_update(self):
+        self.assertEqual(WorkSimilarity.update(), 4)
+        a, b = self.work_a.pk, self.work_b.pk
+        self.assertEqual(
+            set(
+                WorkSimilarity.objects.values_list('work', 'other', 'sentences')
+            ),
+            {(a, b, 2), (b, a, 2), (a, a, 1), (b, b, 1)},
+        )
+        # Recomputing replaces the matrix
+        self.assertEqual(WorkSimilarity.update(), 4)
+        self.assertEqual(WorkSimilarity.objects.count(), 4)
+
+    def test_views(self):
+        WorkSimilarity.update()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('sentences'))
+        self.assertEqual(response.status_code, 200)
+        works = dict(response.context['works'])
+        self.assertEqual(
+            works[self.work_a], {self.work_a.title: 1, self.work_b.title: 2}
+        )
+        work = next(w for w in works if w == self.work_a)
+        self.assertEqual(work.sentences, 1)
+
+        response = self.client.get(reverse('work_similarities'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 4)
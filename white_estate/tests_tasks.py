@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, tag  # noqa: F401
+from panta.constants import CHANGE_REASONS, TRANSLATION_DONE
+from panta.factories import (
+    OriginalSegmentFactory,
+    OriginalWorkFactory,
+    TranslatedWorkFactory,
+)
+from panta.models import BaseTranslationSegment, TranslatedSegment
+
+from .tasks import ThirdPartyImport, add_tm_paragraphs
+
+
+class AddTMParagraphsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        original = OriginalWorkFactory()
+        for position, key in enumerate(('k.1', 'k.2', 'k.3', 'k.4'), 1):
+            OriginalSegmentFactory(work=original, position=position, key=key)
+        cls.work = TranslatedWorkFactory(original=original, language='de')
+        cls.work.segments.filter(position=1).update(content='Eins.')
+
+    def setUp(self):
+        f, self.path = tempfile.mkstemp(suffix='.jsons')
+        with os.fdopen(f, 'w') as f:
+            lines = (
+                [['k.1', 'k.2', 0, 0, 100], ['k.1', 'k.3', 0, 0, 90]],
+                [['k.1', 'k.4', 0, 0, 100], ['k.1', 'k.2', 0, 0, 100]],
+            )
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_add_tm_paragraphs(self):
+        result = add_tm_paragraphs('de', path=self.path)
+        self.assertEqual(
+            result,
+            {
+                'similarities': 3,
+                'base_translations': 2,
+                'historical_records': 2,
+            },
+        )
+        base_translations = BaseTranslationSegment.objects.filter(
+            translation__language='de'
+        )
+        self.assertEqual(
+            sorted(base_translations.values_list('original__key', 'content')),
+            [('k.2', 'Eins.'), ('k.4', 'Eins.')],
+        )
+        history = TranslatedSegment.history.filter(work=self.work)
+        self.assertEqual(
+            sorted(
+                history.values_list('history_relation__position', flat=True)
+            ),
+            [2, 4],
+        )
+        self.assertEqual(
+            set(history.values_list('history_change_reason', flat=True)),
+            {CHANGE_REASONS['tm']},
+        )
+
+    def test_run_twice(self):
+        add_tm_paragraphs('de', path=self.path)
+        result = add_tm_paragraphs('de', path=self.path)
+        self.assertEqual(result['base_translations'], 0)
+        self.assertEqual(result['historical_records'], 0)
+
+
+class ThirdPartyImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        original = OriginalWorkFactory()
+        for position, key in enumerate(('k.1', 'k.2', 'k.3'), 1):
+            OriginalSegmentFactory(
+                work=original, position=position, key=key, content='One.'
+            )
+        cls.work = TranslatedWorkFactory(original=original, language='hu')
+
+    def setUp(self):
+        f, self.path = tempfile.mkstemp(suffix='.json')
+        rows = (
+            ('k.1', 'good', 'Egy\tkettő.'),
+            ('k.2', 'fair', 'Kettő.'),
+            ('k.3', 'bad', 'Három.'),
+        )
+        with os.fdopen(f, 'w') as f:
+            json.dump(
+                [
+                    {'para_id': k, 'publisher': p, 'translation': t}
+                    for k, p, t in rows
+                ],
+                f,
+            )
+        self.importer = ThirdPartyImport(
+            'hu', {'good': 1, 'fair': 2}, skip=('bad',)
+        )
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_run(self):
+        result = self.importer.run(self.path)
+        self.assertEqual(
+            result,
+            {
+                'segments': 1,
+                'base_translations': 1,
+                'historical_records': 2,
+                'next_row': 3,
+            },
+        )
+        segments = self.work.segments.order_by('position')
+        self.assertEqual(
+            list(segments.values_list('content', 'progress')),
+            [('Egy\tkettő.', TRANSLATION_DONE), ('', 0), ('', 0)],
+        )
+        self.assertEqual(
+            list(
+                BaseTranslationSegment.objects.values_list(
+                    'original__key', 'content'
+                )
+            ),
+            [('k.2', 'Kettő.')],
+        )
+        history = TranslatedSegment.history.filter(work=self.work)
+        self.assertEqual(
+            set(history.values_list('history_change_reason', flat=True)),
+            {CHANGE_REASONS['import']},
+        )
+
+        # Nothing left to do
+        result = self.importer.run(self.path)
+        self.assertEqual(result['segments'], 0)
+        self.assertEqual(result['base_translations'], 0)
+
+    @patch('white_estate.tasks.BATCH_SIZE', 1)
+    def test_run_batches(self):
+        # Several batches within one transaction
+        result = self.importer.run(self.path)
+        self.assertEqual(result['segments'], 1)
+        self.assertEqual(result['base_translations'], 1)
+        self.assertEqual(result['historical_records'], 2)
+
+    def test_resume(self):
+        result = self.importer.run(self.path, start=1, rows=1)
+        self.assertEqual(result['segments'], 0)
+        self.assertEqual(result['base_translations'], 1)
+        self.assertEqual(result['next_row'], 2)
+        self.assertFalse(self.work.segments.exclude(content='').exists())
@@ -1,13 +1,26 @@
 from io import StringIO
 from unittest.mock import MagicMock, patch
 
+from django.core.cache import cache
 from django.test import SimpleTestCase, TestCase, tag  # noqa: F401
-from panta.factories import OriginalSegmentFactory, OriginalWorkFactory
+from django.urls import reverse
+from panta.constants import BLANK, REVIEW_DONE
+from panta.factories import (
+    OriginalSegmentFactory,
+    OriginalWorkFactory,
+    TranslatedWorkFactory,
+)
 from panta.models import OriginalWork, TranslatedWork
+from path.factories import UserFactory
 
 from . import models
 from .constants import EMPTY_WORKS, EXISTING_WORKS, WORKS_WITH_YOUNGER_EDITION
-from .utils import OpenTranslations, TextToSentences
+from .utils import (
+    Concordance,
+    OpenTranslations,
+    TextToSentences,
+    TranslationMemory,
+)
 
 
 @patch('white_estate.utils.EGWWritingsClient')
@@ -926,6 +939,29 @@ class DatabaseSplitToSentencesTests(TestCase):
         self.assertEqual(
             models.OriginalSegmentSentenceRelation.objects.count(), 3
         )
+        self.assertEqual(
+            list(
+                models.OriginalSentence.objects.values_list('count', flat=True)
+            ),
+            [1, 1, 1],
+        )
+
+    def test_process_works_with_shared_sentences(self, stdout):
+        OriginalSegmentFactory(
+            work=self.segment.work, position=2, content='Two! Four.'
+        )
+        self.divider.process_works([self.segment.work], processes=2)
+        # Running it again doesn't change anything
+        self.divider.process_works([self.segment.work], batch_size=1)
+        self.assertEqual(
+            dict(
+                models.OriginalSentence.objects.values_list('content', 'count')
+            ),
+            {'One.': 1, 'Two!': 2, 'Three?': 1, 'Four.': 1},
+        )
+        self.assertEqual(
+            models.OriginalSegmentSentenceRelation.objects.count(), 5
+        )
 
     def test_find_changes(self, stdout):
         sentences = models.OriginalSentence.objects.bulk_create(
@@ -968,3 +1004,164 @@ class DatabaseSplitToSentencesTests(TestCase):
         result = stdout.getvalue()
         self.assertIn('estate.OriginalSegmentSentenceRelation\': 0', result)
         self.assertIn('white_estate.OriginalSentence\': 1', result)
+
+
+class TranslationMemoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        original = OriginalWorkFactory()
+        contents = ('One. <em>Two.</em>', 'One. Two.', 'One, two!', 'Else.')
+        for position, content in enumerate(contents, 1):
+            OriginalSegmentFactory(
+                work=original, position=position, content=content
+            )
+        cls.work = TranslatedWorkFactory(original=original, language='de')
+        cls.work.segments.filter(position=1).update(
+            content='Eins. Zwei.', progress=REVIEW_DONE
+        )
+        cls.originals = list(original.segments.order_by('position'))
+
+    def setUp(self):
+        self.tm = TranslationMemory('de')
+
+    def test_update(self):
+        self.assertEqual(
+            self.tm.update(), {'created': 1, 'updated': 0, 'deleted': 0}
+        )
+        entry = models.TranslationMemoryEntry.objects.get()
+        self.assertEqual(entry.source, 'One. Two.')
+        self.assertEqual(entry.content, 'Eins. Zwei.')
+        self.assertEqual(
+            self.tm.update(), {'created': 0, 'updated': 0, 'deleted': 0}
+        )
+
+        segments = self.work.segments.filter(position=1)
+        segments.update(content='Eins, zwei.')
+        self.assertEqual(
+            self.tm.update(), {'created': 0, 'updated': 1, 'deleted': 0}
+        )
+        entry.refresh_from_db()
+        self.assertEqual(entry.content, 'Eins, zwei.')
+
+        segments.update(progress=BLANK)
+        self.assertEqual(
+            self.tm.update(), {'created': 0, 'updated': 0, 'deleted': 1}
+        )
+
+    def test_lookup(self):
+        self.tm.update()
+        self.assertEqual(self.tm.lookup(self.originals[0]), [])
+        exact, = self.tm.lookup(self.originals[1])
+        self.assertEqual(exact.content, 'Eins. Zwei.')
+        self.assertEqual(exact.similarity, 1)
+        similar, = self.tm.lookup(self.originals[2])
+        self.assertEqual(similar.content, 'Eins. Zwei.')
+        self.assertGreater(similar.similarity, self.tm.similarity)
+        self.assertEqual(self.tm.lookup(self.originals[3]), [])
+
+
+class ConcordanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        original = OriginalWorkFactory()
+        segments = (
+            ('Faith works by love.', 'Der Glauben wirkt durch die Liebe.'),
+            ('Love never fails.', 'Die Liebe hört niemals auf.'),
+            ('God is <em>love</em>.', 'Gott ist Liebe.'),
+            ('The just shall live by faith.', 'Der Gerechte wird aus Glauben.'),
+            ('Walk by faith.', 'Wandelt im Glauben.'),
+            ('The hope is good.', 'Die Hoffnung ist gut.'),
+            ('Love is kind.', 'Die Liebe ist gütig.'),
+        )
+        for position, (content, _x) in enumerate(segments, 1):
+            OriginalSegmentFactory(
+                work=original, position=position, content=content
+            )
+        cls.work = TranslatedWorkFactory(original=original, language='de')
+        for position, (_x, content) in enumerate(segments[:-1], 1):
+            cls.work.segments.filter(position=position).update(
+                content=content, progress=REVIEW_DONE
+            )
+        cls.new_translation = segments[-1][1]
+        TranslationMemory('de').update()
+        cls.references = dict(
+            original.segments.values_list('position', 'reference')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.concordance = Concordance('de')
+
+    def test_ngrams(self):
+        words = self.concordance.get_words('The <em>just</em> shall live.')
+        self.assertEqual(words, ['the', 'just', 'shall', 'live'])
+        self.assertEqual(
+            self.concordance.get_ngrams(words, self.concordance.stopwords),
+            {'just', 'live', 'just shall live'},
+        )
+
+    def test_build(self):
+        self.assertEqual(
+            self.concordance.build(), {'terms': 2, 'translations': 2}
+        )
+        love, = self.concordance.lookup('Love')
+        self.assertEqual(
+            love,
+            {
+                'translation': 'liebe',
+                'count': 3,
+                'segments': 3,
+                'score': 0.5,
+                'references': love['references'],
+            },
+        )
+        self.assertEqual(
+            set(love['references']), {self.references[p] for p in (1, 2, 3)}
+        )
+        faith, = self.concordance.lookup('faith')
+        self.assertEqual(faith['translation'], 'glauben')
+        self.assertEqual(self.concordance.lookup('hope'), [])
+
+        # The index is kept in memory
+        with self.assertNumQueries(0):
+            self.concordance.lookup('love')
+
+    def test_update(self):
+        self.assertEqual(
+            self.concordance.update(), {'terms': 2, 'translations': 2}
+        )
+        self.assertEqual(
+            self.concordance.update(), {'terms': 0, 'translations': 0}
+        )
+        self.work.segments.filter(position=7).update(
+            content=self.new_translation, progress=REVIEW_DONE
+        )
+        TranslationMemory('de').update()
+        self.assertEqual(
+            self.concordance.update(), {'terms': 1, 'translations': 2}
+        )
+        love, die_love = self.concordance.lookup('love')
+        self.assertEqual(love['count'], 4)
+        self.assertEqual(love['score'], 0.429)
+        self.assertEqual(len(love['references']), self.concordance.examples)
+        self.assertEqual(
+            (die_love['translation'], die_love['count']), ('die liebe', 3)
+        )
+        self.assertEqual(models.TermTranslation.objects.count(), 3)
+
+        # Updates score like builds
+        self.concordance.build()
+        self.assertEqual(self.concordance.lookup('love'), [love, die_love])
+
+    def test_view(self):
+        self.concordance.build()
+        url = reverse('concordance', args=('de',))
+        self.client.force_login(UserFactory())
+        response = self.client.get(url, {'term': 'love'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['translation'], 'liebe')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        url = reverse('concordance', args=('xx',))
+        response = self.client.get(url, {'term': 'love'})
+        self.assertEqual(response.status_code, 404)
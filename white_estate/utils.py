@@ -1,13 +1,35 @@
+import hashlib
+import multiprocessing
 import re
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
 
 import regex
 
-from django.db import transaction
-from panta.models import OriginalWork, TranslatedWork
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Prefetch, Subquery
+from django.utils import timezone
+from django.utils.html import strip_tags
+from panta.caching import new_version
+from panta.constants import REVIEW_DONE
+from panta.models import OriginalWork, TranslatedSegment, TranslatedWork
 
 from .apis import EGWWritingsClient
-from .constants import EMPTY_WORKS, EXISTING_WORKS, WORKS_WITH_YOUNGER_EDITION
-from .models import OriginalSegmentSentenceRelation, OriginalSentence
+from .constants import (
+    EMPTY_WORKS,
+    ENGLISH_STOPWORDS,
+    EXISTING_WORKS,
+    WORKS_WITH_YOUNGER_EDITION,
+)
+from .models import (
+    OriginalSegmentSentenceRelation,
+    OriginalSentence,
+    TermTranslation,
+    TranslationMemoryEntry,
+)
 
 TYPES = [t[0] for t in OriginalWork.types]
 
@@ -472,30 +494,114 @@ class TextToSentences:
             sentence = match.group('text') + match.group('punctuation')
         return sentence
 
-    @transaction.atomic
-    def process_works(self, works, verbosity=1, save=True):
+    def split_segment(self, segment):
+        """
+        Splits a pair of primary key and content (run by a process pool).
+        """
+        pk, content = segment
+        self.print_sentence = None
+        return pk, self.split(content)
+
+    @staticmethod
+    def get_sentence_key(content):
+        return hashlib.md5(content.encode()).digest()
+
+    def process_works(
+        self, works, verbosity=1, save=True, processes=None, batch_size=2000
+    ):
         """
         Takes the segments of given works and saves new sentences and relations.
+
+        The segments are split by a pool of processes (one per CPU by default).
+        Sentences and relations are inserted in batches, existing ones are
+        kept. Finally, the count of all involved sentences is updated.
         """
-        for work in works:
-            print('Processing "{}"'.format(work))
-            for seg in work.segments.all():
-                self.print_sentence = None
-                if verbosity >= 2:
-                    print('Processing', seg)
-                for i, sentence in enumerate(self.split(seg.content), start=1):
-                    if verbosity >= 3 and '<' in sentence:
-                        print(sentence, '\n')
-                    if not save:
-                        continue
-                    sentence, created = OriginalSentence.objects.get_or_create(
-                        content=sentence
+        # Sentence IDs by the hash of their content
+        sentence_ids = {}
+        with multiprocessing.Pool(processes) as pool:
+            for work in works:
+                print('Processing "{}"'.format(work))
+                segments = work.segments.order_by('position').values_list(
+                    'pk', 'content'
+                )
+                relations = []
+                for pk, sentences in pool.imap(
+                    self.split_segment, segments.iterator(), chunksize=100
+                ):
+                    if verbosity >= 2:
+                        print('Processing segment', pk)
+                    for i, sentence in enumerate(sentences, start=1):
+                        if verbosity >= 3 and '<' in sentence:
+                            print(sentence, '\n')
+                        relations.append((pk, sentence, i))
+                if save:
+                    self.save_relations(relations, sentence_ids, batch_size)
+        if save and sentence_ids:
+            self.update_sentence_counts(sentence_ids.values())
+
+    @transaction.atomic
+    def save_relations(self, relations, sentence_ids, batch_size):
+        """
+        Saves (segment ID, sentence, number) triples and missing sentences.
+        """
+        sentence_table = OriginalSentence._meta.db_table
+        relation_table = OriginalSegmentSentenceRelation._meta.db_table
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            for i in range(0, len(relations), batch_size):
+                batch = relations[i : i + batch_size]
+                keys = [self.get_sentence_key(r[1]) for r in batch]
+                new_sentences = {
+                    key: r[1]
+                    for key, r in zip(keys, batch)
+                    if key not in sentence_ids
+                }
+                if new_sentences:
+                    contents = list(new_sentences.values())
+                    cursor.execute(
+                        f'INSERT INTO {sentence_table} '
+                        '(content, count, created) '
+                        'SELECT content, 0, %s FROM unnest(%s::text[]) content '
+                        'ON CONFLICT (content) DO NOTHING',
+                        [now, contents],
                     )
-                    OriginalSegmentSentenceRelation.objects.get_or_create(
-                        segment=seg, sentence=sentence, number=i
+                    cursor.execute(
+                        f'SELECT id, content FROM {sentence_table} '
+                        'WHERE content = ANY(%s)',
+                        [contents],
                     )
-                    sentence.count = sentence.segments.count()
-                    sentence.save()
+                    for pk, content in cursor.fetchall():
+                        sentence_ids[self.get_sentence_key(content)] = pk
+                cursor.execute(
+                    f'INSERT INTO {relation_table} '
+                    '(segment_id, sentence_id, number, created) '
+                    'SELECT segment_id, sentence_id, number, %s '
+                    'FROM unnest(%s::integer[], %s::integer[], %s::integer[]) '
+                    'AS r (segment_id, sentence_id, number) '
+                    'ON CONFLICT (segment_id, number) DO NOTHING',
+                    [
+                        now,
+                        [r[0] for r in batch],
+                        [sentence_ids[key] for key in keys],
+                        [r[2] for r in batch],
+                    ],
+                )
+
+    def update_sentence_counts(self, sentence_ids):
+        """
+        Sets the count of the given sentences with one grouped update.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {sentences} SET count = r.count '
+                'FROM (SELECT sentence_id, COUNT(*) AS count FROM {relations} '
+                'WHERE sentence_id = ANY(%s) GROUP BY sentence_id) r '
+                'WHERE id = r.sentence_id'.format(
+                    sentences=OriginalSentence._meta.db_table,
+                    relations=OriginalSegmentSentenceRelation._meta.db_table,
+                ),
+                [list(sentence_ids)],
+            )
 
     def find_changes(self, works):
         """
@@ -536,3 +642,405 @@ class TextToSentences:
 
     def delete_unrelated_sentences(self):
         print(OriginalSentence.objects.filter(segments=None).delete())
+
+
+class TranslationMemory:
+    """
+    Translation memory of the approved translations of a language.
+
+    The source of an entry is the plain text of the original sentences of the
+    segment. Identical sources are found by their hash, similar ones with the
+    trigram index of PostgreSQL.
+    """
+
+    min_progress = REVIEW_DONE
+    # Lower bound of the trigram similarity of fuzzy matches (0 - 1)
+    similarity = 0.5
+    batch_size = 1000
+
+    whitespace = re.compile(r'\s+')
+
+    def __init__(self, language):
+        self.language = language
+
+    @classmethod
+    def get_source(cls, sentences, content=''):
+        """
+        Returns the plain text of the sentences or, if empty, the content.
+        """
+        text = ' '.join(sentences) or content
+        return cls.whitespace.sub(' ', strip_tags(text)).strip()
+
+    @staticmethod
+    def get_hash(source):
+        return hashlib.md5(source.encode()).hexdigest()
+
+    def get_entries(self):
+        return TranslationMemoryEntry.objects.filter(language=self.language)
+
+    def get_approved_segments(self):
+        return TranslatedSegment.objects.filter(
+            work__language=self.language, progress__gte=self.min_progress
+        ).exclude(content='')
+
+    def create_entry(self, segment):
+        sentences = [
+            r.sentence.content
+            for r in segment.original.originalsegmentsentencerelation_set.all()
+        ]
+        source = self.get_source(sentences, segment.original.content)
+        return TranslationMemoryEntry(
+            segment=segment,
+            original_id=segment.original_id,
+            language=self.language,
+            source=source,
+            source_hash=self.get_hash(source),
+            content=segment.content,
+        )
+
+    @transaction.atomic
+    def update(self, full=False):
+        """
+        Brings the entries up to date with the approved translations.
+
+        Only new, changed and no longer approved translations are processed
+        unless full is True. Use it after the sentences changed.
+        """
+        entries = self.get_entries()
+        approved = self.get_approved_segments()
+        if full:
+            deleted, _x = entries.delete()
+        else:
+            deleted, _x = entries.exclude(segment__in=approved).delete()
+        updated = entries.exclude(content=F('segment__content')).update(
+            content=Subquery(
+                TranslatedSegment.objects.filter(
+                    pk=OuterRef('segment_id')
+                ).values('content')[:1]
+            ),
+            # auto_now doesn't apply to update() (see Concordance.update)
+            updated=timezone.now(),
+        )
+
+        pks = tuple(
+            approved.filter(tm_entry=None)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        relations = OriginalSegmentSentenceRelation.objects.select_related(
+            'sentence'
+        ).order_by('number')
+        for i in range(0, len(pks), self.batch_size):
+            segments = (
+                TranslatedSegment.objects.filter(
+                    pk__in=pks[i : i + self.batch_size]
+                )
+                .select_related('original')
+                .prefetch_related(
+                    Prefetch(
+                        'original__originalsegmentsentencerelation_set',
+                        queryset=relations,
+                    )
+                )
+                .only('pk', 'content', 'original')
+            )
+            TranslationMemoryEntry.objects.bulk_create(
+                [self.create_entry(s) for s in segments]
+            )
+
+        return {'created': len(pks), 'updated': updated, 'deleted': deleted}
+
+    def lookup(self, original, limit=3):
+        """
+        Returns up to limit entries with the same or a similar source.
+
+        The best matches come first, each entry has a similarity attribute
+        (1 for identical sources). Entries of the original itself are skipped.
+        """
+        sentences = original.originalsegmentsentencerelation_set.order_by(
+            'number'
+        ).values_list('sentence__content', flat=True)
+        source = self.get_source(sentences, original.content)
+        if not source:
+            return []
+        source_hash = self.get_hash(source)
+        entries = (
+            self.get_entries()
+            .exclude(original=original)
+            .select_related('original')
+            .only('source', 'content', 'original__reference')
+        )
+
+        matches = list(entries.filter(source_hash=source_hash)[:limit])
+        for entry in matches:
+            entry.similarity = 1.0
+        if len(matches) < limit:
+            # The % operator (trigram_similar) uses the index but its
+            # threshold is a setting, local to the transaction to not leak
+            # into other queries of the connection
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.similarity_threshold', %s, "
+                    'true)',
+                    [str(self.similarity)],
+                )
+                matches.extend(
+                    entries.filter(source__trigram_similar=source)
+                    .exclude(source_hash=source_hash)
+                    .annotate(similarity=TrigramSimilarity('source', source))
+                    .order_by('-similarity')[: limit - len(matches)]
+                )
+        return matches
+
+
+class Concordance:
+    """
+    Observed translations of the recurring terms of the originals.
+
+    The terms are the n-grams of the sources of the translation memory (the
+    original sentences of approved segments) which occur in several entries.
+    Their translations are the n-grams of the translations of these entries
+    scored by their share of the entries minus their share of all entries of
+    the language. A longer translation replaces the shorter ones it contains
+    if it occurs about as often.
+
+    The results are stored as TermTranslation rows and loaded into the memory
+    of the process for lookups. A version in the cache tells the processes to
+    reload the index of a language after an update.
+    """
+
+    # Entries a term and a translation have to occur in
+    min_count = 3
+    # Words of terms and translations
+    max_words = 3
+    # Aligned entries per term (the most recently approved ones)
+    max_segments = 500
+    # Translations per term
+    limit = 5
+    min_score = 0.3
+    # Minimum share of the count of a translation a longer one needs to
+    # replace it
+    overlap = 0.8
+    # References per translation
+    examples = 3
+    batch_size = 1000
+
+    word = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+    stopwords = ENGLISH_STOPWORDS
+
+    # Versions and indexes by language
+    indexes = {}
+
+    def __init__(self, language):
+        self.language = language
+        self.version_key = f'concordance_version_{language}'
+
+    def get_words(self, text) -> list:
+        return self.word.findall(strip_tags(text).lower())
+
+    def get_ngrams(self, words, stopwords=frozenset()) -> set:
+        """
+        Returns the n-grams not starting or ending with a stopword.
+        """
+        ngrams = set()
+        for n in range(1, self.max_words + 1):
+            for i in range(len(words) - n + 1):
+                if words[i] in stopwords or words[i + n - 1] in stopwords:
+                    continue
+                ngrams.add(' '.join(words[i : i + n]))
+        return ngrams
+
+    def get_entries(self):
+        return TranslationMemoryEntry.objects.filter(
+            language=self.language
+        ).order_by('-updated', '-pk')
+
+    def read(self, rows, terms=None):
+        """
+        Returns the n-grams of the rows (source, translation and reference).
+
+        That are the row numbers per term (of the terms if given), the IDs of
+        the translation n-grams per row, the references and the translation
+        n-grams by ID.
+        """
+        postings = defaultdict(list)
+        vocabulary = {}
+        targets = []
+        references = []
+        for number, (source, content, reference) in enumerate(rows):
+            ngrams = self.get_ngrams(self.get_words(source), self.stopwords)
+            for term in ngrams if terms is None else ngrams & terms:
+                postings[term].append(number)
+            ids = (
+                vocabulary.setdefault(ngram, len(vocabulary))
+                for ngram in self.get_ngrams(self.get_words(content))
+            )
+            targets.append(array('I', sorted(ids)))
+            references.append(reference)
+        return postings, targets, references, list(vocabulary)
+
+    @staticmethod
+    def count(targets, size) -> array:
+        """
+        Returns the number of rows per translation n-gram.
+        """
+        counts = array('I', [0]) * size
+        for ids in targets:
+            for i in ids:
+                counts[i] += 1
+        return counts
+
+    def align(self, term, rows, index, frequencies, total) -> list:
+        """
+        Returns the best translations of the term occurring in the rows.
+        """
+        targets, references, translations = index
+        rows = rows[: self.max_segments]
+        counts = Counter()
+        for number in rows:
+            counts.update(targets[number])
+        candidates = []
+        for ngram, count in counts.items():
+            if count < self.min_count:
+                continue
+            score = count / len(rows) - frequencies[ngram] / total
+            if score >= self.min_score:
+                candidates.append((translations[ngram], ngram, count, score))
+
+        # Longer translations first
+        candidates.sort(key=lambda c: (-c[0].count(' '), -c[3]))
+        kept = []
+        for candidate in candidates:
+            text = f' {candidate[0]} '
+            if not any(
+                text in f' {k[0]} ' and k[2] >= self.overlap * candidate[2]
+                for k in kept
+            ):
+                kept.append(candidate)
+        kept.sort(key=lambda c: -c[3])
+
+        results = []
+        for translation, ngram, count, score in kept[: self.limit]:
+            examples = (
+                references[number]
+                for number in rows
+                if ngram in targets[number]
+            )
+            results.append(
+                TermTranslation(
+                    language=self.language,
+                    term=term,
+                    translation=translation,
+                    count=count,
+                    segments=len(rows),
+                    score=round(score, 3),
+                    references=list(islice(examples, self.examples)),
+                )
+            )
+        return results
+
+    def align_all(self, terms=None) -> list:
+        """
+        Aligns the terms (all if not given) reading the entries once.
+
+        The frequencies of the translations are counted over all entries of
+        the language. Thus, updates score terms like builds.
+        """
+        rows = self.get_entries().values_list(
+            'source', 'content', 'original__reference'
+        )
+        postings, *index = self.read(rows.iterator(), terms)
+        frequencies = self.count(index[0], len(index[2]))
+        translations = []
+        for term, numbers in postings.items():
+            if len(numbers) >= self.min_count:
+                translations.extend(
+                    self.align(term, numbers, index, frequencies, len(index[0]))
+                )
+        return translations
+
+    def build(self) -> dict:
+        """
+        Aligns all terms and replaces the index of the language.
+        """
+        translations = self.align_all()
+        with transaction.atomic():
+            TermTranslation.objects.filter(language=self.language).delete()
+            TermTranslation.objects.bulk_create(translations, self.batch_size)
+        self.set_version()
+        terms = len({t.term for t in translations})
+        return {'terms': terms, 'translations': len(translations)}
+
+    def update(self, full=False) -> dict:
+        """
+        Realigns the terms of the entries changed since the last update.
+
+        The index is built if it doesn't exist or if full is True. Deleted
+        entries are only taken into account by full builds.
+        """
+        last = TermTranslation.objects.filter(language=self.language).aggregate(
+            last=Max('updated')
+        )['last']
+        if full or last is None:
+            return self.build()
+
+        terms = set()
+        sources = (
+            self.get_entries()
+            .filter(updated__gt=last)
+            .values_list('source', flat=True)
+        )
+        for source in sources.iterator():
+            terms |= self.get_ngrams(self.get_words(source), self.stopwords)
+        if not terms:
+            return {'terms': 0, 'translations': 0}
+
+        translations = self.align_all(terms)
+        with transaction.atomic():
+            TermTranslation.objects.filter(
+                language=self.language, term__in=terms
+            ).delete()
+            TermTranslation.objects.bulk_create(translations, self.batch_size)
+        self.set_version()
+        terms = len({t.term for t in translations})
+        return {'terms': terms, 'translations': len(translations)}
+
+    def set_version(self):
+        cache.set(self.version_key, new_version(), None)
+
+    def get_index(self) -> dict:
+        """
+        Returns the translations by term from the memory of the process.
+        """
+        version = cache.get(self.version_key)
+        if version is None:
+            version = new_version()
+            cache.set(self.version_key, version, None)
+        cached_version, index = self.indexes.get(self.language, (None, None))
+        if cached_version == version:
+            return index
+
+        index = defaultdict(list)
+        rows = (
+            TermTranslation.objects.filter(language=self.language)
+            .order_by('term', '-score', 'translation')
+            .values(
+                'term',
+                'translation',
+                'count',
+                'segments',
+                'score',
+                'references',
+            )
+        )
+        for row in rows.iterator():
+            index[row.pop('term')].append(row)
+        index = dict(index)
+        self.indexes[self.language] = (version, index)
+        return index
+
+    def lookup(self, term) -> list:
+        """
+        Returns the translations of the term (the best first).
+        """
+        return self.get_index().get(' '.join(self.get_words(term)), [])
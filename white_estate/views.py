@@ -8,18 +8,22 @@ from allauth.socialaccount.providers.oauth2.views import (
     OAuth2LoginView,
 )
 from allauth.utils import build_absolute_uri
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_auth.registration.serializers import SocialLoginSerializer
 from rest_auth.registration.views import SocialConnectView, SocialLoginView
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from base.constants import LANGUAGES_DICT
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
+from django.db.models import Prefetch
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from django.views.generic import TemplateView
@@ -29,6 +33,7 @@ from path.api.views import UserResponseMixin
 
 from . import constants, models
 from .provider import WhiteEstateProvider
+from .utils import Concordance
 
 
 class WhiteEstateAdapter(OAuth2Adapter):
@@ -156,37 +161,88 @@ class AuthServerURL(APIView):
 class EqualSentencesView(LoginRequiredMixin, TemplateView):
     """
     Statistics about how many works have equal sentences in other works.
+
+    Reads the matrix computed by the update_work_similarities task.
     """
 
     template_name = 'white_estate/equal_sentences.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        works = []
-        for work in OriginalWork.objects.all():
-            sentences = models.Sentence.objects.filter(
-                segments__work=work
-            ).prefetch_related('segments__work')
+        works = OriginalWork.objects.filter(
+            pk__in=models.WorkSimilarity.objects.values('work_id')
+        ).prefetch_related(
+            Prefetch(
+                'similarities',
+                queryset=models.WorkSimilarity.objects.select_related(
+                    'other'
+                ).order_by('-sentences'),
+            )
+        )
+        context['works'] = []
+        for work in works:
+            work.sentences = 0
             similar_works = {}
-            sentences_count = 0
-            for sentence in sentences:
-                sentences_count += 1
-                if len(sentence.segments.all()) == 1:
-                    if work.title in similar_works:
-                        similar_works[work.title] += 1
-                    else:
-                        similar_works[work.title] = 1
-                    continue
-                for segment in sentence.segments.all():
-                    if segment.work == work:
-                        continue
-                    if segment.work.title in similar_works:
-                        similar_works[segment.work.title] += 1
-                    else:
-                        similar_works[segment.work.title] = 1
-
-            work.sentences = sentences_count
-            works.append((work, similar_works))
-
-        context['works'] = works
+            for similarity in work.similarities.all():
+                if similarity.other_id == work.pk:
+                    work.sentences = similarity.sentences
+                similar_works[similarity.other.title] = similarity.sentences
+            context['works'].append((work, similar_works))
         return context
+
+
+class WorkSimilaritySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.WorkSimilarity
+        fields = ('work', 'other', 'sentences')
+
+
+class WorkSimilarityView(ListAPIView):
+    """
+    Work similarities
+
+    Lists how many sentences original works have in common. For
+    `other == work`, `sentences` is the number of sentences found in no other
+    work.
+    """
+
+    queryset = models.WorkSimilarity.objects.order_by('work_id', 'other_id')
+    serializer_class = WorkSimilaritySerializer
+
+
+class TermTranslationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.TermTranslation
+        fields = ('translation', 'count', 'segments', 'score', 'references')
+
+
+class ConcordanceView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'term',
+                openapi.IN_QUERY,
+                description='Case-insensitive, up to three words',
+                type=openapi.TYPE_STRING,
+                required=True,
+            )
+        ],
+        responses={200: TermTranslationSerializer(many=True)},
+    )
+    def get(self, request, language, format=None):
+        """
+        Concordance
+
+        Lists the observed translations of a term of the originals in
+        approved segments (the best first). `count` is the number of segments
+        with the term and the translation, `segments` the number of aligned
+        segments with the term and `references` are examples.
+        """
+        # Don't load or cache an index for unknown languages
+        if language not in LANGUAGES_DICT:
+            raise NotFound()
+        term = request.query_params.get('term', '')
+        if not term.strip():
+            raise ValidationError({'term': _('This field is required.')})
+        # The index holds the serialized fields already
+        return Response(Concordance(language).lookup(term))